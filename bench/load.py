@@ -0,0 +1,161 @@
+"""Generador de carga para los endpoints de gpt/app.py y deepseek/app.py.
+
+Lanza `--requests` peticiones por nivel de concurrencia (cada nivel con
+`concurrency` clientes en paralelo) y reporta rendimiento y latencias
+p50/p95/p99. Los nombres de contacto salen de la misma lista sintética que
+sirve bench/stubs.py, así que `--contacts` debe coincidir con el del stub.
+
+Escenarios:
+  mcp     POST /mcp-to-openai (o --mcp-path) con una mezcla de mensajes que
+          llevan al modelo a responder texto, buscar contactos o repositorios
+  send    POST /send-to-contact a un contacto existente
+  search  POST /search-contacts con nombres completos, parciales y con errores
+
+Uso:
+    python bench/load.py --scenario mcp --scenario search --concurrency 1,8,32 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+from common.stats import percentile
+from stubs import synthetic_contacts
+
+TOPICS = ["fastapi", "whatsapp bot", "rust async", "llm agents", "flask auth", "vector db"]
+
+
+def typo(name: str, rng: random.Random) -> str:
+    """El nombre con dos letras intercambiadas, como escribiría alguien con prisa"""
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 2)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def scenarios(contacts: List[Dict], mcp_path: str) -> Dict[str, Callable[[random.Random, int], Tuple[str, Dict]]]:
+    """Por escenario, una función que arma (ruta, cuerpo) para la petición número `i`"""
+    names = [c["name"] for c in contacts]
+
+    def mcp(rng: random.Random, i: int):
+        name = rng.choice(names)
+        text = rng.choice([
+            f"busca a {name}",
+            f"busca a {name.split()[0]}",
+            f"repos de {rng.choice(TOPICS)}",
+            "hola, ¿qué puedes hacer por mí?",
+        ])
+        # Pocas sesiones distintas: el historial crece como en un uso real
+        return mcp_path, {"input": text, "session_id": f"bench-{i % 50}"}
+
+    def send(rng: random.Random, i: int):
+        return "/send-to-contact", {"contact_name": rng.choice(names), "message": f"Mensaje de prueba {i}"}
+
+    def search(rng: random.Random, i: int):
+        name = rng.choice(names)
+        query = rng.choice([name, name.split()[0], name[:4], typo(name, rng)])
+        return "/search-contacts", {"query": query}
+
+    return {"mcp": mcp, "send": send, "search": search}
+
+
+async def run_level(client: httpx.AsyncClient, build: Callable, concurrency: int, requests: int,
+                    seed: int = 1) -> Dict:
+    """`requests` peticiones con `concurrency` clientes a la vez"""
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            path, body = build(rng, i)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                key = str(response.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": ok,
+        "errors": requests - ok,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "max_ms": round(max(latencies, default=0.0), 1),
+    }
+
+
+async def run(url: str, scenario_names: List[str], levels: List[int], requests: int, contacts: int,
+              warmup: int = 10, mcp_path: str = "/mcp-to-openai", timeout: float = 60.0) -> List[Dict]:
+    builders = scenarios(synthetic_contacts(contacts), mcp_path)
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    results = []
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        for name in scenario_names:
+            # Calentamiento: carga del directorio de contactos, conexiones, cachés
+            await run_level(client, builders[name], 1, warmup, seed=0)
+            for concurrency in levels:
+                result = await run_level(client, builders[name], concurrency, requests)
+                result = {"scenario": name, "contacts": contacts, **result}
+                results.append(result)
+                print(format_row(result), flush=True)
+    return results
+
+
+HEADER = f"{'escenario':<8} {'contactos':>9} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errores':>8}"
+
+
+def format_row(result: Dict) -> str:
+    return (f"{result['scenario']:<8} {result['contacts']:>9} {result['concurrency']:>5} "
+            f"{result['throughput_rps']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8} "
+            f"{result['p99_ms']:>8} {result['errors']:>8}")
+
+
+def parse_levels(value: str) -> List[int]:
+    return [int(level) for level in value.split(",") if level.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Carga sobre /mcp-to-openai, /send-to-contact y /search-contacts")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--scenario", action="append", choices=["mcp", "send", "search"],
+                        help="se puede repetir (por defecto los tres)")
+    parser.add_argument("--concurrency", type=parse_levels, default=[1, 8, 32], help="niveles separados por comas")
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por nivel")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--contacts", type=int, default=1000, help="el mismo valor que en bench/stubs.py")
+    parser.add_argument("--mcp-path", default="/mcp-to-openai", help="/mcp-to-deepseek para deepseek/app.py")
+    parser.add_argument("--json", help="guarda los resultados en este archivo")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(HEADER)
+    results = asyncio.run(run(args.url, args.scenario or ["mcp", "send", "search"], args.concurrency,
+                              args.requests, args.contacts, args.warmup, args.mcp_path))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
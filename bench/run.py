@@ -0,0 +1,155 @@
+"""Corre la matriz completa de benchmarks sin servicios reales.
+
+Por cada tamaño de la lista de contactos arranca bench/stubs.py y la app
+(gpt o deepseek) apuntando a los stubs, espera a que /health responda,
+corre bench/load.py con todos los niveles de concurrencia y los apaga.
+La cola de salida se configura sin límite de ritmo para medir a la app
+y no al limitador; el resto de la configuración sale del entorno, así
+que se puede comparar un cambio con y sin una variable (p. ej. LLM_CACHE_MODE).
+
+Uso:
+    python bench/run.py --contacts 100,1000,10000 --concurrency 1,8,32 --requests 200
+    python bench/run.py --app gpt --server asgi --scenario mcp --llm-latency 800
+    python bench/run.py --app deepseek
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+import load
+
+
+def wait_ready(url: str, timeout: float = 30.0, process: subprocess.Popen = None):
+    """Consulta `url` con backoff hasta que responda 200"""
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"El proceso terminó con código {process.returncode} antes de estar listo")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+    raise RuntimeError(f"{url} no respondió en {timeout:g} s")
+
+
+def stop(process: subprocess.Popen):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def app_command(args) -> List[str]:
+    if args.app == "gpt" and args.server == "asgi":
+        return [sys.executable, "-m", "hypercorn", "asgi:app", "--bind", f"127.0.0.1:{args.port}"]
+    code = ("import app; app.start_background_services(); "
+            f"app.app.run(host='127.0.0.1', port={args.port}, threaded=True)")
+    return [sys.executable, "-c", code]
+
+
+def app_env(args) -> Dict[str, str]:
+    llm_url = f"http://127.0.0.1:{args.llm_port}/v1/chat/completions"
+    env = {
+        **os.environ,
+        "PYTHONPATH": ROOT,
+        "WHATSAPP_API_URL": f"http://127.0.0.1:{args.bridge_port}",
+        "GITHUB_API_URL": f"http://127.0.0.1:{args.github_port}",
+        "OPENAI_API_URL": llm_url,
+        "DEEPSEEK_API_URL": llm_url,
+        "OPENAI_API_KEY": "bench",
+        "DEEPSEEK_API_KEY": "bench",
+    }
+    # Sin límite de ritmo en la cola de salida, salvo que el entorno diga otra cosa
+    for name, value in {"OUTBOUND_RATE": "100000", "OUTBOUND_BURST": "100000", "OUTBOUND_RECIPIENT_RATE": "100000",
+                        "OUTBOUND_RECIPIENT_BURST": "100000", "OUTBOUND_QUEUE_SIZE": "100000",
+                        "OUTBOUND_WORKERS": "16"}.items():
+        env.setdefault(name, value)
+    return env
+
+
+def run_matrix(args) -> List[Dict]:
+    scenarios = args.scenario or (["mcp"] if args.app == "deepseek" else ["mcp", "send", "search"])
+    mcp_path = "/mcp-to-deepseek" if args.app == "deepseek" else "/mcp-to-openai"
+    results = []
+    print(load.HEADER, flush=True)
+    for contacts in args.contacts:
+        stubs = subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "stubs.py"),
+             "--contacts", str(contacts),
+             "--llm-port", str(args.llm_port), "--bridge-port", str(args.bridge_port),
+             "--github-port", str(args.github_port),
+             "--llm-latency", str(args.llm_latency), "--llm-jitter", str(args.llm_jitter),
+             "--bridge-latency", str(args.bridge_latency), "--github-latency", str(args.github_latency),
+             "--inbound-rate", str(args.inbound_rate)],
+            stdout=subprocess.DEVNULL
+        )
+        server = None
+        try:
+            wait_ready(f"http://127.0.0.1:{args.bridge_port}/status", process=stubs)
+            server = subprocess.Popen(
+                app_command(args), cwd=os.path.join(ROOT, args.app), env=app_env(args),
+                stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL
+            )
+            wait_ready(f"http://127.0.0.1:{args.port}/health", process=server)
+            results.extend(asyncio.run(load.run(
+                f"http://127.0.0.1:{args.port}", scenarios, args.concurrency, args.requests,
+                contacts, args.warmup, mcp_path
+            )))
+        finally:
+            if server is not None:
+                stop(server)
+            stop(stubs)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de la app contra servicios simulados")
+    parser.add_argument("--app", choices=["gpt", "deepseek"], default="gpt")
+    parser.add_argument("--server", choices=["flask", "asgi"], default="flask", help="asgi solo para gpt")
+    parser.add_argument("--scenario", action="append", choices=["mcp", "send", "search"])
+    parser.add_argument("--contacts", type=load.parse_levels, default=[100, 1000, 10000],
+                        help="tamaños de la lista de contactos, separados por comas")
+    parser.add_argument("--concurrency", type=load.parse_levels, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por nivel")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=300.0, help="ms por respuesta del modelo simulado")
+    parser.add_argument("--llm-jitter", type=float, default=50.0)
+    parser.add_argument("--bridge-latency", type=float, default=5.0)
+    parser.add_argument("--github-latency", type=float, default=150.0)
+    parser.add_argument("--inbound-rate", type=float, default=0.0,
+                        help="mensajes entrantes por segundo (respuestas automáticas de fondo, solo gpt)")
+    parser.add_argument("--port", type=int, default=15000, help="puerto de la app")
+    parser.add_argument("--llm-port", type=int, default=18081)
+    parser.add_argument("--bridge-port", type=int, default=18082)
+    parser.add_argument("--github-port", type=int, default=18083)
+    parser.add_argument("--json", help="guarda los resultados en este archivo")
+    parser.add_argument("--verbose", action="store_true", help="muestra la salida de error de la app")
+    args = parser.parse_args(argv)
+    if args.app == "deepseek" and args.server == "asgi":
+        parser.error("el modo ASGI solo existe para gpt")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run_matrix(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,269 @@
+"""Servidores locales que sustituyen a OpenAI/DeepSeek, al bridge de WhatsApp y a GitHub.
+
+Permiten medir gpt/app.py y deepseek/app.py sin red ni claves:
+  - LLM (OpenAI y DeepSeek hablan el mismo protocolo): /v1/chat/completions
+    con respuestas de texto, llamadas a herramientas (formato `tools` y el
+    antiguo `functions`) y streaming SSE; /v1/models para las sondas.
+    Según el último mensaje del usuario pide una herramienta:
+      "suma a y b" -> sumar, "envía ... a <nombre>" -> send_message,
+      "repos de ..." -> buscar_repos, "busca ..." -> search_contacts;
+      si no, responde texto.
+    Solo pide herramientas que vienen en la petición; tras el resultado de
+    una herramienta responde con texto.
+  - Bridge: /api/contacts (N contactos sintéticos), /api/send, /api/messages,
+    /status y el WebSocket /events (que puede emitir mensajes entrantes).
+  - GitHub: /search/repositories con ETag (304 con If-None-Match) y cabeceras
+    de límite de búsquedas.
+
+Uso:
+    python bench/stubs.py --contacts 5000 --llm-latency 300 --llm-jitter 100
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import re
+import time
+from typing import Dict, List
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, Response, jsonify, request, websocket
+
+FIRST_NAMES = ["Ana", "Juan", "José", "María", "Luis", "Carmen", "Pedro", "Lucía", "Jorge", "Sofía",
+               "Miguel", "Elena", "Carlos", "Laura", "Andrés", "Paula", "Diego", "Marta", "Raúl", "Julia"]
+LAST_NAMES = ["Pérez", "López", "García", "Martínez", "Sánchez", "Ramírez", "Torres", "Flores", "Rivera",
+              "Gómez", "Díaz", "Cruz", "Morales", "Ortiz", "Reyes", "Jiménez", "Ruiz", "Vargas", "Castro", "Romero"]
+
+
+def synthetic_contacts(count: int, seed: int = 7) -> List[Dict]:
+    """`count` contactos con nombres realistas (repetidos, con acentos) y números únicos"""
+    rng = random.Random(seed)
+    contacts = []
+    for i in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        if i >= len(FIRST_NAMES) * len(LAST_NAMES):
+            name += f" {i}"  # a partir de aquí los nombres dejarían de ser distinguibles
+        contacts.append({"name": name, "jid": f"521555{i:07d}@s.whatsapp.net"})
+    return contacts
+
+
+def _delay(latency_ms: float, jitter_ms: float) -> float:
+    return max(latency_ms + random.uniform(-jitter_ms, jitter_ms), 0.0) / 1000
+
+
+# -------------------------
+# LLM (OpenAI / DeepSeek)
+# -------------------------
+def llm_app(latency_ms: float = 0.0, jitter_ms: float = 0.0, token_ms: float = 0.0) -> Quart:
+    app = Quart("llm_stub")
+    stats = {"requests": 0, "tool_calls": 0}
+
+    def pick_tool(text: str):
+        lowered = text.lower()
+        if match := re.search(r"suma (\d+) y (\d+)", lowered):
+            return "sumar", {"a": int(match.group(1)), "b": int(match.group(2))}
+        if match := re.search(r"(?:envía|envia|manda) (.+?) a (.+)", text, re.IGNORECASE):
+            return "send_message", {"recipient": match.group(2).strip(), "message": match.group(1).strip()}
+        if match := re.search(r"repos (?:de )?(.+)", text, re.IGNORECASE):
+            return "buscar_repos", {"query": match.group(1).strip()}
+        if match := re.search(r"busca (?:a )?(.+)", text, re.IGNORECASE):
+            return "search_contacts", {"query": match.group(1).strip()}
+        return None
+
+    def answer(body: Dict) -> Dict:
+        messages = body.get("messages", [])
+        last = messages[-1] if messages else {}
+        offered = {t["function"]["name"] for t in body.get("tools") or []} | {f["name"] for f in body.get("functions") or []}
+        tool = pick_tool(last.get("content") or "") if last.get("role") == "user" else None
+        if tool is not None and (tool[0] not in offered or body.get("tool_choice") == "none"):
+            tool = None  # solo pide herramientas que la app ofrece
+        if tool is None:
+            if last.get("role") in ("tool", "function"):
+                content = f"Listo. Resultado: {(last.get('content') or '')[:200]}"
+            else:
+                content = "Hola, soy un modelo de prueba y respondo siempre lo mismo."
+            return {"role": "assistant", "content": content}
+
+        stats["tool_calls"] += 1
+        name, args = tool
+        if body.get("functions") and not body.get("tools"):
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)}}
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{stats['tool_calls']}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(args, ensure_ascii=False)},
+        }]}
+
+    @app.route("/v1/chat/completions", methods=["POST"])
+    @app.route("/chat/completions", methods=["POST"])
+    async def chat_completions():
+        body = await request.get_json()
+        stats["requests"] += 1
+        await asyncio.sleep(_delay(latency_ms, jitter_ms))
+        message = answer(body)
+        usage = {"prompt_tokens": sum(len(str(m.get("content") or "")) // 4 for m in body.get("messages", []))}
+        if not body.get("stream"):
+            return jsonify({"id": "stub", "model": body.get("model"), "usage": usage,
+                            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+
+        async def events():
+            for word in (message.get("content") or "").split(" "):
+                if token_ms:
+                    await asyncio.sleep(token_ms / 1000)
+                yield "data: " + json.dumps({"choices": [{"delta": {"content": word + " "}}]}) + "\n\n"
+            for index, call in enumerate(message.get("tool_calls") or []):
+                delta = {"index": index, "id": call["id"], "type": "function", "function": call["function"]}
+                yield "data: " + json.dumps({"choices": [{"delta": {"tool_calls": [delta]}}]}) + "\n\n"
+            if message.get("function_call"):
+                yield "data: " + json.dumps({"choices": [{"delta": {"function_call": message["function_call"]}}]}) + "\n\n"
+            yield "data: [DONE]\n\n"
+        return Response(events(), mimetype="text/event-stream")
+
+    @app.route("/v1/models")
+    @app.route("/models")
+    async def models():
+        return jsonify({"data": [{"id": "gpt-3.5-turbo"}, {"id": "deepseek-chat"}]})
+
+    @app.route("/stats")
+    async def llm_stats():
+        return jsonify(stats)
+
+    return app
+
+
+# -------------------------
+# Bridge de WhatsApp
+# -------------------------
+def bridge_app(contacts: List[Dict], latency_ms: float = 0.0, inbound_rate: float = 0.0) -> Quart:
+    app = Quart("bridge_stub")
+    messages: List[Dict] = []
+    ids = itertools.count(1)
+    stats = {"sent": 0, "contacts_served": 0, "events_clients": 0}
+
+    def inbound_message() -> Dict:
+        contact = random.choice(contacts)
+        message = {"type": "message", "id": str(next(ids)), "from": contact["jid"],
+                   "body": "hola, ¿cómo va todo?", "timestamp": time.time()}
+        messages.append(message)
+        del messages[:-1000]
+        return message
+
+    @app.route("/api/contacts")
+    async def api_contacts():
+        stats["contacts_served"] += 1
+        await asyncio.sleep(_delay(latency_ms, 0))
+        return jsonify(contacts)
+
+    @app.route("/api/send", methods=["POST"])
+    async def api_send():
+        await request.get_json()
+        await asyncio.sleep(_delay(latency_ms, 0))
+        stats["sent"] += 1
+        return jsonify({"success": True, "message": "Mensaje enviado"})
+
+    @app.route("/api/messages")
+    async def api_messages():
+        since = float(request.args.get("since", 0))
+        return jsonify([m for m in messages if m["timestamp"] > since])
+
+    @app.route("/status")
+    async def status():
+        return jsonify({"connected": True, "contacts": len(contacts)})
+
+    @app.route("/stats")
+    async def bridge_stats():
+        return jsonify(stats)
+
+    @app.websocket("/events")
+    async def events():
+        stats["events_clients"] += 1
+        try:
+            if inbound_rate <= 0:
+                while True:
+                    await websocket.receive()
+            while True:
+                await asyncio.sleep(random.expovariate(inbound_rate))
+                await websocket.send(json.dumps(inbound_message(), ensure_ascii=False))
+        finally:
+            stats["events_clients"] -= 1
+
+    return app
+
+
+# -------------------------
+# GitHub
+# -------------------------
+def github_app(latency_ms: float = 0.0) -> Quart:
+    app = Quart("github_stub")
+    stats = {"searches": 0, "not_modified": 0}
+
+    @app.route("/search/repositories")
+    async def search_repositories():
+        query = request.args.get("q", "")
+        per_page = int(request.args.get("per_page", 10))
+        etag = '"' + hashlib.sha1(f"{query}|{per_page}".encode()).hexdigest()[:16] + '"'
+        headers = {"ETag": etag, "X-RateLimit-Limit": "30", "X-RateLimit-Remaining": "29",
+                   "X-RateLimit-Reset": str(int(time.time()) + 60)}
+        stats["searches"] += 1
+        await asyncio.sleep(_delay(latency_ms, 0))
+        if request.headers.get("If-None-Match") == etag:
+            stats["not_modified"] += 1
+            return Response("", status=304, headers=headers)
+        items = [{
+            "full_name": f"bench/{query.replace(' ', '-')}-{i}",
+            "description": f"Repositorio sintético {i} para '{query}'",
+            "stargazers_count": 1000 - i * 37,
+            "html_url": f"https://github.com/bench/{query.replace(' ', '-')}-{i}",
+            "language": "Python",
+        } for i in range(per_page)]
+        return jsonify({"total_count": per_page, "items": items}), 200, headers
+
+    @app.route("/stats")
+    async def github_stats():
+        return jsonify(stats)
+
+    return app
+
+
+async def serve_all(args) -> None:
+    contacts = synthetic_contacts(args.contacts)
+    apps = [
+        (llm_app(args.llm_latency, args.llm_jitter, args.token_latency), args.llm_port),
+        (bridge_app(contacts, args.bridge_latency, args.inbound_rate), args.bridge_port),
+        (github_app(args.github_latency), args.github_port),
+    ]
+    servers = []
+    for app, port in apps:
+        config = Config()
+        config.bind = [f"{args.host}:{port}"]
+        config.accesslog = None
+        config.errorlog = None
+        config.backlog = 1024
+        servers.append(serve(app, config))
+    print(f"🧪 Stubs: LLM :{args.llm_port}, bridge :{args.bridge_port} ({len(contacts)} contactos), "
+          f"GitHub :{args.github_port}", flush=True)
+    await asyncio.gather(*servers)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Servidores falsos de LLM, bridge y GitHub para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--llm-port", type=int, default=18081)
+    parser.add_argument("--bridge-port", type=int, default=18082)
+    parser.add_argument("--github-port", type=int, default=18083)
+    parser.add_argument("--contacts", type=int, default=1000, help="contactos sintéticos del bridge")
+    parser.add_argument("--llm-latency", type=float, default=300.0, help="ms por respuesta del modelo")
+    parser.add_argument("--llm-jitter", type=float, default=50.0, help="± ms aleatorios sobre --llm-latency")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="ms entre tokens en streaming")
+    parser.add_argument("--bridge-latency", type=float, default=5.0, help="ms por petición al bridge")
+    parser.add_argument("--github-latency", type=float, default=150.0, help="ms por búsqueda en GitHub")
+    parser.add_argument("--inbound-rate", type=float, default=0.0, help="mensajes entrantes por segundo en /events")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve_all(parse_args()))
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4     # aproximación habitual para texto en español/inglés
+MESSAGE_OVERHEAD = 4    # tokens de rol y separadores por mensaje
+
+
+def estimate_tokens(message: Dict) -> int:
+    """Estimación barata de los tokens que ocupa un mensaje en el prompt"""
+    text = message.get("content") or ""
+    if message.get("function_call") or message.get("tool_calls"):
+        text += json.dumps(message.get("function_call") or message.get("tool_calls"))
+    return MESSAGE_OVERHEAD + (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_schema_tokens(schema) -> int:
+    """Tokens aproximados de la definición de herramientas enviada con cada petición"""
+    return (len(json.dumps(schema)) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if schema else 0
+
+
+def fingerprint(message: Dict) -> str:
+    raw = f"{message.get('role')}\x00{message.get('content')}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def covered_prefix(covered: List[str], keys: List[str]) -> int:
+    """Cuántos de los primeros `keys` ya están resumidos.
+
+    `covered` son las huellas de los turnos resumidos, en orden. Los turnos
+    se identifican por su posición en la secuencia y no solo por su texto:
+    se busca el prefijo más largo de `keys` que aparece seguido en
+    `covered`, así un "ok" repetido cuenta como un turno nuevo cada vez y
+    un corte que retrocede (entrada más corta) no vuelve a resumir lo ya
+    resumido.
+    """
+    best = 0
+    for start in range(len(covered)):
+        length = 0
+        while (length < len(keys) and start + length < len(covered)
+               and covered[start + length] == keys[length]):
+            length += 1
+        best = max(best, length)
+        if best == len(keys):
+            break
+    return best
+
+
+def extractive_summary(previous: str, messages: List[Dict], max_chars: int = 1200) -> str:
+    """Resumen sin LLM: el resumen previo más el inicio de cada turno nuevo"""
+    lines = [previous] if previous else []
+    for message in messages:
+        if message.get("role") in ("user", "assistant") and message.get("content"):
+            text = " ".join(message["content"].split())
+            lines.append(f"{message['role']}: {text[:160]}")
+    # Si no cabe, se conserva lo más reciente
+    return "\n".join(lines)[-max_chars:]
+
+
+SUMMARY_INSTRUCTIONS = (
+    "Actualiza el resumen de una conversación con los mensajes nuevos. "
+    "Conserva nombres, números, acuerdos y peticiones pendientes. "
+    "Responde solo con el resumen, en pocas frases."
+)
+
+
+def summary_request(previous: str, messages: List[Dict]) -> List[Dict]:
+    """Mensajes para pedirle a un LLM que actualice el resumen"""
+    turns = "\n".join(
+        f"{m['role']}: {m['content']}" for m in messages
+        if m.get("role") in ("user", "assistant") and m.get("content")
+    )
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": f"Resumen actual:\n{previous or '(vacío)'}\n\nMensajes nuevos:\n{turns}"},
+    ]
+
+
+class _Summary:
+    __slots__ = ("text", "covered")
+
+    def __init__(self):
+        self.text = ""
+        self.covered = deque()  # huellas de los turnos resumidos, en orden
+
+
+class ContextBuilder:
+    """Arma el prompt de cada petición dentro de un presupuesto de tokens.
+
+    Recorre el historial del más reciente al más antiguo y agrega mensajes
+    mientras quepan en `budget`. Los turnos que quedan fuera se sustituyen por
+    un resumen acumulado por sesión. El resumen se actualiza en segundo plano
+    con `summarize(resumen_previo, mensajes_nuevos)`; mientras tanto se usa el
+    último resumen disponible, así resumir nunca agrega latencia.
+    """
+
+    SUMMARY_PREFIX = "Resumen de la conversación anterior: "
+
+    def __init__(self, budget: int = 3000, summary_budget: int = 300,
+                 summarize: Optional[Callable[[str, List[Dict]], Awaitable[str]]] = None,
+                 schedule: Optional[Callable] = None, max_sessions: int = 10000,
+                 remember: int = 500):
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self._summarize = summarize
+        self._schedule = schedule
+        self.max_sessions = max_sessions
+        self.remember = remember
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+        self._requests = 0
+        self._prompt_tokens = 0
+        self._summarized_requests = 0
+
+    def build(self, session_id: str, system_prompt: str, history: List[Dict],
+              user_message: Optional[Dict] = None, reserved: int = 0) -> Tuple[List[Dict], int]:
+        """Devuelve (mensajes, tokens estimados del prompt)"""
+        system = {"role": "system", "content": system_prompt}
+        fixed = [user_message] if user_message else []
+        used = reserved + estimate_tokens(system) + sum(estimate_tokens(m) for m in fixed)
+
+        costs = [estimate_tokens(m) for m in history]
+        available = self.budget - used
+        if sum(costs) > available:
+            # No cabe todo: dejar lugar al resumen de lo que quede fuera
+            available -= self.summary_budget
+
+        # Del más reciente al más antiguo mientras quepa
+        kept = []
+        cut = len(history)
+        for i in range(len(history) - 1, -1, -1):
+            cost = costs[i]
+            if cost > available:
+                break
+            available -= cost
+            used += cost
+            kept.append(history[i])
+            cut = i
+        kept.reverse()
+        # Un mensaje de herramienta no puede quedar sin la llamada que lo originó
+        while kept and kept[0].get("role") in ("function", "tool"):
+            used -= estimate_tokens(kept.pop(0))
+            cut += 1
+
+        messages = [system]
+        dropped = history[:cut]
+        if dropped:
+            summary = self._summary_for(session_id, dropped)
+            # Si lo fijo (sistema, herramientas, entrada) ya ocupa casi todo, el resumen se acorta
+            room = min(self.summary_budget, self.budget - used) - MESSAGE_OVERHEAD - 10
+            summary = summary[:max(room, 0) * CHARS_PER_TOKEN]
+            if summary:
+                summary_message = {"role": "system", "content": self.SUMMARY_PREFIX + summary}
+                messages.append(summary_message)
+                used += estimate_tokens(summary_message)
+        messages.extend(kept)
+        messages.extend(fixed)
+
+        with self._lock:
+            self._requests += 1
+            self._prompt_tokens += used
+            if dropped:
+                self._summarized_requests += 1
+        return messages, used
+
+    def _summary_for(self, session_id: str, dropped: List[Dict]) -> str:
+        with self._lock:
+            state = self._summaries.get(session_id)
+            if state is None:
+                state = self._summaries[session_id] = _Summary()
+                while len(self._summaries) > self.max_sessions:
+                    self._summaries.popitem(last=False)
+            self._summaries.move_to_end(session_id)
+            keys = [fingerprint(m) for m in dropped]
+            pending = list(zip(keys, dropped))[covered_prefix(list(state.covered), keys):]
+            refresh = (pending and self._summarize is not None and self._schedule is not None
+                       and session_id not in self._inflight)
+            if refresh:
+                self._inflight.add(session_id)
+            text = state.text
+
+        if refresh:
+            self._schedule(self._refresh(session_id, state, pending))
+        return text
+
+    async def _refresh(self, session_id: str, state: _Summary, pending: List[Tuple[str, Dict]]):
+        try:
+            text = await self._summarize(state.text, [message for _, message in pending])
+            with self._lock:
+                # Recortar si el modelo se extendió de más
+                state.text = (text or "").strip()[:self.summary_budget * CHARS_PER_TOKEN]
+                state.covered.extend(key for key, _ in pending)
+                while len(state.covered) > self.remember:
+                    state.covered.popleft()
+        except Exception as e:
+            logger.warning(f"No se pudo actualizar el resumen de {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "token_budget": self.budget,
+                "summary_budget": self.summary_budget,
+                "summarized_sessions": sum(1 for s in self._summaries.values() if s.text),
+                "summaries_in_progress": len(self._inflight),
+                "requests": self._requests,
+                "requests_with_dropped_turns": self._summarized_requests,
+                "avg_prompt_tokens": round(self._prompt_tokens / self._requests, 1) if self._requests else 0.0,
+            }
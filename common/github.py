@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from common.http_clients import ClientRegistry
+
+
+def normalize_query(query: str) -> str:
+    """Minúsculas y espacios colapsados: "  FastAPI  Auth" y "fastapi auth" son la misma búsqueda"""
+    return " ".join((query or "").casefold().split())
+
+
+class RepoSearchCache:
+    """Búsqueda de repositorios en GitHub con caché y revalidación condicional.
+
+    La API de búsqueda sin autenticar permite 10 peticiones por minuto, así
+    que cada consulta (normalizada) se guarda con su ETag:
+      - Durante `ttl` segundos se responde desde memoria sin tocar la red.
+      - Pasado el `ttl` se revalida con `If-None-Match`; un 304 renueva la
+        entrada sin volver a descargar los resultados.
+      - Si GitHub responde con límite agotado (o no responde) y hay una
+        entrada, aunque esté vencida, se sirve esa. Mientras
+        `X-RateLimit-Remaining` esté en 0 ni siquiera se intenta.
+    Las búsquedas iguales simultáneas comparten una sola petición. Se usa
+    siempre el cliente asíncrono del registro (un solo pool de conexiones)
+    y debe llamarse desde el event loop del runtime.
+    """
+
+    FIELDS = ("full_name", "description", "stargazers_count", "html_url", "language")
+
+    def __init__(self, clients: ClientRegistry, upstream: str = "github", ttl: float = 600.0,
+                 max_entries: int = 500, max_stale: float = 86400.0, per_page: int = 10, token: str = ""):
+        self._clients = clients
+        self.upstream = upstream
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale  # pasado esto una entrada ya no se sirve ni se revalida
+        self.per_page = per_page
+        self.token = token
+        self._entries: "OrderedDict[Tuple[str, str], Dict]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._limited_until = 0.0
+
+        self._hits = 0
+        self._misses = 0
+        self._revalidated = 0
+        self._stale_served = 0
+        self._coalesced = 0
+        self._rate_limited = 0
+
+    async def search(self, query: str, sort: Optional[str] = None, limit: int = 5) -> List[Dict]:
+        """Hasta `limit` repositorios (campos de FIELDS) para la consulta"""
+        key = (normalize_query(query), sort or "")
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry["fetched_at"] >= self.max_stale:
+            del self._entries[key]
+            entry = None
+        if entry is not None and time.monotonic() - entry["fetched_at"] < self.ttl:
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry["items"][:limit]
+
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(key, entry))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self._coalesced += 1
+        items = await asyncio.shield(pending)
+        return items[:limit]
+
+    async def _fetch(self, key: Tuple[str, str], entry: Optional[Dict]) -> List[Dict]:
+        query, sort = key
+        if time.time() < self._limited_until:
+            self._rate_limited += 1
+            if entry is not None:
+                self._stale_served += 1
+                return entry["items"]
+            raise RuntimeError(
+                f"Límite de búsquedas de GitHub agotado; se libera en {self._limited_until - time.time():.0f} s"
+            )
+
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if entry is not None and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        params = {"q": query, "per_page": self.per_page}
+        if sort:
+            params["sort"] = sort
+
+        try:
+            response = await self._clients.async_client(self.upstream).get(
+                "/search/repositories", params=params, headers=headers
+            )
+        except httpx.HTTPError:
+            if entry is None:
+                raise
+            self._stale_served += 1
+            return entry["items"]
+        self._track_rate_limit(response)
+
+        if response.status_code == 304 and entry is not None:
+            entry["fetched_at"] = time.monotonic()
+            self._entries.move_to_end(key)
+            self._revalidated += 1
+            return entry["items"]
+        if response.status_code in (403, 429) and entry is not None:
+            self._rate_limited += 1
+            self._stale_served += 1
+            return entry["items"]
+        response.raise_for_status()
+
+        self._misses += 1
+        items = [{field: repo.get(field) for field in self.FIELDS} for repo in response.json().get("items", [])]
+        self._entries[key] = {"items": items, "etag": response.headers.get("ETag"), "fetched_at": time.monotonic()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return items
+
+    def _track_rate_limit(self, response: httpx.Response):
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                self._limited_until = float(response.headers.get("X-RateLimit-Reset", 0))
+            except ValueError:
+                pass
+
+    def stats(self) -> Dict:
+        lookups = self._hits + self._revalidated + self._misses + self._stale_served
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self._hits,
+            "revalidated": self._revalidated,
+            "misses": self._misses,
+            "stale_served": self._stale_served,
+            "coalesced": self._coalesced,
+            "rate_limited": self._rate_limited,
+            "hit_ratio": round((self._hits + self._revalidated) / lookups, 3) if lookups else 0.0,
+            "rate_limited_for_s": max(round(self._limited_until - time.time()), 0),
+        }
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from common.stats import percentile
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Probe:
+    """Una comprobación periódica: `check` termina si el servicio está bien y lanza si no"""
+    name: str
+    check: Callable[[], Awaitable[Any]]
+    interval: float = 10.0
+    timeout: float = 2.0
+    latencies: deque = field(default_factory=lambda: deque(maxlen=60))
+    results: deque = field(default_factory=lambda: deque(maxlen=60))
+    consecutive_failures: int = 0
+    last_error: Optional[str] = None
+    last_checked: float = 0.0
+
+
+class HealthMonitor:
+    """Comprueba servicios externos en segundo plano y publica el último estado.
+
+    Cada sonda corre en su propia tarea del runtime cada `interval`
+    segundos (la mitad mientras está caída, para notar pronto que volvió).
+    Tras cada comprobación se reemplaza la foto publicada, así `up()` y
+    `snapshot()` solo leen memoria: ni /health ni las herramientas esperan
+    nunca a una comprobación. `probe_now()` existe para quien sí necesita
+    un resultado fresco (p. ej. tras arrancar un proceso).
+    """
+
+    def __init__(self, runtime):
+        self._runtime = runtime
+        self._probes: Dict[str, Probe] = {}
+        self._snapshot: Dict[str, Dict] = {}
+        self._tasks = []
+
+    def add(self, name: str, check: Callable[[], Awaitable[Any]], interval: float = 10.0, timeout: float = 2.0):
+        self._probes[name] = Probe(name, check, interval, timeout)
+        self._snapshot[name] = {"up": None}
+
+    def start(self):
+        """Arranca una tarea por sonda en el event loop del runtime"""
+        if self._tasks:
+            return
+        self._tasks = [self._runtime.submit(self._loop(probe)) for probe in self._probes.values()]
+
+    async def _loop(self, probe: Probe):
+        while True:
+            await self._run(probe)
+            await asyncio.sleep(probe.interval / 2 if probe.consecutive_failures else probe.interval)
+
+    async def _run(self, probe: Probe) -> Dict:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe.check(), probe.timeout)
+            ok, error = True, None
+        except asyncio.TimeoutError:
+            ok, error = False, f"sin respuesta en {probe.timeout:g} s"
+        except Exception as e:
+            ok, error = False, str(e) or type(e).__name__
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        probe.last_checked = time.time()
+        probe.results.append(ok)
+        if ok:
+            probe.latencies.append(elapsed_ms)
+            probe.consecutive_failures = 0
+        else:
+            if probe.consecutive_failures == 0:
+                logger.warning(f"Sonda '{probe.name}' falló: {error}")
+            probe.consecutive_failures += 1
+        probe.last_error = error
+
+        snapshot = {
+            "up": ok,
+            "last_checked": round(probe.last_checked, 1),
+            "latency_ms": round(elapsed_ms, 1),
+            "latency_ms_p95": round(percentile(probe.latencies, 0.95), 1),
+            "availability": round(probe.results.count(True) / len(probe.results), 3),
+            "consecutive_failures": probe.consecutive_failures,
+            "error": error,
+        }
+        # Se reemplaza el diccionario completo: quien lee nunca ve uno a medias
+        self._snapshot = {**self._snapshot, probe.name: snapshot}
+        return snapshot
+
+    def up(self, name: str) -> Optional[bool]:
+        """Último resultado conocido (None si todavía no se comprobó)"""
+        return self._snapshot.get(name, {}).get("up")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return self._snapshot
+
+    async def probe_now(self, name: str) -> Dict:
+        """Comprueba ya (y publica el resultado) sin esperar al siguiente turno"""
+        return await self._run(self._probes[name])
+
@@ -0,0 +1,358 @@
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD_BYTES = 120  # dict, claves y deque por mensaje (aproximado)
+
+
+def message_size(message: Dict) -> int:
+    """Tamaño aproximado en memoria de un mensaje del historial"""
+    return MESSAGE_OVERHEAD_BYTES + sum(len(str(v)) for v in message.values() if v is not None)
+
+
+class HistoryBackend(ABC):
+    """Interfaz de persistencia para HistoryStore.
+
+    `write` se llama en la ruta de la petición y no debe bloquear; `load`
+    devuelve los últimos `limit` mensajes de una sesión en orden cronológico.
+    """
+
+    @abstractmethod
+    def write(self, session_id: str, messages: List[Dict]):
+        ...
+
+    @abstractmethod
+    def load(self, session_id: str, limit: int) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    def flush(self, timeout: Optional[float] = None):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {}
+
+
+class SQLiteBackend(HistoryBackend):
+    """Historial persistente en SQLite (modo WAL) con escrituras agrupadas.
+
+    Las escrituras se encolan y un hilo propio las confirma en lotes (group
+    commit), así la persistencia no agrega latencia a las peticiones. Al
+    arrancar no se carga nada: cada sesión se lee la primera vez que se usa,
+    por lo que el arranque no depende de cuántas sesiones haya guardadas.
+    Varios procesos pueden compartir el mismo archivo.
+    """
+
+    def __init__(self, path: str, keep_turns: int = 50, batch_size: int = 500,
+                 flush_interval: float = 0.05):
+        self.path = path
+        self.keep_turns = keep_turns
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._pending: Dict[str, int] = defaultdict(int)
+        self._pending_lock = threading.Lock()
+        self._drained = threading.Condition(self._pending_lock)
+        self._local = threading.local()
+
+        self._written = 0
+        self._batches = 0
+        self._errors = 0
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id TEXT NOT NULL,"
+            " message TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexión por hilo; el hilo escritor tiene la suya
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def write(self, session_id: str, messages: List[Dict]):
+        with self._pending_lock:
+            self._pending[session_id] += 1
+        self._queue.put((session_id, [json.dumps(m, ensure_ascii=False) for m in messages], time.time()))
+
+    def load(self, session_id: str, limit: int) -> List[Dict]:
+        # Bloquea (lectura y posible espera): HistoryStore la llama en un hilo aparte.
+        # Si este proceso tiene escrituras pendientes de la sesión, esperarlas
+        self._wait_session(session_id)
+        rows = self._connection().execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def delete(self, session_id: str):
+        with self._pending_lock:
+            self._pending[session_id] += 1
+        self._queue.put((session_id, None, time.time()))
+
+    def _wait_session(self, session_id: str, timeout: float = 5.0):
+        with self._pending_lock:
+            if self._pending.get(session_id):
+                self._drained.wait_for(lambda: not self._pending.get(session_id), timeout)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Espera a que se confirmen todas las escrituras encoladas"""
+        with self._pending_lock:
+            self._drained.wait_for(lambda: not self._pending, timeout)
+
+    def _run(self):
+        conn = self._connection()
+        while True:
+            batch = [self._queue.get()]
+            # Agrupar lo que llegue durante la ventana de flush
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(conn, batch)
+
+    def _commit(self, conn: sqlite3.Connection, batch):
+        touched = set()
+        written = 0
+        try:
+            with conn:
+                for session_id, messages, created_at in batch:
+                    if messages is None:
+                        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                        continue
+                    conn.executemany(
+                        "INSERT INTO messages (session_id, message, created_at) VALUES (?, ?, ?)",
+                        [(session_id, m, created_at) for m in messages]
+                    )
+                    touched.add(session_id)
+                    written += len(messages)
+                # Conservar solo los mensajes que el buffer en memoria podría usar
+                for session_id in touched:
+                    conn.execute(
+                        "DELETE FROM messages WHERE session_id = ? AND id <= ("
+                        " SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (session_id, session_id, self.keep_turns)
+                    )
+            # Solo cuenta lo que quedó confirmado
+            self._written += written
+            self._batches += 1
+        except sqlite3.Error as e:
+            self._errors += 1
+            logger.error(f"Error guardando historial: {e}")
+        finally:
+            with self._pending_lock:
+                for session_id, _, _ in batch:
+                    self._pending[session_id] -= 1
+                    if self._pending[session_id] <= 0:
+                        del self._pending[session_id]
+                self._drained.notify_all()
+
+    def close(self):
+        self.flush(timeout=5)
+
+    def stats(self) -> Dict:
+        with self._pending_lock:
+            pending = sum(self._pending.values())
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "pending_writes": pending,
+            "written_messages": self._written,
+            "batches": self._batches,
+            "avg_batch_messages": round(self._written / self._batches, 1) if self._batches else 0.0,
+            "errors": self._errors,
+        }
+
+
+class _Session:
+    __slots__ = ("messages", "bytes", "last_access", "loaded_at")
+
+    def __init__(self, max_turns: int):
+        self.messages = deque(maxlen=max_turns)
+        self.bytes = 0
+        self.last_access = time.time()
+        self.loaded_at = self.last_access
+
+
+class HistoryStore:
+    """Historial de conversaciones acotado en memoria.
+
+    Cada sesión guarda sus últimos `max_turns` mensajes en un buffer circular.
+    Las sesiones se mantienen en orden de uso (LRU): se expulsan completas las
+    menos recientes cuando se supera `max_sessions` o `max_bytes`, y las que
+    llevan más de `idle_ttl` segundos sin actividad.
+
+    Con un `backend` la memoria funciona como caché: cada mensaje nuevo se
+    persiste en segundo plano y una sesión que no está en memoria se carga
+    del backend al primer acceso. Si varios procesos comparten el backend,
+    `cache_ttl` fuerza a releer las sesiones cacheadas hace más de esos
+    segundos (0 = no releer).
+
+    `get` y `append` son corrutinas: la carga desde el backend (lectura de
+    disco y, si hay escrituras de la sesión sin confirmar, su espera) corre
+    en un hilo aparte y no frena al event loop. Una sesión ya en memoria se
+    resuelve sin salir del loop.
+    """
+
+    def __init__(self, max_turns: int = 50, max_sessions: int = 10000,
+                 idle_ttl: float = 86400.0, max_bytes: int = 64 * 1024 * 1024,
+                 backend: Optional[HistoryBackend] = None, cache_ttl: float = 0.0):
+        self.backend = backend
+        self.cache_ttl = cache_ttl
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._evicted = {"lru": 0, "idle": 0, "memory": 0}
+
+    def _needs_load(self, session: Optional[_Session]) -> bool:
+        if self.backend is None:
+            return False
+        if session is None:
+            return True
+        return self.cache_ttl > 0 and time.time() - session.loaded_at > self.cache_ttl
+
+    async def _ensure_loaded(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not self._needs_load(session):
+                return
+        # La lectura se hace fuera del candado y del event loop para no frenar otras sesiones
+        try:
+            messages = await asyncio.to_thread(self.backend.load, session_id, self.max_turns)
+        except Exception as e:
+            logger.error(f"Error cargando historial de {session_id}: {e}")
+            return
+        with self._lock:
+            if self._sessions.get(session_id) is not session:
+                return  # otro hilo la cargó o modificó mientras tanto
+            if session is not None:
+                self._bytes -= session.bytes
+            loaded = _Session(self.max_turns)
+            for message in messages:
+                loaded.messages.append(message)
+                loaded.bytes += message_size(message)
+            self._bytes += loaded.bytes
+            self._sessions[session_id] = loaded
+            self._touch(session_id, loaded)
+            self._evict(keep=session_id)
+
+    async def get(self, session_id: str, last: Optional[int] = None) -> List[Dict]:
+        """Copia de los mensajes de la sesión (los `last` más recientes si se indica)"""
+        await self._ensure_loaded(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            self._touch(session_id, session)
+            messages = list(session.messages)
+        if last is not None:
+            messages = messages[-last:] if last > 0 else []
+        return [dict(m) for m in messages]
+
+    async def append(self, session_id: str, *messages: Dict):
+        """Agrega mensajes al final de la sesión, creándola si no existe"""
+        await self._ensure_loaded(session_id)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_turns)
+            self._touch(session_id, session)
+            for message in messages:
+                if len(session.messages) == session.messages.maxlen:
+                    # El buffer circular descarta el más antiguo
+                    removed = message_size(session.messages[0])
+                    session.bytes -= removed
+                    self._bytes -= removed
+                size = message_size(message)
+                session.messages.append(dict(message))
+                session.bytes += size
+                self._bytes += size
+            self._evict(keep=session_id)
+        if self.backend is not None:
+            self.backend.write(session_id, [dict(m) for m in messages])
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._bytes -= session.bytes
+        if self.backend is not None:
+            self.backend.delete(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def _touch(self, session_id: str, session: _Session):
+        session.last_access = time.time()
+        self._sessions.move_to_end(session_id)
+
+    def _evict(self, keep: str):
+        # Las sesiones inactivas están al principio del orden LRU
+        cutoff = time.time() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session_id == keep:
+                break
+            if session.last_access < cutoff:
+                reason = "idle"
+            elif len(self._sessions) > self.max_sessions:
+                reason = "lru"
+            elif self._bytes > self.max_bytes:
+                reason = "memory"
+            else:
+                break
+            self._sessions.popitem(last=False)
+            self._bytes -= session.bytes
+            self._evicted[reason] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(s.messages) for s in self._sessions.values()),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "max_turns": self.max_turns,
+                "idle_ttl_seconds": self.idle_ttl,
+                "evicted": dict(self._evicted),
+                "persistence": self.backend.stats() if self.backend is not None else None,
+            }
@@ -0,0 +1,247 @@
+import importlib.util
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from common import tracing
+from common.metrics import MetricsRegistry
+from common.resilience import AsyncResilientTransport, CircuitBreaker, ResilientTransport, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class UpstreamConfig:
+    """Configuración del pool de conexiones hacia un servicio externo"""
+    name: str
+    base_url: str = ""
+    pool_size: int = 20           # conexiones simultáneas como máximo
+    keepalive: int = 10           # conexiones ociosas que se mantienen abiertas
+    keepalive_expiry: float = 30.0
+    timeout: float = 10.0
+    connect_timeout: float = 5.0
+    http2: bool = False
+    retries: int = 2              # reintentos por petición (ver common/resilience.py)
+    retry_backoff: float = 0.2
+    retry_post: bool = False      # repetir también POST (solo APIs sin efectos secundarios)
+    breaker_threshold: int = 5    # fallos seguidos que abren el circuito
+    breaker_cooldown: float = 30.0
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamConfig":
+        """Lee <NOMBRE>_POOL_SIZE, <NOMBRE>_KEEPALIVE, <NOMBRE>_TIMEOUT, <NOMBRE>_HTTP2,
+        <NOMBRE>_RETRIES, <NOMBRE>_BREAKER_THRESHOLD y <NOMBRE>_BREAKER_COOLDOWN"""
+        prefix = name.upper()
+        config = cls(name=name, **defaults)
+        config.pool_size = int(os.getenv(f"{prefix}_POOL_SIZE", config.pool_size))
+        config.keepalive = int(os.getenv(f"{prefix}_KEEPALIVE", config.keepalive))
+        config.timeout = float(os.getenv(f"{prefix}_TIMEOUT", config.timeout))
+        config.connect_timeout = float(os.getenv(f"{prefix}_CONNECT_TIMEOUT", config.connect_timeout))
+        config.http2 = os.getenv(f"{prefix}_HTTP2", "1" if config.http2 else "0") == "1"
+        config.retries = int(os.getenv(f"{prefix}_RETRIES", config.retries))
+        config.breaker_threshold = int(os.getenv(f"{prefix}_BREAKER_THRESHOLD", config.breaker_threshold))
+        config.breaker_cooldown = float(os.getenv(f"{prefix}_BREAKER_COOLDOWN", config.breaker_cooldown))
+        return config
+
+    def retry_policy(self) -> RetryPolicy:
+        return RetryPolicy(max_retries=self.retries, backoff=self.retry_backoff, retry_post=self.retry_post)
+
+
+class _ConnectionStats:
+    """Cuenta respuestas recibidas y conexiones abiertas para medir la reutilización"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.retries = 0
+
+    def on_response(self):
+        with self._lock:
+            self.requests += 1
+
+    def on_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def on_trace(self, event: str):
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            requests, new = self.requests, self.new_connections
+        reused = max(requests - new, 0)
+        return {
+            "requests": requests,
+            "new_connections": new,
+            "reused_connections": reused,
+            "reuse_ratio": round(reused / requests, 3) if requests else 0.0,
+            "retries": self.retries,
+        }
+
+
+class ClientRegistry:
+    """Un pool de conexiones persistente por servicio externo.
+
+    Todas las herramientas y endpoints piden aquí su cliente en lugar de usar
+    `requests.get/post` sueltos, así las conexiones TCP/TLS se reutilizan
+    entre llamadas. Cada servicio tiene un cliente síncrono (hilos de fondo)
+    y uno asíncrono (event loop del runtime), creados al primer uso. Ambos
+    comparten la política de reintentos y el circuit breaker del servicio.
+    """
+
+    def __init__(self, metrics: Optional[MetricsRegistry] = None):
+        self._configs: Dict[str, UpstreamConfig] = {}
+        self._stats: Dict[str, _ConnectionStats] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._async: Dict[str, httpx.AsyncClient] = {}
+        self._sync: Dict[str, httpx.Client] = {}
+        self._lock = threading.Lock()
+        self._upstream_requests = self._upstream_duration = None
+        if metrics is not None:
+            self._upstream_requests = metrics.counter(
+                "upstream_requests_total", "Peticiones a servicios externos por resultado", ("upstream", "outcome")
+            )
+            self._upstream_duration = metrics.histogram(
+                "upstream_request_duration_seconds", "Duración de las peticiones a servicios externos (con reintentos)",
+                ("upstream",)
+            )
+
+    def register(self, config: UpstreamConfig):
+        if config.http2 and not HTTP2_AVAILABLE:
+            logger.warning(f"HTTP/2 pedido para '{config.name}' pero falta el paquete h2; se usa HTTP/1.1")
+            config.http2 = False
+        self._configs[config.name] = config
+        self._stats[config.name] = _ConnectionStats()
+        self._breakers[config.name] = CircuitBreaker(config.name, config.breaker_threshold, config.breaker_cooldown)
+
+    def config(self, name: str) -> UpstreamConfig:
+        return self._configs[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._configs
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        return self._breakers[name]
+
+    def _observer(self, name: str) -> Callable[[str, float], None]:
+        """Anota cada petición (resultado y duración total) en las métricas, si las hay,
+        y como span en la traza de la petición en curso, si se está trazando"""
+        requests, duration = self._upstream_requests, self._upstream_duration
+        span_name = f"upstream.{name}"
+
+        def observe(outcome: str, elapsed: float):
+            tracing.record(span_name, elapsed, outcome=outcome)
+            if requests is not None:
+                requests.inc(name, outcome)
+                duration.observe(elapsed, name)
+        return observe
+
+    def _client_options(self, name: str) -> Dict:
+        config = self._configs[name]
+        return {
+            "base_url": config.base_url,
+            "timeout": httpx.Timeout(config.timeout, connect=config.connect_timeout),
+        }
+
+    def _transport_options(self, name: str) -> Dict:
+        config = self._configs[name]
+        return {
+            "http2": config.http2,
+            "limits": httpx.Limits(
+                max_connections=config.pool_size,
+                max_keepalive_connections=config.keepalive,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        }
+
+    def async_client(self, name: str) -> httpx.AsyncClient:
+        client = self._async.get(name)
+        if client is None:
+            with self._lock:
+                client = self._async.get(name)
+                if client is None:
+                    stats = self._stats[name]
+
+                    async def trace(event, info):
+                        stats.on_trace(event)
+
+                    async def on_request(request):
+                        request.extensions["trace"] = trace
+
+                    async def on_response(response):
+                        stats.on_response()
+
+                    transport = AsyncResilientTransport(
+                        httpx.AsyncHTTPTransport(**self._transport_options(name)),
+                        self._configs[name].retry_policy(), self._breakers[name], stats.on_retry,
+                        self._observer(name)
+                    )
+                    client = httpx.AsyncClient(
+                        transport=transport,
+                        event_hooks={"request": [on_request], "response": [on_response]},
+                        **self._client_options(name)
+                    )
+                    self._async[name] = client
+        return client
+
+    def sync_client(self, name: str) -> httpx.Client:
+        client = self._sync.get(name)
+        if client is None:
+            with self._lock:
+                client = self._sync.get(name)
+                if client is None:
+                    stats = self._stats[name]
+
+                    def trace(event, info):
+                        stats.on_trace(event)
+
+                    def on_request(request):
+                        request.extensions["trace"] = trace
+
+                    def on_response(response):
+                        stats.on_response()
+
+                    transport = ResilientTransport(
+                        httpx.HTTPTransport(**self._transport_options(name)),
+                        self._configs[name].retry_policy(), self._breakers[name], stats.on_retry,
+                        self._observer(name)
+                    )
+                    client = httpx.Client(
+                        transport=transport,
+                        event_hooks={"request": [on_request], "response": [on_response]},
+                        **self._client_options(name)
+                    )
+                    self._sync[name] = client
+        return client
+
+    def stats(self) -> Dict[str, Dict]:
+        """Reutilización de conexiones, reintentos y estado del circuito por servicio"""
+        result = {}
+        for name, config in self._configs.items():
+            result[name] = {
+                **self._stats[name].snapshot(),
+                "pool_size": config.pool_size,
+                "http2": config.http2,
+                "breaker": self._breakers[name].snapshot(),
+            }
+        return result
+
+    async def aclose(self):
+        for client in list(self._async.values()):
+            await client.aclose()
+        self._async.clear()
+        self.close()
+
+    def close(self):
+        for client in list(self._sync.values()):
+            client.close()
+        self._sync.clear()
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Campos de cada mensaje que influyen en la respuesta del modelo
+MESSAGE_FIELDS = ("role", "content", "name", "function_call", "tool_calls", "tool_call_id")
+SCHEMA_FIELDS = ("functions", "tools")
+SCHEMA_HASHES = 32  # esquemas distintos cuyo hash se recuerda (las apps usan uno o dos)
+
+
+def normalize_message(message: Dict) -> Dict:
+    normalized = {k: message[k] for k in MESSAGE_FIELDS if message.get(k) is not None}
+    if isinstance(normalized.get("content"), str):
+        # Los espacios de más no cambian la petición
+        normalized["content"] = " ".join(normalized["content"].split())
+    return normalized
+
+
+def called_tools(message: Dict) -> list:
+    """Nombres de las herramientas que el modelo pidió en su respuesta"""
+    if message.get("function_call"):
+        return [message["function_call"].get("name")]
+    return [call["function"]["name"] for call in message.get("tool_calls") or []]
+
+
+class LLMCache:
+    """Caché de respuestas del modelo de chat, acotada en tamaño y con TTL.
+
+    La clave combina el modelo, los mensajes normalizados, el resto de los
+    parámetros y un hash del esquema de herramientas (calculado una vez por
+    esquema, de los últimos `SCHEMA_HASHES`). Modos:
+      - "off": no guarda nada.
+      - "all": guarda cualquier respuesta.
+      - "deterministic": guarda solo las decisiones de llamar herramientas
+        de `pure_tools` (sin efectos secundarios, p. ej. `sumar`). Lo que se
+        reutiliza es la decisión; la herramienta se vuelve a ejecutar.
+
+    La petición se arma para el backend principal; con `provider` solo se
+    guardan las respuestas de ese backend (el campo "provider" que agrega
+    ProviderPool). Lo que contestó un respaldo por conmutación o cobertura
+    no se guarda, porque vino de otro modelo con otra traducción.
+    """
+
+    MODES = ("off", "all", "deterministic")
+
+    def __init__(self, mode: str = "off", max_entries: int = 1000, ttl: float = 300.0,
+                 pure_tools: Iterable[str] = (), provider: Optional[str] = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de caché desconocido: {mode}")
+        self.mode = mode
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pure_tools = frozenset(pure_tools)
+        self.provider = provider
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._schema_hashes: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._stored = 0
+        self._skipped = 0
+        self._expired = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _schema_hash(self, schema) -> str:
+        if not schema:
+            return ""
+        with self._lock:
+            cached = self._schema_hashes.get(id(schema))
+            if cached is not None and cached[0] is schema:
+                self._schema_hashes.move_to_end(id(schema))
+                return cached[1]
+        digest = hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            # Se guarda la referencia para que el id no se reutilice mientras esté en la tabla
+            self._schema_hashes[id(schema)] = (schema, digest)
+            while len(self._schema_hashes) > SCHEMA_HASHES:
+                self._schema_hashes.popitem(last=False)
+        return digest
+
+    def key(self, payload: Dict) -> str:
+        params = {k: v for k, v in payload.items() if k not in SCHEMA_FIELDS and k != "messages"}
+        raw = json.dumps({
+            "params": params,
+            "messages": [normalize_message(m) for m in payload.get("messages", [])],
+            "schema": [self._schema_hash(payload.get(field)) for field in SCHEMA_FIELDS],
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, payload: Dict) -> Optional[Dict]:
+        """Respuesta guardada para el payload (una copia, marcada con "cached") o None"""
+        if not self.enabled:
+            return None
+        key = self.key(payload)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                del self._entries[key]
+                self._expired += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        result = json.loads(entry[1])
+        result["cached"] = True
+        return result
+
+    def cacheable(self, result: Dict) -> bool:
+        if self.provider is not None and result.get("provider", self.provider) != self.provider:
+            return False
+        if self.mode == "all":
+            return True
+        try:
+            tools = called_tools(result["choices"][0]["message"])
+        except (KeyError, IndexError, TypeError):
+            return False
+        return bool(tools) and all(name in self.pure_tools for name in tools)
+
+    def put(self, payload: Dict, result: Dict):
+        if not self.enabled:
+            return
+        if not self.cacheable(result):
+            with self._lock:
+                self._skipped += 1
+            return
+        key = self.key(payload)
+        value = json.dumps(result, ensure_ascii=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._stored += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "mode": self.mode,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+                "stored": self._stored,
+                "not_cacheable": self._skipped,
+                "expired": self._expired,
+            }
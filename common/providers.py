@@ -0,0 +1,344 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from common.http_clients import ClientRegistry, UpstreamConfig
+from common.stats import percentile
+from common.streaming import stream_completion
+
+logger = logging.getLogger(__name__)
+
+# Valores por omisión de los backends conocidos (compatibles con la API de OpenAI)
+KNOWN_PROVIDERS = {
+    "openai": {"url": "https://api.openai.com/v1/chat/completions", "model": "gpt-4.1-nano-2025-04-14"},
+    "deepseek": {"url": "https://api.deepseek.com/v1/chat/completions", "model": "deepseek-chat"},
+}
+
+
+@dataclass
+class Provider:
+    """Un backend de chat: URL, credencial, modelo y formato de herramientas"""
+    name: str
+    url: str
+    api_key: str
+    model: str
+    schema: str = "tools"  # "tools" o "functions" (formato anterior de OpenAI)
+
+
+def providers_from_env(primary: Provider) -> List[Provider]:
+    """El backend propio de la app primero; los demás solo si tienen <NOMBRE>_API_KEY"""
+    providers = [primary]
+    for name, defaults in KNOWN_PROVIDERS.items():
+        prefix = name.upper()
+        if name == primary.name or not os.getenv(f"{prefix}_API_KEY"):
+            continue
+        providers.append(Provider(
+            name=name,
+            url=os.getenv(f"{prefix}_API_URL", defaults["url"]),
+            api_key=os.getenv(f"{prefix}_API_KEY"),
+            model=os.getenv(f"{prefix}_MODEL", defaults["model"]),
+            schema=os.getenv(f"{prefix}_SCHEMA", "tools"),
+        ))
+    return providers
+
+
+# -------------------------
+# Traducción functions <-> tools
+# -------------------------
+def functions_to_tools(functions: List[Dict]) -> List[Dict]:
+    return [{"type": "function", "function": f} for f in functions]
+
+
+def tools_to_functions(tools: List[Dict]) -> List[Dict]:
+    return [t["function"] for t in tools]
+
+
+def to_legacy_payload(payload: Dict) -> Dict:
+    """Payload en formato tools -> functions/function_call"""
+    body = {k: v for k, v in payload.items() if k not in ("tools", "tool_choice", "messages")}
+    if payload.get("tools"):
+        body["functions"] = tools_to_functions(payload["tools"])
+    choice = payload.get("tool_choice")
+    if isinstance(choice, dict):
+        body["function_call"] = {"name": choice["function"]["name"]}
+    elif choice and payload.get("tools"):
+        body["function_call"] = choice
+
+    # Cada llamada del formato tools se vuelve un par assistant(function_call) + function
+    messages, pending = [], {}
+    for message in payload.get("messages", []):
+        if message.get("role") == "assistant" and message.get("tool_calls"):
+            pending.update({call["id"]: call["function"] for call in message["tool_calls"]})
+            continue
+        if message.get("role") == "tool":
+            function = pending.pop(message.get("tool_call_id"), {"name": "tool", "arguments": "{}"})
+            messages.append({"role": "assistant", "content": None, "function_call": function})
+            messages.append({"role": "function", "name": function["name"], "content": message["content"]})
+            continue
+        messages.append(message)
+    body["messages"] = messages
+    return body
+
+
+def from_legacy_message(message: Dict) -> Dict:
+    """Mensaje con function_call -> mensaje con tool_calls"""
+    if not message.get("function_call"):
+        return message
+    message = dict(message)
+    function = message.pop("function_call")
+    message["tool_calls"] = [{"id": f"call_{int(time.time() * 1000)}", "type": "function", "function": function}]
+    return message
+
+
+def is_provider_failure(error: Exception) -> bool:
+    """Errores que indican un problema del backend (y justifican probar con otro)"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class _BackendStats:
+    """Latencias y errores recientes de un backend"""
+
+    def __init__(self, window: int):
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, ok: bool, elapsed: float, failure_threshold: int, max_error_rate: float,
+               min_samples: int, cooldown: float):
+        with self._lock:
+            self.requests += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(elapsed)
+                self.consecutive_failures = 0
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            error_rate = self.outcomes.count(False) / len(self.outcomes)
+            if (self.consecutive_failures >= failure_threshold
+                    or (len(self.outcomes) >= min_samples and error_rate > max_error_rate)):
+                self.unhealthy_until = time.monotonic() + cooldown
+
+    def censored(self, elapsed: float):
+        """Latencia de una petición cancelada sin terminar (perdió la cobertura): al menos `elapsed`"""
+        with self._lock:
+            self.latencies.append(elapsed)
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+
+    def p95(self) -> float:
+        with self._lock:
+            return percentile(self.latencies, 0.95)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            outcomes = list(self.outcomes)
+        return {
+            "healthy": self.healthy(),
+            "requests": self.requests,
+            "failures": self.failures,
+            "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+            "latency_ms_p50": round(percentile(latencies, 0.5) * 1000, 1),
+            "latency_ms_p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class ProviderPool:
+    """Una sola capa de acceso a los backends de chat (OpenAI, DeepSeek) para ambas apps.
+
+    Los payloads entran siempre en formato tools y se traducen al formato
+    del backend elegido. Por cada backend se lleva una ventana de latencias
+    y errores recientes:
+      - Cobertura (hedging): si el primario tarda más que su p95 (o que
+        `hedge_after` mientras no hay muestras suficientes), se lanza la
+        misma petición al siguiente backend sano y gana la primera respuesta;
+        la otra se cancela.
+      - Conmutación: un backend con `failure_threshold` fallos seguidos o con
+        una tasa de error mayor a `max_error_rate` se da por caído durante
+        `cooldown` segundos y las peticiones van directo al siguiente.
+    Solo los errores del backend (5xx, 429, red, timeouts) cuentan como
+    fallos; un 4xx se devuelve tal cual porque otro backend fallaría igual.
+    """
+
+    def __init__(self, providers: List[Provider], clients: ClientRegistry, hedge: bool = True,
+                 hedge_after: float = 3.0, min_hedge_delay: float = 0.05, window: int = 200,
+                 min_samples: int = 20, failure_threshold: int = 3, max_error_rate: float = 0.5,
+                 cooldown: float = 30.0):
+        self.providers = providers
+        self._clients = clients
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._stats = {p.name: _BackendStats(window) for p in providers}
+        for provider in providers:
+            if provider.name not in clients:
+                clients.register(UpstreamConfig.from_env(provider.name, timeout=60.0, retry_post=True))
+
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._failovers = 0
+
+    def _candidates(self) -> List[Provider]:
+        healthy = [p for p in self.providers if self._stats[p.name].healthy()]
+        # Si todos están caídos se intenta igual, en el orden configurado
+        return healthy or list(self.providers)
+
+    def _hedge_delay(self, provider: Provider) -> float:
+        stats = self._stats[provider.name]
+        if len(stats.latencies) < self.min_samples:
+            return self.hedge_after
+        return max(stats.p95(), self.min_hedge_delay)
+
+    def _record(self, provider: Provider, ok: bool, elapsed: float):
+        self._stats[provider.name].record(ok, elapsed, self.failure_threshold, self.max_error_rate,
+                                          self.min_samples, self.cooldown)
+
+    def _prepare(self, provider: Provider, payload: Dict) -> Dict:
+        body = {**payload, "model": provider.model}
+        if provider.schema == "functions":
+            body = to_legacy_payload(body)
+        return body
+
+    def _headers(self, provider: Provider) -> Dict:
+        return {"Authorization": f"Bearer {provider.api_key}"}
+
+    async def _call(self, provider: Provider, payload: Dict) -> Dict:
+        started = time.perf_counter()
+        try:
+            response = await self._clients.async_client(provider.name).post(
+                provider.url, headers=self._headers(provider), json=self._prepare(provider, payload)
+            )
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            if is_provider_failure(e):
+                self._record(provider, False, time.perf_counter() - started)
+            raise
+        self._record(provider, True, time.perf_counter() - started)
+        if provider.schema == "functions":
+            for choice in result.get("choices", []):
+                choice["message"] = from_legacy_message(choice["message"])
+        result["provider"] = provider.name
+        return result
+
+    async def chat(self, payload: Dict) -> Dict:
+        """Completion del primer backend que responda (con cobertura y conmutación)"""
+        candidates = self._candidates()
+        primary = candidates[0]
+        started = time.perf_counter()
+        tasks = {asyncio.ensure_future(self._call(primary, payload)): primary}
+        next_index = 1
+        hedged = False
+        last_error: Optional[Exception] = None
+        try:
+            while tasks:
+                can_hedge = self.hedge and not hedged and next_index < len(candidates)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=self._hedge_delay(primary) if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # El primario ya superó su p95: misma petición al siguiente backend
+                    hedged = True
+                    self._hedges += 1
+                    provider = candidates[next_index]
+                    next_index += 1
+                    tasks[asyncio.ensure_future(self._call(provider, payload))] = provider
+                    continue
+
+                for task in done:
+                    provider = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        if not is_provider_failure(e):
+                            raise
+                        logger.warning(f"Backend {provider.name} falló: {e}")
+                        if not tasks and next_index < len(candidates):
+                            self._failovers += 1
+                            fallback = candidates[next_index]
+                            next_index += 1
+                            tasks[asyncio.ensure_future(self._call(fallback, payload))] = fallback
+                        continue
+                    if hedged and provider is not primary:
+                        self._hedge_wins += 1
+                    return result
+            raise last_error
+        finally:
+            for task, provider in tasks.items():
+                task.cancel()
+                if hedged and provider is primary:
+                    # Sin esta muestra el p95 solo vería las respuestas más rápidas
+                    # que el umbral de cobertura y bajaría hasta min_hedge_delay
+                    self._stats[primary.name].censored(time.perf_counter() - started)
+
+    async def stream(self, payload: Dict) -> AsyncIterator[Dict]:
+        """Como `stream_completion`, con conmutación si el backend falla antes del primer token.
+
+        En streaming no hay cobertura: una vez que empiezan a llegar tokens la
+        respuesta queda ligada a ese backend.
+        """
+        last_error: Optional[Exception] = None
+        for index, provider in enumerate(self._candidates()):
+            if index:
+                self._failovers += 1
+            started = time.perf_counter()
+            emitted = False
+            try:
+                async for event in stream_completion(self._clients.async_client(provider.name), provider.url,
+                                                     self._headers(provider), self._prepare(provider, payload)):
+                    if event["type"] == "message":
+                        self._record(provider, True, time.perf_counter() - started)
+                        if provider.schema == "functions":
+                            event["message"] = from_legacy_message(event["message"])
+                        event["provider"] = provider.name
+                    emitted = True
+                    yield event
+                return
+            except Exception as e:
+                if not is_provider_failure(e):
+                    raise
+                self._record(provider, False, time.perf_counter() - started)
+                if emitted:
+                    raise
+                logger.warning(f"Backend {provider.name} falló: {e}")
+                last_error = e
+        raise last_error
+
+    async def ping(self, name: str):
+        """Comprueba que el backend responde sin gastar tokens (GET /models); lanza si no"""
+        provider = next(p for p in self.providers if p.name == name)
+        url = provider.url.rsplit("/chat/completions", 1)[0] + "/models"
+        response = await self._clients.async_client(name).get(url, headers=self._headers(provider))
+        if response.status_code >= 500 or response.status_code in (401, 403):
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+    def stats(self) -> Dict:
+        return {
+            "backends": {p.name: {**self._stats[p.name].snapshot(), "model": p.model} for p in self.providers},
+            "hedging": self.hedge,
+            "hedges": self._hedges,
+            "hedge_wins": self._hedge_wins,
+            "failovers": self._failovers,
+        }
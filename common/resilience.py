@@ -0,0 +1,269 @@
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import httpx
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({502, 503, 504})
+# La petición nunca llegó al servidor: se puede repetir aunque no sea idempotente
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+# Conexión cortada a mitad de camino: solo se repite si repetir es seguro
+RESET_ERRORS = (httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError)
+
+
+class CircuitOpenError(httpx.TransportError):
+    """El servicio está marcado como caído; la petición falla sin intentarse"""
+
+
+@dataclass
+class RetryPolicy:
+    """Cuándo y cuánto esperar antes de repetir una petición fallida.
+
+    - 429: se repite siempre (el servidor no la procesó), esperando lo que
+      indique `Retry-After`; si pide más de `max_retry_after` se devuelve tal cual.
+    - 502/503/504 y conexiones cortadas: solo métodos idempotentes (y POST
+      si `retry_post`, para APIs sin efectos secundarios como las de chat).
+    - Errores de conexión: siempre, porque la petición no salió.
+    Los timeouts de lectura no se repiten: esperar otro timeout completo
+    empeora la latencia sin mejorar las probabilidades.
+    """
+    max_retries: int = 2
+    backoff: float = 0.2          # segundos base del backoff exponencial
+    max_backoff: float = 5.0
+    max_retry_after: float = 30.0
+    retry_post: bool = False
+
+    def idempotent(self, request: httpx.Request) -> bool:
+        return request.method in IDEMPOTENT_METHODS or (self.retry_post and request.method == "POST")
+
+    def delay(self, attempt: int) -> float:
+        """Backoff exponencial con jitter completo"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    def wait_for_response(self, request: httpx.Request, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Segundos antes de reintentar, o None si la respuesta es definitiva"""
+        if attempt >= self.max_retries:
+            return None
+        if response.status_code == 429:
+            wait = self.retry_after(response)
+            if wait is None:
+                return self.delay(attempt)
+            return wait if wait <= self.max_retry_after else None
+        if response.status_code in RETRY_STATUSES and self.idempotent(request):
+            return self.delay(attempt)
+        return None
+
+    def wait_for_error(self, request: httpx.Request, error: Exception, attempt: int) -> Optional[float]:
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(error, NOT_SENT_ERRORS) or (isinstance(error, RESET_ERRORS) and self.idempotent(request)):
+            return self.delay(attempt)
+        return None
+
+
+class CircuitBreaker:
+    """Corta las llamadas a un servicio que está fallando.
+
+    Tras `failure_threshold` fallos seguidos (errores de red o 5xx) el
+    circuito se abre y las peticiones fallan al instante con
+    `CircuitOpenError` en vez de esperar su timeout. Pasado `cooldown`
+    deja pasar una sola petición de prueba: si sale bien se cierra, si no
+    vuelve a abrirse por otro `cooldown`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._rejected = 0
+        self._opened = 0
+
+    def before_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self._rejected += 1
+            retry_in = max(self.cooldown - (time.monotonic() - self._opened_at), 0.0)
+        raise CircuitOpenError(f"Servicio '{self.name}' no disponible (circuito abierto, reintento en {retry_in:.0f} s)")
+
+    @property
+    def closed(self) -> bool:
+        return self.state == self.CLOSED
+
+    def record(self, ok: Optional[bool]):
+        """ok=None: resultado que no dice nada del servicio (429, cancelación)"""
+        with self._lock:
+            self._probing = False
+            if ok is None:
+                return
+            if ok:
+                self._failures = 0
+                self.state = self.CLOSED
+                return
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._opened += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "times_opened": self._opened,
+                "rejected": self._rejected,
+            }
+
+
+def _outcome(response: httpx.Response) -> Optional[bool]:
+    if response.status_code == 429:
+        return None
+    return response.status_code < 500
+
+
+def _error_outcome(error: BaseException) -> str:
+    """Resultado de una petición sin respuesta, para las métricas por servicio"""
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.TransportError):
+        return "error"
+    return "cancelled"
+
+
+class ResilientTransport(httpx.BaseTransport):
+    """Transporte síncrono con reintentos y circuit breaker"""
+
+    def __init__(self, transport: httpx.BaseTransport, policy: RetryPolicy, breaker: CircuitBreaker,
+                 on_retry: Callable[[], None] = lambda: None,
+                 on_done: Callable[[str, float], None] = lambda outcome, elapsed: None):
+        self._transport = transport
+        self.policy = policy
+        self.breaker = breaker
+        self._on_retry = on_retry
+        self._on_done = on_done
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = self._send(request)
+        except BaseException as e:
+            self._on_done(_error_outcome(e), time.perf_counter() - started)
+            raise
+        self._on_done(str(response.status_code), time.perf_counter() - started)
+        return response
+
+    def _send(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                wait = self.policy.wait_for_error(request, e, attempt)
+                # Si el circuito se abrió con este fallo se devuelve el error real
+                if wait is None or not self.breaker.closed:
+                    raise
+            except BaseException:
+                self.breaker.record(None)
+                raise
+            else:
+                self.breaker.record(_outcome(response))
+                wait = self.policy.wait_for_response(request, response, attempt)
+                if wait is None or not self.breaker.closed:
+                    return response
+                response.close()
+            attempt += 1
+            self._on_retry()
+            time.sleep(wait)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncResilientTransport(httpx.AsyncBaseTransport):
+    """Transporte asíncrono con reintentos y circuit breaker"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, policy: RetryPolicy, breaker: CircuitBreaker,
+                 on_retry: Callable[[], None] = lambda: None,
+                 on_done: Callable[[str, float], None] = lambda outcome, elapsed: None):
+        self._transport = transport
+        self.policy = policy
+        self.breaker = breaker
+        self._on_retry = on_retry
+        self._on_done = on_done
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await self._send(request)
+        except BaseException as e:
+            self._on_done(_error_outcome(e), time.perf_counter() - started)
+            raise
+        self._on_done(str(response.status_code), time.perf_counter() - started)
+        return response
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                wait = self.policy.wait_for_error(request, e, attempt)
+                # Si el circuito se abrió con este fallo se devuelve el error real
+                if wait is None or not self.breaker.closed:
+                    raise
+            except BaseException:
+                self.breaker.record(None)
+                raise
+            else:
+                self.breaker.record(_outcome(response))
+                wait = self.policy.wait_for_response(request, response, attempt)
+                if wait is None or not self.breaker.closed:
+                    return response
+                await response.aclose()
+            attempt += 1
+            self._on_retry()
+            await asyncio.sleep(wait)
+
+    async def aclose(self):
+        await self._transport.aclose()
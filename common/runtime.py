@@ -0,0 +1,91 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+
+class AsyncRuntime:
+    """Event loop compartido de larga vida para todo el código asíncrono.
+
+    Con el servidor de Flask el loop corre en un hilo propio y las rutas
+    (síncronas) le envían corrutinas con `run()`. En modo ASGI se adopta el
+    loop del servidor con `attach()`, de modo que los clientes HTTP y las
+    tareas de fondo viven siempre en un único loop.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._start_thread()
+            return self._loop
+
+    def _start_thread(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="async-runtime", daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._loop = loop
+        self._thread_id = self._thread.ident
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        """Usa un loop ya existente (el del servidor ASGI)"""
+        with self._lock:
+            if self._loop is not None and self._loop is not loop:
+                raise RuntimeError("El runtime ya tiene un event loop en ejecución")
+            self._loop = loop
+            self._thread_id = threading.get_ident()
+
+    @property
+    def thread_id(self) -> Optional[int]:
+        """Hilo en el que corre el loop (None si todavía no arrancó)"""
+        return self._thread_id
+
+    def in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Programa una corrutina desde cualquier hilo sin esperar el resultado"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Ejecuta una corrutina desde código síncrono y espera el resultado"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("run() no puede llamarse desde el propio event loop")
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+        """Recorre un generador asíncrono desde código síncrono (p. ej. una respuesta en streaming de Flask).
+
+        Cada elemento se pide al loop a medida que se consume; si quien lo
+        recorre se detiene antes (el cliente cerró la conexión), el generador
+        asíncrono se cierra en el loop.
+        """
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+
+runtime = AsyncRuntime()
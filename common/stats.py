@@ -0,0 +1,6 @@
+def percentile(values, fraction: float) -> float:
+    """Valor en la posición `fraction` (0 a 1) de `values` ordenados; 0.0 si no hay valores"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
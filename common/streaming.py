@@ -0,0 +1,66 @@
+import json
+from typing import AsyncIterator, Dict
+
+import httpx
+
+
+def sse(event: str, data) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # que un proxy (nginx) no acumule los eventos
+}
+
+
+async def stream_completion(client: httpx.AsyncClient, url: str, headers: Dict,
+                            payload: Dict) -> AsyncIterator[Dict]:
+    """Pide una completion en streaming a una API compatible con OpenAI.
+
+    Produce {"type": "token", "text": ...} por cada fragmento de texto a
+    medida que llega y, al final, {"type": "message", "message": ...} con el
+    mensaje completo del asistente, incluidas las llamadas a herramientas
+    (que la API envía en fragmentos por índice y aquí se reensamblan).
+    """
+    content = []
+    calls: Dict[int, Dict] = {}
+    legacy_call: Dict = {}
+    async with client.stream("POST", url, headers=headers, json={**payload, "stream": True}) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if not chunk.get("choices"):
+                continue
+            delta = chunk["choices"][0].get("delta") or {}
+            if delta.get("content"):
+                content.append(delta["content"])
+                yield {"type": "token", "text": delta["content"]}
+            for fragment in delta.get("tool_calls") or []:
+                call = calls.setdefault(fragment.get("index", 0), {
+                    "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+                })
+                if fragment.get("id"):
+                    call["id"] = fragment["id"]
+                function = fragment.get("function") or {}
+                call["function"]["name"] += function.get("name") or ""
+                call["function"]["arguments"] += function.get("arguments") or ""
+            # Formato anterior (functions): una sola llamada en delta.function_call
+            if delta.get("function_call"):
+                for key in ("name", "arguments"):
+                    legacy_call[key] = legacy_call.get(key, "") + (delta["function_call"].get(key) or "")
+
+    message = {"role": "assistant", "content": "".join(content) or None}
+    if calls:
+        message["tool_calls"] = [calls[index] for index in sorted(calls)]
+    if legacy_call:
+        message["function_call"] = legacy_call
+    yield {"type": "message", "message": message}
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+async def run_tool_calls(calls: List[Dict], execute: Callable[[str, Dict], Awaitable[Any]],
+                         timeout: float = 20.0) -> List[Dict]:
+    """Ejecuta en paralelo las llamadas a herramientas de un turno del modelo.
+
+    Las llamadas de un mismo turno son independientes entre sí (si una
+    dependiera de otra, el modelo la pediría en el turno siguiente), así que
+    se lanzan todas a la vez, cada una con su propio `timeout`. Un error o un
+    timeout no cancela las demás: se devuelve como resultado de esa llamada
+    para que el modelo lo vea. El orden de los resultados es el de `calls`.
+    """
+    async def run_one(call: Dict) -> Dict:
+        name = call["function"]["name"]
+        args: Dict = {}
+        error = None
+        started = time.perf_counter()
+        try:
+            args = json.loads(call["function"].get("arguments") or "{}")
+            output = await asyncio.wait_for(execute(name, args), timeout)
+        except asyncio.TimeoutError:
+            error = "timeout"
+            output = {"error": f"La herramienta '{name}' no respondió en {timeout:g} s"}
+        except json.JSONDecodeError:
+            error = "invalid_arguments"
+            output = {"error": f"Argumentos inválidos para '{name}'"}
+        except Exception as e:
+            error = str(e)
+            output = {"error": str(e)}
+        return {
+            "id": call.get("id"),
+            "name": name,
+            "arguments": args,
+            "output": output,
+            "error": error,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    return list(await asyncio.gather(*(run_one(call) for call in calls)))
+
+
+def tool_messages(message: Dict, records: List[Dict]) -> List[Dict]:
+    """Mensaje del asistente con sus llamadas y un mensaje "tool" por resultado"""
+    return [
+        {"role": "assistant", "content": message.get("content"), "tool_calls": message["tool_calls"]},
+        *({
+            "role": "tool",
+            "tool_call_id": record["id"],
+            "content": json.dumps(record["output"], ensure_ascii=False, default=str),
+        } for record in records),
+    ]
+
+
+def render_results(records: List[Dict], renderers: Dict[str, Optional[Callable[[Dict, Any], str]]]) -> Optional[str]:
+    """Respuesta final armada localmente con el renderer de cada herramienta.
+
+    Devuelve None (hace falta otra vuelta al modelo) si alguna herramienta
+    del turno no tiene renderer o está marcada con None, si falló, o si su
+    resultado no tiene la forma que el renderer espera.
+    """
+    parts = []
+    for record in records:
+        renderer = renderers.get(record["name"])
+        if renderer is None or record["error"]:
+            return None
+        try:
+            parts.append(renderer(record["arguments"], record["output"]))
+        except (KeyError, TypeError, AttributeError, IndexError):
+            return None
+    return "\n".join(parts)
+
+
+def tool_failed(output: Any) -> bool:
+    """Un resultado de herramienta cuenta como fallo si trae success: False o un "error" """
+    return isinstance(output, dict) and (output.get("success") is False or "error" in output)
+
+
+async def single_response(chat: Callable[[Dict], Awaitable[Dict]], payload: Dict) -> AsyncIterator[Dict]:
+    """Adapta una llamada sin streaming a los eventos de `stream_completion`"""
+    result = await chat(payload)
+    yield {"type": "message", "message": result["choices"][0]["message"], "cached": result.get("cached", False)}
+
+
+async def chat_rounds(messages: List[Dict], payload: Callable[[int], Dict],
+                      chat: Callable[[Dict], AsyncIterator[Dict]],
+                      execute: Callable[[str, Dict], Awaitable[Any]],
+                      renderers: Optional[Dict[str, Optional[Callable[[Dict, Any], str]]]],
+                      timeout: float, fallback: str,
+                      stage: Callable[[str], Any] = lambda name: nullcontext(),
+                      max_rounds: int = 3) -> AsyncIterator[Tuple[str, Dict]]:
+    """Vueltas de modelo y herramientas de una petición de chat, como eventos.
+
+    `payload(vueltas)` arma la petición de cada vuelta y `chat(payload)`
+    produce los eventos de `stream_completion` (tokens y el mensaje final).
+    Mientras el modelo pida herramientas se ejecutan todas las del turno y
+    sus resultados vuelven en la siguiente petición, salvo que `renderers`
+    arme la respuesta final sin el modelo. Produce (tipo, datos):
+    "token", "tool_call", "tool_result" y al final "done" con la respuesta,
+    las llamadas ejecutadas (`records` y las de la última vuelta en
+    `last_round`), si se armó localmente y los aciertos de caché. Las
+    rutas de streaming reenvían los eventos; las demás solo esperan "done".
+    `messages` se extiende con las llamadas y sus resultados. Tras
+    `max_rounds` vueltas de herramientas no se ejecutan más aunque el
+    modelo las pida (p. ej. un backend que ignora `tool_choice: "none"`):
+    se responde con su texto o con `fallback`.
+
+    `stage(nombre)` mide cada etapa. Solo conviene pasarlo si el generador
+    se recorre dentro de una sola tarea: los spans abiertos durante un
+    `yield` no pueden cerrarse desde otra (como hace `runtime.iterate`).
+    """
+    cache_hits = []
+    records = []   # todas las llamadas a herramientas ejecutadas
+    round_records = []
+    rendered = None
+    rounds = 0
+    while True:
+        message = None
+        # Primera llamada al modelo y las que siguen a resultados de herramientas, por separado
+        with stage("llm" if rounds == 0 else "llm_followup"):
+            async for event in chat(payload(rounds)):
+                if event["type"] == "token":
+                    yield "token", {"text": event["text"]}
+                else:
+                    message = event["message"]
+                    cache_hits.append(event.get("cached", False))
+        if not message.get("tool_calls") or rounds >= max_rounds:
+            response = message.get("content") or fallback
+            break
+
+        for call in message["tool_calls"]:
+            yield "tool_call", {
+                "id": call["id"],
+                "name": call["function"]["name"],
+                "arguments": call["function"]["arguments"]
+            }
+        # Todas las llamadas del turno a la vez; los resultados vuelven en una sola petición
+        with stage("tools"):
+            round_records = await run_tool_calls(message["tool_calls"], execute, timeout)
+        records.extend(round_records)
+        rounds += 1
+        for record in round_records:
+            yield "tool_result", record
+
+        # Resultados predecibles: la respuesta se arma aquí, sin otra vuelta al modelo
+        rendered = render_results(round_records, renderers) if renderers else None
+        if rendered is not None:
+            response = rendered
+            yield "token", {"text": rendered}
+            break
+
+        messages.extend(tool_messages(message, round_records))
+
+    yield "done", {
+        "response": response,
+        "records": records,
+        "last_round": round_records,
+        "rendered": rendered is not None,
+        "cache_hits": cache_hits,
+    }
+
+
+def chat_response(session_id: str, prompt_tokens: int, done: Dict) -> Dict:
+    """Cuerpo de la respuesta de chat a partir del evento "done" de `chat_rounds`"""
+    records = done["records"]
+    return {
+        "response": done["response"],
+        "session_id": session_id,
+        "tool_used": bool(records),
+        # Compatibilidad: la última herramienta ejecutada; el detalle completo va en tool_calls
+        "tool_name": records[-1]["name"] if records else None,
+        "output": records[-1]["output"] if records else None,
+        "tool_calls": records,
+        "rendered": done["rendered"],  # respuesta final armada sin el modelo
+        "prompt_tokens": prompt_tokens,
+        "cache": {"hits": sum(done["cache_hits"]), "calls": len(done["cache_hits"])}
+    }
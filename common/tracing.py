@@ -0,0 +1,237 @@
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional
+
+TRACE_HEADER = "X-Debug-Trace"      # cualquier valor: la respuesta incluye la línea de tiempo
+PROFILE_HEADER = "X-Debug-Profile"  # cualquier valor: además se muestrean las pilas mientras dura
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_parent: ContextVar[Optional[int]] = ContextVar("trace_parent", default=None)
+
+
+class Trace:
+    """Spans de una petición: nombre, inicio relativo, duración y span padre"""
+
+    def __init__(self, path: str = ""):
+        self.id = uuid.uuid4().hex[:16]
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.profiler: Optional["SamplingProfiler"] = None
+
+    def add(self, name: str, start: float, end: float, attrs: Dict, parent: Optional[int] = None) -> int:
+        index = len(self.spans)
+        self.spans.append({
+            "id": index,
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+            "parent": parent,
+            **({"attrs": attrs} if attrs else {}),
+        })
+        return index
+
+    def timeline(self) -> Dict:
+        spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "id": self.id,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": spans,
+        }
+
+    def server_timing(self) -> str:
+        """Cabecera Server-Timing: duración sumada por nombre de span, más el total"""
+        totals: "OrderedDict[str, float]" = OrderedDict()
+        for span in self.spans:
+            name = re.sub(r"[^A-Za-z0-9_.\-]", "_", span["name"])
+            totals[name] = totals.get(name, 0.0) + span["duration_ms"]
+        parts = [f"{name};dur={duration:.2f}" for name, duration in totals.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(parts)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "histogram", "labels", "attrs", "_trace", "_started", "_index", "_token")
+
+    def __init__(self, name: str, histogram, labels, attrs: Dict, trace: Optional[Trace]):
+        self.name = name
+        self.histogram = histogram
+        self.labels = labels
+        self.attrs = attrs
+        self._trace = trace
+        self._token = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        if self._trace is not None:
+            # Se reserva el lugar ya, para que los spans internos lo tengan como padre
+            self._index = self._trace.add(self.name, self._started, self._started, self.attrs, _parent.get())
+            self._token = _parent.set(self._index)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        if self.histogram is not None:
+            self.histogram.observe(ended - self._started, *self.labels)
+        if self._trace is not None:
+            _parent.reset(self._token)
+            entry = self._trace.spans[self._index]
+            entry["duration_ms"] = round((ended - self._started) * 1000, 2)
+            if exc_type is not None:
+                entry["error"] = exc_type.__name__
+        return False
+
+
+def span(name: str, histogram=None, labels: Optional[Iterable[str]] = None, **attrs):
+    """Mide un bloque: `with span("llm", stage_seconds):`.
+
+    Anota la duración en `histogram` (con `labels`, por defecto el nombre)
+    y, solo si la petición actual se está trazando, agrega un span. Sin
+    traza ni histograma devuelve un objeto que no hace nada.
+    """
+    trace = _trace.get()
+    if trace is None and histogram is None:
+        return _NOOP
+    return Span(name, histogram, tuple(labels) if labels is not None else (name,), attrs, trace)
+
+
+def record(name: str, elapsed: float, **attrs):
+    """Agrega un span ya medido (termina ahora y duró `elapsed` segundos), si hay traza"""
+    trace = _trace.get()
+    if trace is not None:
+        ended = time.perf_counter()
+        trace.add(name, ended - elapsed, ended, attrs, _parent.get())
+
+
+class SamplingProfiler:
+    """Muestrea las pilas de unos hilos cada `interval` segundos (con sys._current_frames).
+
+    No instrumenta nada: un hilo aparte mira dónde está cada hilo
+    observado y cuenta pilas iguales. El resultado está en formato
+    "folded" (una pila por línea, `hilo;f1;f2 cuenta`), el que leen
+    flamegraph.pl y speedscope.
+    """
+
+    def __init__(self, threads: Dict[int, str], interval: float = 0.005, max_seconds: float = 60.0):
+        self.threads = threads  # id de hilo -> nombre para mostrar
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, label in self.threads.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(label)
+                self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+            if time.perf_counter() - self._started > self.max_seconds:
+                return
+
+    def stop(self) -> Dict:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return {
+            "interval_ms": self.interval * 1000,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 1),
+            "samples": self._samples,
+            "threads": list(self.threads.values()),
+            "folded": "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()),
+        }
+
+
+class RequestTracer:
+    """Activa traza y perfilado por petición según sus cabeceras.
+
+    Los servidores llaman a `start()` al recibir la petición (devuelve
+    None, el caso normal, si no trae las cabeceras de depuración) y a
+    `finish()` antes de responder, que agrega `Server-Timing` y
+    `X-Trace-Id` a las cabeceras y devuelve la línea de tiempo. Los
+    perfiles quedan en memoria (los últimos `max_profiles`) para
+    descargarlos en /debug/profiles/<id>.
+    """
+
+    def __init__(self, enabled: bool = True, profiling: bool = False, interval: float = 0.005,
+                 max_profiles: int = 20, threads: Callable[[], Dict[int, str]] = lambda: {}):
+        self.enabled = enabled
+        self.profiling = profiling
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self._threads = threads  # hilos a muestrear además del de la petición
+        self._profiles: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, headers, path: str = "") -> Optional[Trace]:
+        profiled = self.profiling and headers.get(PROFILE_HEADER) is not None
+        if not profiled and not (self.enabled and headers.get(TRACE_HEADER) is not None):
+            return None
+        trace = Trace(path)
+        _trace.set(trace)
+        _parent.set(None)
+        if profiled:
+            threads = {threading.get_ident(): "request", **self._threads()}
+            trace.profiler = SamplingProfiler(threads, self.interval).start()
+        return trace
+
+    def finish(self, trace: Trace, headers) -> Dict:
+        _trace.set(None)
+        timeline = trace.timeline()
+        if trace.profiler is not None:
+            profile = {"id": trace.id, "path": trace.path, "created": time.time(), **trace.profiler.stop()}
+            trace.profiler = None
+            with self._lock:
+                self._profiles[trace.id] = profile
+                while len(self._profiles) > self.max_profiles:
+                    self._profiles.popitem(last=False)
+            timeline["profile_url"] = f"/debug/profiles/{trace.id}"
+        headers["Server-Timing"] = trace.server_timing()
+        headers["X-Trace-Id"] = trace.id
+        return timeline
+
+    def profile(self, profile_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def profiles(self) -> List[Dict]:
+        """Perfiles guardados, sin las pilas"""
+        with self._lock:
+            return [{k: v for k, v in p.items() if k != "folded"} for p in reversed(self._profiles.values())]
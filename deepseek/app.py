@@ -1,22 +1,196 @@
-from flask import Flask, request, jsonify
-from collections import defaultdict
-import requests
-import json
+from flask import Flask, Response, g, request, jsonify
 import asyncio
+import json
+import os
+import sys
 import httpx
+from contextlib import nullcontext
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # raíz del repo (common/)
+from common.runtime import runtime
+from common.http_clients import ClientRegistry, UpstreamConfig
+from common.resilience import CircuitOpenError
+from common.github import RepoSearchCache
+from common.health import HealthMonitor
+from common.metrics import CONTENT_TYPE, MetricsRegistry, RouteMetrics
+from common.tracing import RequestTracer, span
+from common.history import HistoryStore, SQLiteBackend
+from common.llm_cache import LLMCache
+from common.tools import chat_response, chat_rounds, single_response, tool_failed
+from common.streaming import SSE_HEADERS, sse
+from common.providers import Provider, ProviderPool, providers_from_env
+from common.context import ContextBuilder, estimate_schema_tokens, extractive_summary, summary_request
 
 app = Flask(__name__)
 
+# -------------------------
+# Métricas (GET /metrics)
+# -------------------------
+metrics = MetricsRegistry()
+route_metrics = RouteMetrics(metrics)
+stage_seconds = metrics.histogram("pipeline_stage_duration_seconds", "Duración de cada etapa de /mcp-to-deepseek", ("stage",))
+tool_calls_total = metrics.counter("tool_calls_total", "Herramientas ejecutadas por resultado", ("tool", "outcome"))
+tool_seconds = metrics.histogram("tool_duration_seconds", "Duración de cada herramienta", ("tool",))
+
+# Traza por petición con X-Debug-Trace y perfilado con X-Debug-Profile (ver common/tracing.py)
+request_tracer = RequestTracer(
+    enabled=os.getenv("DEBUG_TRACING", "0") == "1",
+    profiling=os.getenv("DEBUG_PROFILING", "0") == "1",
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    max_profiles=int(os.getenv("PROFILE_HISTORY", "20")),
+    threads=lambda: {runtime.thread_id: "event-loop"} if runtime.thread_id else {}
+)
+
+def stage(name: str):
+    """Mide una etapa del pipeline: histograma en /metrics y span si la petición se traza"""
+    return span(name, stage_seconds)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = route_metrics.started()
+    g.trace = request_tracer.start(request.headers, request.path)
+
+@app.after_request
+def finish_response(response):
+    g.response_status = response.status_code
+    trace = g.pop("trace", None)
+    if trace is not None:
+        timeline = request_tracer.finish(trace, response.headers)
+        # La línea de tiempo viaja en el cuerpo de las respuestas JSON; en streaming solo Server-Timing
+        if response.is_json and not response.is_streamed:
+            body = response.get_json()
+            if isinstance(body, dict):
+                response.set_data(app.json.dumps({**body, "trace": timeline}))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # teardown corre siempre, también si la vista lanzó una excepción
+    trace = g.pop("trace", None)
+    if trace is not None:
+        request_tracer.finish(trace, {})
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        route_metrics.finished(route, request.method, g.get("response_status", 500), started)
+
 # -------------------------
 # Configuración de DeepSeek
 # -------------------------
-DEEPSEEK_API_KEY = "api-key"  
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
+DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "api-key")
+DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://api.deepseek.com/v1/chat/completions")
+
+# Pools de conexiones persistentes, con reintentos y circuit breaker por servicio (ver common/http_clients.py)
+http_clients = ClientRegistry(metrics)
+http_clients.register(UpstreamConfig.from_env("deepseek", timeout=60.0, retry_post=True))
+http_clients.register(UpstreamConfig.from_env("github", base_url=os.getenv("GITHUB_API_URL", "https://api.github.com")))
+
+# Búsquedas de repositorios con caché y revalidación por ETag (ver common/github.py)
+repo_search = RepoSearchCache(
+    http_clients,
+    ttl=float(os.getenv("GITHUB_CACHE_TTL", "600")),
+    token=os.getenv("GITHUB_TOKEN", "")
+)
+
+# DeepSeek primero; OpenAI entra como respaldo si OPENAI_API_KEY está definida.
+# Cobertura tras el p95 (LLM_HEDGE) y conmutación si un backend falla (ver common/providers.py)
+llm_providers = ProviderPool(
+    providers_from_env(Provider("deepseek", DEEPSEEK_API_URL, DEEPSEEK_API_KEY, os.getenv("DEEPSEEK_MODEL", "deepseek-chat"))),
+    http_clients,
+    hedge=os.getenv("LLM_HEDGE", "1") == "1",
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "3")),
+    cooldown=float(os.getenv("LLM_FAILOVER_COOLDOWN", "30"))
+)
+
+# Caché de respuestas: LLM_CACHE_MODE="off", "all" o "deterministic" (solo llamadas a herramientas puras)
+llm_cache = LLMCache(
+    mode=os.getenv("LLM_CACHE_MODE", "off"),
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "300")),
+    pure_tools={"sumar", "buscar_repos"},
+    provider=llm_providers.providers[0].name  # las respuestas de un respaldo no se guardan
+)
+
+async def deepseek_chat(payload: dict) -> dict:
+    """Llama a DeepSeek o a su respaldo (o devuelve la respuesta guardada) y devuelve la respuesta completa"""
+    cached = llm_cache.get(payload)
+    if cached is not None:
+        return cached
+    result = await llm_providers.chat(payload)  # lanza httpx.HTTPStatusError con 4xx/5xx
+    if not result.get("choices"):
+        raise ValueError("Respuesta inválida de DeepSeek")
+    llm_cache.put(payload, result)
+    return result
+
+# Comprobación periódica de los backends del modelo; /health solo lee la última foto
+health_monitor = HealthMonitor(runtime)
+for provider in llm_providers.providers:
+    health_monitor.add(
+        f"llm:{provider.name}",
+        partial(llm_providers.ping, provider.name),
+        interval=float(os.getenv("LLM_PROBE_INTERVAL", "60")),
+        timeout=5.0
+    )
 
 # --------------------------
 # Almacenamiento de conversaciones
 # --------------------------
-conversation_history = defaultdict(list)
+# Últimos mensajes por sesión; las sesiones menos usadas se expulsan (ver common/history.py).
+# Con HISTORY_DB el historial se persiste en SQLite y sobrevive a reinicios.
+# Cuántos de ellos se envían en cada petición lo decide el presupuesto de tokens.
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "50"))
+HISTORY_DB = os.getenv("HISTORY_DB", "")
+conversation_history = HistoryStore(
+    max_turns=HISTORY_MAX_TURNS,
+    max_sessions=int(os.getenv("HISTORY_MAX_SESSIONS", "10000")),
+    idle_ttl=float(os.getenv("HISTORY_IDLE_TTL", "86400")),
+    max_bytes=int(os.getenv("HISTORY_MAX_BYTES", str(64 * 1024 * 1024))),
+    backend=SQLiteBackend(HISTORY_DB, keep_turns=HISTORY_MAX_TURNS) if HISTORY_DB else None,
+    cache_ttl=float(os.getenv("HISTORY_CACHE_TTL", "0"))
+)
+
+async def deepseek_chat_stream(payload: dict):
+    """Como deepseek_chat, pero entregando los tokens a medida que llegan"""
+    cached = llm_cache.get(payload)
+    if cached is not None:
+        message = cached["choices"][0]["message"]
+        if message.get("content"):
+            yield {"type": "token", "text": message["content"]}
+        yield {"type": "message", "message": message, "cached": True}
+        return
+    async for event in llm_providers.stream(payload):
+        if event["type"] == "message":
+            llm_cache.put(payload, {"choices": [{"message": event["message"]}], "provider": event.get("provider")})
+        yield event
+
+# --------------------------
+# Contexto de cada petición
+# --------------------------
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # tokens máximos del prompt
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "300"))  # tokens para el resumen de turnos antiguos
+CONTEXT_SUMMARIZER = os.getenv("CONTEXT_SUMMARIZER", "llm")  # "llm" o "extractive"
+
+async def summarize_history(previous: str, messages: list[dict]) -> str:
+    """Actualiza el resumen de los turnos que ya no caben en el prompt"""
+    if CONTEXT_SUMMARIZER == "llm":
+        try:
+            result = await llm_providers.chat({
+                "model": "deepseek-chat",
+                "messages": summary_request(previous, messages),
+                "max_tokens": CONTEXT_SUMMARY_TOKENS
+            })
+            return result["choices"][0]["message"]["content"]
+        except Exception as e:
+            app.logger.warning(f"Resumen con el modelo falló, se usa el extractivo: {str(e)}")
+    return extractive_summary(previous, messages)
+
+context_builder = ContextBuilder(
+    budget=CONTEXT_TOKEN_BUDGET,
+    summary_budget=CONTEXT_SUMMARY_TOKENS,
+    summarize=summarize_history,
+    schedule=runtime.submit
+)
 
 # --------------------------
 # Definición de herramientas
@@ -27,24 +201,17 @@ def sumar(a: int, b: int) -> dict:
 
 async def buscar_repos(query: str) -> list[dict]:
     """Busca repositorios en GitHub y retorna su información"""
-    async with httpx.AsyncClient() as client:
-        try:
-            url = f"https://api.github.com/search/repositories?q={query}"
-            response = await client.get(
-                url, 
-                headers={"Accept": "application/vnd.github.v3+json"}
-            )
-            response.raise_for_status()
-            data = response.json()
-            return [{
-                'name': repo['full_name'],
-                'description': repo['description'],
-                'url': repo['html_url'],
-                'stars': repo['stargazers_count'],
-                'language': repo['language']
-            } for repo in data.get('items', [])[:5]]
-        except httpx.HTTPStatusError as e:
-            return {"error": f"Error al buscar repositorios: {str(e)}"}
+    try:
+        repos = await repo_search.search(query, limit=5)
+        return [{
+            'name': repo['full_name'],
+            'description': repo['description'],
+            'url': repo['html_url'],
+            'stars': repo['stargazers_count'],
+            'language': repo['language']
+        } for repo in repos]
+    except httpx.HTTPStatusError as e:
+        return {"error": f"Error al buscar repositorios: {str(e)}"}
 
 # -------------------------------
 # Lista de herramientas para DeepSeek
@@ -80,12 +247,44 @@ tools = [
         }
     }
 ]
+TOOLS_TOKENS = estimate_schema_tokens(tools)
+TOOL_MAX_ITERATIONS = int(os.getenv("TOOL_MAX_ITERATIONS", "3"))  # vueltas de herramientas por petición
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "20"))  # segundos por llamada a herramienta
+
+async def execute_tool(name: str, args: dict):
+    """Ejecuta una herramienta pedida por DeepSeek y anota su duración y resultado"""
+    label = name if name in tool_renderers else "unknown"  # nombres inventados por el modelo no crean series
+    outcome = "error"
+    with span(f"tool.{label}", tool_seconds, (label,)):
+        try:
+            output = await dispatch_tool(name, args)
+            outcome = "error" if tool_failed(output) else "ok"
+            return output
+        except asyncio.CancelledError:
+            outcome = "cancelled"  # timeout de la herramienta
+            raise
+        finally:
+            tool_calls_total.inc(label, outcome)
+
+async def dispatch_tool(name: str, args: dict):
+    if name == "sumar":
+        return sumar(**args)
+    if name == "buscar_repos":
+        return await buscar_repos(**args)
+    raise ValueError(f"Función '{name}' no permitida")
+
+# Respuesta final armada sin segunda llamada a DeepSeek (TOOL_RENDERERS=0 la desactiva).
+# None: la respuesta la redacta el modelo.
+TOOL_RENDERERS = os.getenv("TOOL_RENDERERS", "1") == "1"
+tool_renderers = {
+    "sumar": lambda args, output: f"{args['a']} + {args['b']} = {output['resultado']}",
+    "buscar_repos": None,  # descripciones libres: el modelo las resume mejor
+}
 
 # ---------------------
 # Endpoint principal
 # ---------------------
 @app.route("/mcp-to-deepseek", methods=["POST"])
-@app.route("/mcp-to-deepseek", methods=["POST"])
 def mcp_to_deepseek():
     # Validación de entrada
     if not request.is_json:
@@ -98,123 +297,130 @@ def mcp_to_deepseek():
     if not user_input:
         return jsonify({"error": "El campo 'input' es requerido"}), 400
 
-    # Preparar mensajes
-    messages = conversation_history[session_id].copy()
-    messages.insert(0, {"role": "system", "content": "Eres un asistente útil."})
-    messages.append({"role": "user", "content": user_input})
-
-    # Configurar tools solo si no es saludo
-    use_tools = not user_input.lower().startswith(('hola', 'hi', 'hello'))
-    
-    payload = {
-        "model": "deepseek-chat",
-        "messages": messages,
-        "tools": tools if use_tools else None,
-        "tool_choice": "auto" if use_tools else None
-    }
-
-    headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    body, status = runtime.run(handle_mcp_to_deepseek(user_input, session_id))
+    return jsonify(body), status
 
+async def handle_mcp_to_deepseek(user_input: str, session_id: str):
     try:
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload)
-        response.raise_for_status()  # Esto lanzará error para códigos 4xx/5xx
-        result = response.json()
-    except requests.exceptions.HTTPError as err:
-        return jsonify({
+        async for kind, event in answer(user_input, session_id, partial(single_response, deepseek_chat), stage):
+            if kind == "done":
+                return event, 200
+    except httpx.HTTPStatusError as err:
+        return {
             "error": f"Error en la API: {err.response.status_code}",
             "details": err.response.text
-        }), 500
+        }, 500
+    except CircuitOpenError as e:
+        return {"error": str(e)}, 503
     except Exception as e:
-        return jsonify({"error": f"Error de conexión: {str(e)}"}), 500
-
-    # Verificar respuesta de DeepSeek
-    if "choices" not in result or not result["choices"]:
-        return jsonify({"error": "Respuesta inválida de DeepSeek"}), 500
-
-    message = result["choices"][0]["message"]
-    tool_used = False
-    tool_name = None
-    output = None
-
-    # Caso 1: Respuesta directa (sin herramientas)
-    if "tool_calls" not in message or not message["tool_calls"]:
-        response_message = message.get("content", "No puedo responder a eso")
-    else:
-        # Caso 2: Uso de herramientas
-        tool_call = message["tool_calls"][0]
-        func_name = tool_call["function"]["name"]
-        func_args = json.loads(tool_call["function"]["arguments"])
+        return {"error": f"Error de conexión: {str(e)}"}, 500
 
-        try:
-            if func_name == "sumar":
-                output = sumar(**func_args)
-            elif func_name == "buscar_repos":
-                output = asyncio.run(buscar_repos(**func_args))
-            else:
-                return jsonify({"error": f"Función '{func_name}' no permitida"}), 400
-            
-            tool_used = True
-            tool_name = func_name
-
-            # Segunda llamada a DeepSeek con el resultado
-            second_payload = {
-                "model": "deepseek-chat",
-                "messages": [
-                    *messages,
-                    {
-                        "role": "assistant",
-                        "content": None,
-                        "tool_calls": [
-                            {
-                                "id": tool_call["id"],
-                                "type": "function",
-                                "function": {
-                                    "name": func_name,
-                                    "arguments": tool_call["function"]["arguments"]
-                                }
-                            }
-                        ]
-                    },
-                    {
-                        "role": "tool",
-                        "content": json.dumps(output),
-                        "tool_call_id": tool_call["id"]
-                    }
-                ],
-                "tool_choice": "none"
-            }
+@app.route("/mcp-to-deepseek/stream", methods=["POST"])
+def mcp_to_deepseek_stream():
+    """Igual que /mcp-to-deepseek, pero responde con Server-Sent Events a medida que llegan los tokens"""
+    if not request.is_json:
+        return jsonify({"error": "Se esperaba JSON"}), 400
+    data = request.get_json()
+    if not data.get("input"):
+        return jsonify({"error": "El campo 'input' es requerido"}), 400
 
-            second_response = requests.post(DEEPSEEK_API_URL, headers=headers, json=second_payload)
-            second_response.raise_for_status()
-            final_result = second_response.json()
-            response_message = final_result["choices"][0]["message"]["content"]
-            
-        except Exception as e:
-            return jsonify({"error": f"Error procesando herramienta: {str(e)}"}), 500
+    events = runtime.iterate(stream_mcp_to_deepseek(data["input"], data.get("session_id", "default")))
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+async def stream_mcp_to_deepseek(user_input: str, session_id: str):
+    """Eventos SSE: token, tool_call, tool_result, done (respuesta completa) y error"""
+    try:
+        async for kind, event in answer(user_input, session_id, deepseek_chat_stream):
+            yield sse(kind, event)
+    except httpx.HTTPStatusError as err:
+        yield sse("error", {"error": f"Error en la API: {err.response.status_code}", "details": err.response.text})
+    except Exception as e:
+        yield sse("error", {"error": f"Error de conexión: {str(e)}"})
+
+async def answer(user_input: str, session_id: str, chat, stage=lambda name: nullcontext()):
+    """Eventos de una petición de chat (ver common/tools.chat_rounds); "done" trae la respuesta completa"""
+    # Configurar tools solo si no es saludo
+    use_tools = not user_input.lower().startswith(('hola', 'hi', 'hello'))
+
+    # Preparar mensajes dentro del presupuesto de tokens
+    with stage("context"):
+        messages, prompt_tokens = context_builder.build(
+            session_id,
+            "Eres un asistente útil.",
+            await conversation_history.get(session_id),
+            {"role": "user", "content": user_input},
+            reserved=TOOLS_TOKENS if use_tools else 0
+        )
 
-    # Guardar en el historial de conversación
-    conversation_history[session_id].extend([
-        {"role": "user", "content": user_input},
-        {"role": "assistant", "content": response_message}
-    ])
+    def payload(rounds: int) -> dict:
+        return {
+            "model": "deepseek-chat",
+            "messages": messages,
+            "tools": tools if use_tools else None,
+            # En la última vuelta permitida el modelo debe responder sin herramientas
+            "tool_choice": ("auto" if rounds < TOOL_MAX_ITERATIONS else "none") if use_tools else None
+        }
+
+    async for kind, event in chat_rounds(messages, payload, chat, execute_tool,
+                                         tool_renderers if TOOL_RENDERERS else None,
+                                         TOOL_CALL_TIMEOUT, "No puedo responder a eso", stage,
+                                         max_rounds=TOOL_MAX_ITERATIONS):
+        if kind != "done":
+            yield kind, event
+            continue
 
-    # Limitar el historial para no sobrecargar la memoria
-    if len(conversation_history[session_id]) > 10:
-        conversation_history[session_id] = conversation_history[session_id][-10:]
+        # Guardar en el historial de conversación
+        with stage("history"):
+            await conversation_history.append(
+                session_id,
+                {"role": "user", "content": user_input},
+                {"role": "assistant", "content": event["response"]}
+            )
+        yield "done", chat_response(session_id, prompt_tokens, event)
 
+@app.route("/health")
+def health_check():
+    """Estado del servidor y reutilización de conexiones"""
     return jsonify({
-        "response": response_message,
-        "session_id": session_id,
-        "tool_used": tool_used,
-        "tool_name": tool_name,
-        "output": output
+        "flask": "running",
+        "probes": health_monitor.snapshot(),
+        "http_clients": http_clients.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_providers": llm_providers.stats(),
+        "repo_search": repo_search.stats()
     })
 
+@app.route("/metrics")
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route("/debug/profiles")
+def debug_profiles():
+    """Perfiles guardados (pedidos con la cabecera X-Debug-Profile)"""
+    return jsonify(request_tracer.profiles())
+
+@app.route("/debug/profiles/<profile_id>")
+def debug_profile(profile_id: str):
+    """Pilas muestreadas en formato folded (flamegraph.pl, speedscope)"""
+    profile = request_tracer.profile(profile_id)
+    if profile is None:
+        return Response(f"Perfil '{profile_id}' desconocido\n", status=404, content_type="text/plain; charset=utf-8")
+    return Response(profile["folded"] + "\n", content_type="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'})
+
+@app.route("/history-stats")
+def history_stats():
+    """Sesiones y memoria ocupada por el historial de conversaciones"""
+    return jsonify({**conversation_history.stats(), "context": context_builder.stats()})
+
 # ---------------------
 # Ejecutar servidor
 # ---------------------
+def start_background_services():
+    """Arranca las tareas de fondo (sondas de salud de los proveedores)"""
+    health_monitor.start()
+
 if __name__ == "__main__":
+    start_background_services()
     app.run(port=5000, debug=True)
\ No newline at end of file
@@ -3,6 +3,8 @@ import json
 from uuid import uuid4
 
 API_URL = "http://localhost:5000/mcp-to-deepseek"
+STREAM_URL = f"{API_URL}/stream"
+STREAMING = True  # mostrar la respuesta a medida que llega
 SESSION_ID = str(uuid4())
 
 def print_colored(text, color):
@@ -16,6 +18,42 @@ def print_colored(text, color):
     }
     print(f"{colors.get(color, '')}{text}{colors['end']}")
 
+def iter_sse(response):
+    """Recorre los eventos (nombre, datos) de una respuesta Server-Sent Events"""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data))
+            event, data = None, []
+
+def stream_chat(payload):
+    """Imprime la respuesta del asistente token por token"""
+    with requests.post(STREAM_URL, json=payload, stream=True, timeout=(5, 60)) as response:
+        if response.status_code != 200:
+            print_colored(f"\nError {response.status_code}:", "red")
+            print_colored(response.text, "red")
+            return
+
+        writing = False
+        for event, data in iter_sse(response):
+            if event == "token":
+                if not writing:
+                    print("\n\033[92mAsistente: ", end="")
+                    writing = True
+                print(data["text"], end="", flush=True)
+            elif event == "tool_call":
+                print_colored(f"\n[Herramienta: {data['name']}({data['arguments']})]", "yellow")
+            elif event == "tool_result":
+                print_colored(f"[Resultado: {json.dumps(data['output'], indent=2, ensure_ascii=False)}]", "yellow")
+            elif event == "error":
+                print_colored(f"\nError: {data['error']}", "red")
+            elif event == "done" and writing:
+                print("\033[0m")
+
 def chat():
     print_colored("\nBienvenido al chat con DeepSeek", "blue")
     print_colored(f"Session ID: {SESSION_ID}", "yellow")
@@ -33,6 +71,10 @@ def chat():
                 "session_id": SESSION_ID
             }
 
+            if STREAMING:
+                stream_chat(payload)
+                continue
+
             response = requests.post(
                 API_URL,
                 headers={"Content-Type": "application/json"},
@@ -1,32 +1,164 @@
-from flask import Flask, request, jsonify
-from typing import List, Dict, Any, Optional
-from collections import defaultdict
-import requests
+from flask import Flask, Response, g, request, jsonify
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 import json
 import asyncio
 import httpx
-import subprocess
 import os
+import sys
 import time
-from functools import wraps
-import websockets
+from contextlib import nullcontext
+from functools import partial, wraps
 import time
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # raíz del repo (common/)
+from contacts import ContactDirectory
+from inbound import InboundPipeline
+from ingest import MessageIngestor
+from intents import IntentRouter
+from outbound import OutboundQueue
+from supervisor import ProcessSupervisor
+from common.runtime import runtime
+from common.http_clients import ClientRegistry, UpstreamConfig
+from common.resilience import CircuitOpenError
+from common.github import RepoSearchCache
+from common.health import HealthMonitor
+from common.metrics import CONTENT_TYPE, MetricsRegistry, RouteMetrics
+from common.tracing import RequestTracer, span
+from common.history import HistoryStore, SQLiteBackend
+from common.llm_cache import LLMCache
+from common.tools import chat_response, chat_rounds, single_response, tool_failed
+from common.streaming import SSE_HEADERS, sse
+from common.providers import Provider, ProviderPool, functions_to_tools, providers_from_env
+from common.context import ContextBuilder, estimate_schema_tokens, extractive_summary, summary_request
+
 # Configuración inicial
 PATH_TO_UV = os.getenv("PATH_TO_UV", "/path/to/uv") #consultar con which uv 
 PATH_TO_SRC = os.getenv("PATH_TO_SRC", "/path/to/whatsapp-mcp") #ruta del repositorio colonado
 WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "http://localhost:8080")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "api-key")
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-nano-2025-04-14")
+CONTACTS_TTL = float(os.getenv("CONTACTS_TTL", "300"))  # segundos entre refrescos de la lista de contactos
+INBOUND_WORKERS = int(os.getenv("INBOUND_WORKERS", "4"))  # respuestas automáticas en paralelo (distintos remitentes)
+INBOUND_PER_SENDER = int(os.getenv("INBOUND_PER_SENDER", "20"))  # mensajes en espera por remitente como máximo
+INBOUND_QUEUE_SIZE = int(os.getenv("INBOUND_QUEUE_SIZE", "500"))  # mensajes entrantes en espera como máximo
+INBOUND_OVERFLOW = os.getenv("INBOUND_OVERFLOW", "reject")  # "reject" o "drop_oldest" con la cola llena
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "50"))  # mensajes guardados por sesión
+HISTORY_MAX_SESSIONS = int(os.getenv("HISTORY_MAX_SESSIONS", "10000"))  # sesiones en memoria (LRU)
+HISTORY_IDLE_TTL = float(os.getenv("HISTORY_IDLE_TTL", "86400"))  # segundos sin actividad antes de expulsar una sesión
+HISTORY_MAX_BYTES = int(os.getenv("HISTORY_MAX_BYTES", str(64 * 1024 * 1024)))  # memoria total del historial
+HISTORY_DB = os.getenv("HISTORY_DB", "")  # archivo SQLite para persistir el historial (vacío = solo memoria)
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "0"))  # releer sesiones del disco tras N segundos (varios workers)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # tokens máximos del prompt (historial + herramientas)
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "300"))  # tokens reservados para el resumen de turnos antiguos
+CONTEXT_SUMMARIZER = os.getenv("CONTEXT_SUMMARIZER", "llm")  # "llm" o "extractive" (sin llamadas extra al modelo)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")  # "off", "all" o "deterministic" (solo llamadas a herramientas puras)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1000"))  # respuestas guardadas como máximo
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "300"))  # segundos que vale una respuesta guardada
+TOOL_MAX_ITERATIONS = int(os.getenv("TOOL_MAX_ITERATIONS", "3"))  # vueltas de herramientas por petición antes de exigir respuesta
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "20"))  # segundos por llamada a herramienta
+TOOL_RENDERERS = os.getenv("TOOL_RENDERERS", "1") == "1"  # respuesta final de herramientas predecibles sin segunda llamada al modelo
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"  # comandos claros (enviar, buscar, sumar) sin pasar por el modelo
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"  # repetir en el otro backend una petición que supera el p95 del primero
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "3"))  # segundos antes de cubrir mientras no hay latencias medidas
+LLM_FAILOVER_COOLDOWN = float(os.getenv("LLM_FAILOVER_COOLDOWN", "30"))  # segundos que un backend caído queda fuera
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "2"))  # envíos simultáneos al bridge
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "1"))  # envíos por segundo en total (promedio)
+OUTBOUND_BURST = int(os.getenv("OUTBOUND_BURST", "5"))  # envíos seguidos permitidos antes de aplicar el ritmo
+OUTBOUND_RECIPIENT_RATE = float(os.getenv("OUTBOUND_RECIPIENT_RATE", "0.2"))  # envíos por segundo a un mismo destinatario
+OUTBOUND_RECIPIENT_BURST = int(os.getenv("OUTBOUND_RECIPIENT_BURST", "3"))  # ráfaga permitida por destinatario
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "1000"))  # envíos en espera como máximo
+OUTBOUND_WAIT_TIMEOUT = float(os.getenv("OUTBOUND_WAIT_TIMEOUT", "30"))  # segundos que espera un envío bloqueante
+# send_message pedido por el modelo: la espera debe terminar antes que TOOL_CALL_TIMEOUT; si no sale a tiempo queda "queued" con su id
+TOOL_SEND_WAIT = min(OUTBOUND_WAIT_TIMEOUT, TOOL_CALL_TIMEOUT / 2)
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "20"))  # mensajes de un envío masivo en la cola a la vez
+BULK_MAX_RECIPIENTS = int(os.getenv("BULK_MAX_RECIPIENTS", "5000"))  # destinatarios por llamada a /send-bulk
+GITHUB_CACHE_TTL = float(os.getenv("GITHUB_CACHE_TTL", "600"))  # segundos que una búsqueda de repos se sirve sin consultar GitHub
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")  # opcional: sube el límite de búsquedas de 10 a 30 por minuto
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")  # otra URL solo para pruebas (bench/stubs.py)
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:8000")  # servidor MCP que arranca control_whatsapp_server
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))  # segundos entre comprobaciones del bridge y del servidor MCP
+LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", "60"))  # segundos entre comprobaciones de los backends del modelo
+SERVER_START_TIMEOUT = float(os.getenv("SERVER_START_TIMEOUT", "15"))  # segundos que se espera a que el servidor MCP responda
+SERVER_LOG_LINES = int(os.getenv("SERVER_LOG_LINES", "1000"))  # líneas de salida del servidor MCP que se guardan en memoria
+SERVER_RESTART_MAX_DELAY = float(os.getenv("SERVER_RESTART_MAX_DELAY", "60"))  # espera máxima entre reinicios si el servidor se cae
+DEBUG_TRACING = os.getenv("DEBUG_TRACING", "0") == "1"  # con 1, la cabecera X-Debug-Trace devuelve la línea de tiempo de la petición
+DEBUG_PROFILING = os.getenv("DEBUG_PROFILING", "0") == "1"  # la cabecera X-Debug-Profile muestrea pilas (solo para diagnóstico)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))  # milisegundos entre muestras del profiler
+PROFILE_HISTORY = int(os.getenv("PROFILE_HISTORY", "20"))  # perfiles que se guardan en memoria para descargar
+INGEST_PING_INTERVAL = float(os.getenv("INGEST_PING_INTERVAL", "20"))  # keepalive del WebSocket de eventos
+INGEST_POLL_MIN = float(os.getenv("INGEST_POLL_MIN", "1"))  # intervalo de polling con tráfico (socket caído)
+INGEST_POLL_MAX = float(os.getenv("INGEST_POLL_MAX", "30"))  # intervalo de polling sin actividad
 
 app = Flask(__name__)
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
 
+# -------------------------
+# Métricas (GET /metrics)
+# -------------------------
+metrics = MetricsRegistry()
+route_metrics = RouteMetrics(metrics)
+stage_seconds = metrics.histogram("pipeline_stage_duration_seconds", "Duración de cada etapa de /mcp-to-openai", ("stage",))
+tool_calls_total = metrics.counter("tool_calls_total", "Herramientas ejecutadas por resultado", ("tool", "outcome"))
+tool_seconds = metrics.histogram("tool_duration_seconds", "Duración de cada herramienta", ("tool",))
+
+# Traza por petición con X-Debug-Trace y perfilado con X-Debug-Profile (ver common/tracing.py).
+# Se muestrea también el hilo del event loop, donde corre el trabajo asíncrono.
+request_tracer = RequestTracer(
+    enabled=DEBUG_TRACING,
+    profiling=DEBUG_PROFILING,
+    interval=PROFILE_INTERVAL_MS / 1000,
+    max_profiles=PROFILE_HISTORY,
+    threads=lambda: {runtime.thread_id: "event-loop"} if runtime.thread_id else {}
+)
+
+def stage(name: str):
+    """Mide una etapa del pipeline: histograma en /metrics y span si la petición se traza"""
+    return span(name, stage_seconds)
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = route_metrics.started()
+    g.trace = request_tracer.start(request.headers, request.path)
+
+@app.after_request
+def finish_response(response):
+    g.response_status = response.status_code
+    trace = g.pop("trace", None)
+    if trace is not None:
+        timeline = request_tracer.finish(trace, response.headers)
+        # La línea de tiempo viaja en el cuerpo de las respuestas JSON; en streaming solo Server-Timing
+        if response.is_json and not response.is_streamed:
+            body = response.get_json()
+            if isinstance(body, dict):
+                response.set_data(app.json.dumps({**body, "trace": timeline}))
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    # teardown corre siempre, también si la vista lanzó una excepción
+    trace = g.pop("trace", None)
+    if trace is not None:
+        request_tracer.finish(trace, {})
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        route_metrics.finished(route, request.method, g.get("response_status", 500), started)
+
 # -------------------------
 # Decoradores de utilidad
 # -------------------------
 def handle_errors(f):
+    if asyncio.iscoroutinefunction(f):
+        @wraps(f)
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await f(*args, **kwargs)
+            except Exception as e:
+                app.logger.error(f"Error en {f.__name__}: {str(e)}")
+                return {"success": False, "error": str(e)}
+        return async_wrapper
+
     @wraps(f)
     def wrapper(*args, **kwargs):
         try:
@@ -55,181 +187,271 @@ def validate_json(*required_fields):
 # -------------------------
 # Almacenamiento de estado
 # -------------------------
-conversation_history = defaultdict(list)
-server_status_cache = {"last_checked": 0, "status": None}
+conversation_history = HistoryStore(
+    max_turns=HISTORY_MAX_TURNS,
+    max_sessions=HISTORY_MAX_SESSIONS,
+    idle_ttl=HISTORY_IDLE_TTL,
+    max_bytes=HISTORY_MAX_BYTES,
+    backend=SQLiteBackend(HISTORY_DB, keep_turns=HISTORY_MAX_TURNS) if HISTORY_DB else None,
+    cache_ttl=HISTORY_CACHE_TTL
+)
 
 # -------------------------
-# Funciones de WhatsApp
+# Clientes HTTP compartidos
 # -------------------------
-from threading import Thread
+# Un pool persistente por servicio; tamaño, keep-alive, timeouts y HTTP/2 se
+# configuran con <SERVICIO>_POOL_SIZE, <SERVICIO>_KEEPALIVE, <SERVICIO>_TIMEOUT y <SERVICIO>_HTTP2.
+# Reintentos y circuit breaker: <SERVICIO>_RETRIES, <SERVICIO>_BREAKER_THRESHOLD y <SERVICIO>_BREAKER_COOLDOWN
+http_clients = ClientRegistry(metrics)
+http_clients.register(UpstreamConfig.from_env("openai", timeout=60.0, retry_post=True))
+http_clients.register(UpstreamConfig.from_env("bridge", base_url=WHATSAPP_API_URL))
+http_clients.register(UpstreamConfig.from_env("github", base_url=GITHUB_API_URL))
 
-def check_new_messages(interval=5):
-    last_check = time.time()
-    while True:
-        try:
-            response = requests.get(
-                f"{WHATSAPP_API_URL}/api/messages?since={int(last_check)}",
-                timeout=10
-            )
-            
-            # Depuración: Imprime la respuesta cruda
-            print(f"🔍 Respuesta del servidor (status {response.status_code}): {response.text[:100]}...")
-            
-            # Verifica si la respuesta es JSON válido
-            try:
-                messages = response.json()
-            except json.JSONDecodeError as e:
-                print(f"❌ El servidor no devolvió JSON válido: {e}")
-                time.sleep(interval)
-                continue
-                
-            # Procesa mensajes
-            for msg in messages:
-                if msg.get("timestamp", 0) > last_check:
-                    print(f"📩 Mensaje válido: {msg}")
-                    asyncio.create_task(process_incoming_message(msg["from"], msg["body"]))
-                    last_check = msg["timestamp"]
-                    
-        except Exception as e:
-            print(f"❌ Error en polling: {str(e)}")
-        time.sleep(interval)
+# Búsquedas de repositorios con caché y revalidación por ETag (ver common/github.py)
+repo_search = RepoSearchCache(http_clients, ttl=GITHUB_CACHE_TTL, token=GITHUB_TOKEN)
 
-async def listen_whatsapp_events():
-    """Conéctate al WebSocket del servidor WhatsApp y escucha mensajes"""
-    ws_url = WHATSAPP_API_URL.replace("http", "ws") + "/events"  # Ej: ws://localhost:8080/events
-    while True:
+# OpenAI primero; DeepSeek entra como respaldo si DEEPSEEK_API_KEY está definida (ver common/providers.py)
+llm_providers = ProviderPool(
+    providers_from_env(Provider("openai", OPENAI_API_URL, OPENAI_API_KEY, OPENAI_MODEL)),
+    http_clients,
+    hedge=LLM_HEDGE,
+    hedge_after=LLM_HEDGE_AFTER,
+    cooldown=LLM_FAILOVER_COOLDOWN
+)
+
+# Respuestas repetidas del modelo; las herramientas puras se pueden volver a decidir sin llamarlo
+llm_cache = LLMCache(
+    mode=LLM_CACHE_MODE,
+    max_entries=LLM_CACHE_SIZE,
+    ttl=LLM_CACHE_TTL,
+    pure_tools={"sumar", "search_contacts", "buscar_repos"},
+    provider=llm_providers.providers[0].name  # las respuestas de un respaldo no se guardan
+)
+
+async def openai_chat(payload: Dict) -> Dict:
+    """Llama al endpoint de chat (OpenAI o su respaldo) y devuelve la respuesta completa"""
+    cached = llm_cache.get(payload)
+    if cached is not None:
+        return cached
+    result = await llm_providers.chat(payload)
+    llm_cache.put(payload, result)
+    return result
+
+async def openai_chat_stream(payload: Dict) -> AsyncIterator[Dict]:
+    """Como openai_chat, pero entrega los tokens a medida que llegan (ver common/streaming.py)"""
+    cached = llm_cache.get(payload)
+    if cached is not None:
+        message = cached["choices"][0]["message"]
+        if message.get("content"):
+            yield {"type": "token", "text": message["content"]}
+        yield {"type": "message", "message": message, "cached": True}
+        return
+    async for event in llm_providers.stream(payload):
+        if event["type"] == "message":
+            llm_cache.put(payload, {"choices": [{"message": event["message"]}], "provider": event.get("provider")})
+        yield event
+
+async def close_http_clients():
+    await http_clients.aclose()
+
+# -------------------------
+# Contexto de cada petición
+# -------------------------
+async def summarize_history(previous: str, messages: List[Dict]) -> str:
+    """Actualiza el resumen de los turnos que ya no caben en el prompt"""
+    if CONTEXT_SUMMARIZER == "llm":
         try:
-            async with websockets.connect(ws_url) as ws:
-                print("✅ Conectado al WebSocket de WhatsApp")
-                while True:
-                    message = await ws.recv()
-                    data = json.loads(message)
-                    if data.get("type") == "message":
-                        print(f"📩 Mensaje recibido: {data}")
-                        asyncio.create_task(
-                            process_incoming_message(data["from"], data["body"])
-                        )
+            result = await openai_chat({
+                "model": OPENAI_MODEL,
+                "messages": summary_request(previous, messages),
+                "max_tokens": CONTEXT_SUMMARY_TOKENS
+            })
+            return result["choices"][0]["message"]["content"]
         except Exception as e:
-            print(f"❌ Error en WebSocket: {e}. Reconectando en 5 segundos...")
-            await asyncio.sleep(5)
-                
+            app.logger.warning(f"Resumen con el modelo falló, se usa el extractivo: {str(e)}")
+    return extractive_summary(previous, messages)
+
+# Llena el presupuesto de tokens del más reciente al más antiguo; lo que no
+# cabe se reemplaza por un resumen que se actualiza en segundo plano
+context_builder = ContextBuilder(
+    budget=CONTEXT_TOKEN_BUDGET,
+    summary_budget=CONTEXT_SUMMARY_TOKENS,
+    summarize=summarize_history,
+    schedule=runtime.submit
+)
+
+# -------------------------
+# Funciones de WhatsApp
+# -------------------------
+async def fetch_messages_since(since: float) -> List[Dict]:
+    """Mensajes recibidos por el bridge a partir de `since` (epoch en segundos)"""
+    response = await http_clients.async_client("bridge").get(
+        "/api/messages", params={"since": int(since)}
+    )
+    response.raise_for_status()
+    return response.json()
+
+def on_incoming_message(sender: str, body: str) -> bool:
+    app.logger.debug(f"📩 Mensaje recibido de {sender}")
+    return inbound_pipeline.submit(sender, body)
+
 async def process_incoming_message(sender: str, message: str):
     """Procesa mensajes entrantes y genera respuestas"""
     try:
         # 1. Prepara el payload para OpenAI
-        messages = conversation_history.get(sender, [])
-        messages.insert(0, {
-            "role": "system",
-            "content": "Eres un asistente de WhatsApp. Responde de forma concisa y útil."
-        })
+        await conversation_history.append(sender, {"role": "user", "content": message})
+        history = await conversation_history.get(sender)
+        messages, prompt_tokens = context_builder.build(
+            sender,
+            "Eres un asistente de WhatsApp. Responde de forma concisa y útil.",
+            history[:-1],
+            history[-1]
+        )
+        app.logger.debug(f"Respuesta automática a {sender}: ~{prompt_tokens} tokens de prompt")
         
         # 2. Llama a OpenAI
-        response = requests.post(
-            OPENAI_API_URL,
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-            json={
-                "model": OPENAI_MODEL,
-                "messages": messages
-            }
-        )
-        response.raise_for_status()
-        ai_response = response.json()["choices"][0]["message"]["content"]
+        result = await openai_chat({
+            "model": OPENAI_MODEL,
+            "messages": messages
+        })
+        ai_response = result["choices"][0]["message"]["content"]
 
         # 3. Envía la respuesta
-        send_response = send_message(sender, ai_response)
+        send_response = await send_message(sender, ai_response)
         if send_response.get("success"):
-            conversation_history[sender].append({
+            await conversation_history.append(sender, {
                 "role": "assistant",
-                "content": ai_response,
-                "timestamp": time.time()
+                "content": ai_response
             })
             
     except Exception as e:
         app.logger.error(f"Error procesando mensaje: {str(e)}")
         # Opcional: Enviar mensaje de error al usuario
-        send_message(sender, "⚠️ Ocurrió un error al procesar tu mensaje")
+        await send_message(sender, "⚠️ Ocurrió un error al procesar tu mensaje")
+
+# Respuestas automáticas: en orden por remitente, en paralelo entre remitentes
+inbound_pipeline = InboundPipeline(
+    process_incoming_message,
+    runtime,
+    workers=INBOUND_WORKERS,
+    maxsize=INBOUND_QUEUE_SIZE,
+    overflow=INBOUND_OVERFLOW,
+    per_sender=INBOUND_PER_SENDER
+)
+
+metrics.gauge("inbound_queue_depth", "Mensajes entrantes esperando respuesta automática",
+              fn=lambda: inbound_pipeline.stats()["queue_depth"])
+
+# WebSocket como vía principal de entrada; polling solo mientras está caído
+message_ingestor = MessageIngestor(
+    WHATSAPP_API_URL.replace("http", "ws", 1) + "/events",  # Ej: ws://localhost:8080/events
+    fetch_messages_since,
+    on_incoming_message,
+    ping_interval=INGEST_PING_INTERVAL,
+    poll_min=INGEST_POLL_MIN,
+    poll_max=INGEST_POLL_MAX
+)
         
 @app.route("/webhook", methods=["POST"])
 def webhook():
     """Endpoint para recibir mensajes entrantes de WhatsApp"""
-    data = request.get_json()
+    body, status = handle_webhook(request.get_json())
+    return jsonify(body), status
+
+def handle_webhook(data: Dict):
     app.logger.info(f"Mensaje recibido: {json.dumps(data, indent=2)}")
 
     # Procesar solo mensajes de texto (ignorar estados, etc.)
     if data.get("type") == "message" and data.get("body"):
         sender = data["from"]
         message = data["body"]
-        
-        # Guardar en historial
-        conversation_history[sender].append({
-            "role": "user",
-            "content": message,
-            "timestamp": time.time()
-        })
 
-        # Procesar mensaje en segundo plano
-        asyncio.create_task(process_incoming_message(sender, message))
+        # Procesar mensaje en segundo plano (también lo guarda en el historial)
+        if not inbound_pipeline.submit(sender, message):
+            return {"status": "rejected", "error": "Cola de mensajes entrantes llena"}, 503
     
-    return jsonify({"status": "received"}), 200
+    return {"status": "received"}, 200
 ##############################################
 
 @app.route("/send-to-contact", methods=["POST"])
 @validate_json("contact_name", "message")
 def send_to_contact():
     """Envía mensaje a un contacto buscándolo por nombre"""
-    data = request.get_json()
+    body, status = runtime.run(handle_send_to_contact(request.get_json()))
+    return jsonify(body), status
+
+async def handle_send_to_contact(data: Dict):
     contact_name = data["contact_name"]
     message = data["message"]
 
     # Busca el contacto
-    contacts = search_contacts(contact_name, limit=1)
+    await ensure_contacts_loaded()
+    contacts = search_contacts(contact_name, limit=1, fuzzy=False)
     if not contacts:
-        return jsonify({
+        return {
             "success": False,
             "error": f"No se encontró el contacto '{contact_name}'"
-        }), 404
+        }, 404
 
-    # Envía el mensaje
+    # Envía el mensaje ("wait": false solo lo encola)
     recipient_jid = contacts[0]["jid"]
-    response = send_message(recipient_jid, message)
+    wait = data.get("wait", True)
+    response = await send_message(recipient_jid, message, wait=wait)
 
-    return jsonify({
+    body = {
         "success": response.get("success", False),
         "message": response.get("message", ""),
         "contact": contacts[0]
-    })
+    }
+    if not wait:
+        return {**body, **queued_fields(response)}, 202 if response.get("success") else 503
+    return body, 200
+
+def queued_fields(response: Dict) -> Dict:
+    """Datos para seguir un envío encolado"""
+    if not response.get("message_id"):
+        return {"status": response.get("status"), "error": response.get("error")}
+    return {
+        "message_id": response["message_id"],
+        "status": response["status"],
+        "status_url": f"/outbound/{response['message_id']}"
+    }
     
-@handle_errors
-def get_contacts() -> List[Dict]:
-    """Obtiene la lista completa de contactos con caché"""
+def fetch_contacts() -> List[Dict]:
+    """Descarga la lista completa de contactos desde el bridge"""
     try:
-        response = requests.get(f"{WHATSAPP_API_URL}/api/contacts", timeout=5)
+        response = http_clients.sync_client("bridge").get("/api/contacts", timeout=5)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         app.logger.error(f"Error al obtener contactos: {str(e)}")
-        return []
+        raise
+
+contact_directory = ContactDirectory(fetch_contacts, ttl=CONTACTS_TTL)
 
 @handle_errors
-def find_contact(search_term: str) -> Optional[Dict]:
-    """Busca un contacto con coincidencia parcial"""
-    contacts = get_contacts()
-    search_term = search_term.lower().strip()
-    
-    # Primero busqueda exacta
-    exact_match = next((c for c in contacts if c["name"].lower() == search_term), None)
-    if exact_match:
-        return exact_match
-    
-    # Luego coincidencias parciales
-    partial_match = next((c for c in contacts if search_term in c["name"].lower()), None)
-    return partial_match
+def get_contacts() -> List[Dict]:
+    """Obtiene la lista completa de contactos desde el directorio en memoria"""
+    return contact_directory.get()
+
+async def ensure_contacts_loaded():
+    """La primera carga del directorio es bloqueante: se hace fuera del event loop"""
+    if not contact_directory.loaded:
+        with span("contacts.load"):
+            await asyncio.to_thread(contact_directory.get)
 
 @handle_errors
-def send_message(recipient: str, message: str) -> Dict:
-    """Envía mensajes aceptando números o nombres de contacto"""
+def find_contact(search_term: str) -> Optional[Dict]:
+    """Busca el contacto que mejor coincide (exacto, prefijo o parcial)"""
+    # Sin coincidencia aproximada: un error de dedo no debe elegir destinatario
+    matches = contact_directory.search(search_term, limit=1, fuzzy=False)
+    return matches[0] if matches else None
+
+async def resolve_recipient(recipient: str) -> Dict:
+    """JID o número normalizado de un destinatario dado por nombre o número"""
     # Si es un nombre (no empieza con dígito)
     if not recipient[0].isdigit():
+        await ensure_contacts_loaded()
         contact = find_contact(recipient)
         if not contact:
             available_contacts = [c["name"] for c in get_contacts()[:3]]
@@ -239,89 +461,150 @@ def send_message(recipient: str, message: str) -> Dict:
             }
         recipient = contact["jid"]
     else:
-        # Normalización de números
-        clean_number = "".join(c for c in recipient if c.isdigit())
-        if not clean_number.startswith('521'):
-            if clean_number.startswith('52'):
-                clean_number = '521' + clean_number[2:]
-            elif clean_number.startswith('1'):
-                clean_number = '521' + clean_number[1:]
-            else:
-                clean_number = '521' + clean_number
-        
-        if len(clean_number) < 12 or len(clean_number) > 13:
+        clean_number = normalize_number(recipient)
+        if clean_number is None:
             return {"success": False, "error": "Formato de número inválido"}
         
         recipient = clean_number
 
-    response = requests.post(
-        f"{WHATSAPP_API_URL}/api/send",
-        json={"recipient": recipient, "message": message},
-        timeout=10
+    return {"success": True, "recipient": recipient}
+
+def normalize_number(number: str) -> Optional[str]:
+    """Número con prefijo 521 (México), o None si el formato no es válido"""
+    clean_number = "".join(c for c in number if c.isdigit())
+    if not clean_number.startswith('521'):
+        if clean_number.startswith('52'):
+            clean_number = '521' + clean_number[2:]
+        elif clean_number.startswith('1'):
+            clean_number = '521' + clean_number[1:]
+        else:
+            clean_number = '521' + clean_number
+
+    if len(clean_number) < 12 or len(clean_number) > 13:
+        return None
+    return clean_number
+
+async def deliver_message(recipient: str, message: str):
+    """Entrega un mensaje al bridge (la llaman los workers de outbound_queue)"""
+    response = await http_clients.async_client("bridge").post(
+        "/api/send",
+        json={"recipient": recipient, "message": message}
     )
     response.raise_for_status()
+
+@handle_errors
+async def send_message(recipient: str, message: str, wait: bool = True,
+                       timeout: float = OUTBOUND_WAIT_TIMEOUT) -> Dict:
+    """Envía mensajes aceptando números o nombres de contacto.
+
+    El envío pasa por la cola con límite de ritmo; con wait=False devuelve
+    en cuanto queda encolado (status "queued") con el id para consultarlo.
+    Con wait=True espera el envío como mucho `timeout` segundos.
+    """
+    with span("contacts.resolve"):
+        resolved = await resolve_recipient(recipient)
+    if not resolved["success"]:
+        return resolved
+    recipient = resolved["recipient"]
+
+    if not wait:
+        message_id = outbound_queue.submit(recipient, message)
+        if message_id is None:
+            return {"success": False, "error": "Cola de envíos llena", "status": "rejected"}
+        return {
+            "success": True,
+            "message": f"Mensaje en cola para {recipient}",
+            "recipient": recipient,
+            "message_id": message_id,
+            "status": "queued"
+        }
+
+    # Espera en la cola más el envío al bridge (lo hace un worker, fuera de esta petición)
+    with span("outbound.send"):
+        delivery = await outbound_queue.send(recipient, message, timeout=timeout)
+    if delivery is None:
+        return {"success": False, "error": "Cola de envíos llena", "status": "rejected"}
+    if delivery["status"] == "failed":
+        return {"success": False, "error": delivery["error"], "message_id": delivery["id"], "status": "failed"}
     
     return {
         "success": True,
-        "message": f"Mensaje enviado a {recipient}",
+        "message": f"Mensaje enviado a {recipient}" if delivery["status"] == "sent" else f"Mensaje en cola para {recipient}",
         "recipient": recipient,
-        "status": "sent"  # Campo adicional para claridad
+        "message_id": delivery["id"],
+        "status": delivery["status"]  # "sent", o "queued"/"sending"/"unknown" si se agotó la espera
     }
 
+# Envíos al bridge con límite de ritmo global y por destinatario
+outbound_queue = OutboundQueue(
+    deliver_message,
+    runtime,
+    workers=OUTBOUND_WORKERS,
+    rate=OUTBOUND_RATE,
+    burst=OUTBOUND_BURST,
+    recipient_rate=OUTBOUND_RECIPIENT_RATE,
+    recipient_burst=OUTBOUND_RECIPIENT_BURST,
+    maxsize=OUTBOUND_QUEUE_SIZE
+)
+
+metrics.gauge("outbound_queue_depth", "Envíos esperando turno en la cola de salida",
+              fn=lambda: outbound_queue.stats()["queue_depth"])
+
 @handle_errors
-def search_contacts(query: str, limit: int = 5) -> List[Dict[str, Any]]:
-    """Busca contactos en WhatsApp por nombre o número"""
-    contacts = get_contacts()
-    query = query.lower().strip()
-    
-    return [
-        {
-            "name": c["name"],
-            "jid": c["jid"],
-            "phone": c["jid"].split("@")[0] if "@" in c["jid"] else c["jid"]
-        }
-        for c in contacts
-        if query in c["name"].lower() or query in c["jid"].lower()
-    ][:limit]
+def search_contacts(query: str, limit: int = 5, fuzzy: bool = True) -> List[Dict[str, Any]]:
+    """Busca contactos en WhatsApp por nombre o número, los más relevantes primero"""
+    return contact_directory.search(query, limit=limit, fuzzy=fuzzy)
 
 @handle_errors
-def control_whatsapp_server(action: str) -> Dict:
+async def control_whatsapp_server(action: str) -> Dict:
     """Controla el servidor de WhatsApp"""
     if action == "start":
-        if is_whatsapp_server_running():
-            return {"status": "success", "message": "Servidor ya está en ejecución"}
-            
-        process = subprocess.Popen(
-            [PATH_TO_UV, "run", "--host", "0.0.0.0", "--port", "8000", f"{PATH_TO_SRC}/whatsapp-mcp-server/main.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            cwd=PATH_TO_SRC
-        )
-        
-        time.sleep(2)
-        if is_whatsapp_server_running():
-            return {"status": "success", "message": "Servidor iniciado", "pid": process.pid}
-        return {"status": "error", "message": "No se pudo iniciar el servidor"}
-        
+        if not server_supervisor.running and health_monitor.up("mcp_server"):
+            return {"status": "success", "message": "Servidor ya está en ejecución (iniciado fuera de esta app)"}
+        # Vuelve en cuanto el servidor acepta conexiones (comprobado con backoff)
+        return await server_supervisor.start()
+
     elif action == "stop":
-        subprocess.run(["pkill", "-f", "uv.*whatsapp-mcp-server"], check=True)
-        return {"status": "success", "message": "Servidor detenido"}
-
-def is_whatsapp_server_running() -> bool:
-    """Verifica si el servidor está respondiendo con caché"""
-    now = time.time()
-    if now - server_status_cache["last_checked"] < 5 and server_status_cache["status"] is not None:
-        return server_status_cache["status"]
-    
-    try:
-        response = requests.get(f"{WHATSAPP_API_URL}/status", timeout=2)
-        server_status_cache["status"] = response.status_code == 200
-        server_status_cache["last_checked"] = now
-        return server_status_cache["status"]
-    except:
-        server_status_cache["status"] = False
-        server_status_cache["last_checked"] = now
-        return False
+        result = await server_supervisor.stop()
+        await health_monitor.probe_now("mcp_server")
+        return result
+    return {"status": "error", "message": f"Acción '{action}' no soportada"}
+
+# -------------------------
+# Monitor de salud
+# -------------------------
+async def check_bridge():
+    response = await http_clients.async_client("bridge").get("/status")
+    response.raise_for_status()
+
+async def check_mcp_server():
+    """Basta con que el servidor MCP acepte conexiones"""
+    url = httpx.URL(MCP_SERVER_URL)
+    _, writer = await asyncio.open_connection(url.host, url.port or 80)
+    writer.close()
+    await writer.wait_closed()
+
+# Sondas periódicas; /health y las herramientas solo leen la última foto
+health_monitor = HealthMonitor(runtime)
+health_monitor.add("bridge", check_bridge, interval=HEALTH_PROBE_INTERVAL)
+health_monitor.add("mcp_server", check_mcp_server, interval=HEALTH_PROBE_INTERVAL)
+for provider in llm_providers.providers:
+    health_monitor.add(f"llm:{provider.name}", partial(llm_providers.ping, provider.name),
+                       interval=LLM_PROBE_INTERVAL, timeout=5.0)
+
+async def mcp_server_ready() -> bool:
+    """Comprueba el servidor MCP y de paso actualiza la foto de health_monitor"""
+    return (await health_monitor.probe_now("mcp_server"))["up"]
+
+# Proceso del servidor MCP: salida drenada a memoria, reinicio automático y parada por PID
+server_supervisor = ProcessSupervisor(
+    [PATH_TO_UV, "run", "--host", "0.0.0.0", "--port", "8000", f"{PATH_TO_SRC}/whatsapp-mcp-server/main.py"],
+    ready=mcp_server_ready,
+    cwd=PATH_TO_SRC,
+    log_lines=SERVER_LOG_LINES,
+    start_timeout=SERVER_START_TIMEOUT,
+    max_restart_delay=SERVER_RESTART_MAX_DELAY
+)
 
 # -------------------------
 # Funciones generales
@@ -334,20 +617,13 @@ def sumar(a: int, b: int) -> Dict:
 @handle_errors
 async def buscar_repos(query: str) -> List[Dict]:
     """Busca repositorios en GitHub."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"https://api.github.com/search/repositories?q={query}&sort=stars",
-            headers={"Accept": "application/vnd.github.v3+json"},
-            timeout=10
-        )
-        response.raise_for_status()
-        repos = response.json()["items"][:3]
-        return [{
-            "name": repo["full_name"],
-            "description": repo["description"],
-            "stars": repo["stargazers_count"],
-            "url": repo["html_url"]
-        } for repo in repos]
+    repos = await repo_search.search(query, sort="stars", limit=3)
+    return [{
+        "name": repo["full_name"],
+        "description": repo["description"],
+        "stars": repo["stargazers_count"],
+        "url": repo["html_url"]
+    } for repo in repos]
 
 # -------------------------------
 # Configuración de herramientas
@@ -412,6 +688,91 @@ functions = [
         }
     }
 ]
+tools = functions_to_tools(functions)
+TOOLS_TOKENS = estimate_schema_tokens(tools)  # se envían en cada petición
+
+async def send_message_tool(recipient: str, message: str) -> Dict:
+    """send_message pedido por el modelo: solo envía si el destinatario es inequívoco"""
+    await ensure_contacts_loaded()
+    contacts = search_contacts(recipient, fuzzy=False)
+    if len(contacts) == 1:
+        output = await send_message(contacts[0]["jid"], message, timeout=TOOL_SEND_WAIT)
+        return {**output, "contact": contacts[0]["name"], "direct_send": output.get("success", False)}
+    if len(contacts) > 1:
+        return {
+            "multiple_contacts": True,
+            "options": contacts,
+            "original_message": message
+        }
+    if recipient[:1].isdigit():
+        # Número que no está en contactos
+        output = await send_message(recipient, message, timeout=TOOL_SEND_WAIT)
+        return {**output, "contact": recipient, "direct_send": output.get("success", False)}
+    return {"success": False, "error": "No se encontró el contacto"}
+
+async def execute_tool(name: str, args: Dict) -> Any:
+    """Ejecuta una herramienta pedida por el modelo y anota su duración y resultado"""
+    label = name if name in tool_renderers else "unknown"  # nombres inventados por el modelo no crean series
+    outcome = "error"
+    with span(f"tool.{label}", tool_seconds, (label,)):
+        try:
+            output = await dispatch_tool(name, args)
+            outcome = "error" if tool_failed(output) else "ok"
+            return output
+        except asyncio.CancelledError:
+            outcome = "cancelled"  # timeout de la herramienta o cliente que se fue
+            raise
+        finally:
+            tool_calls_total.inc(label, outcome)
+
+async def dispatch_tool(name: str, args: Dict) -> Any:
+    if name == "control_whatsapp_server":
+        return await control_whatsapp_server(**args)
+    if name == "sumar":
+        return sumar(**args)
+    if name == "buscar_repos":
+        return await buscar_repos(**args)
+    if name == "send_message":
+        return await send_message_tool(**args)
+    if name == "search_contacts":
+        await ensure_contacts_loaded()
+        return search_contacts(**args)
+    raise ValueError(f"Función '{name}' no permitida")
+
+def render_sumar(args: Dict, output: Dict) -> str:
+    return f"{args['a']} + {args['b']} = {output['resultado']}"
+
+def render_search_contacts(args: Dict, output: List[Dict]) -> str:
+    if not output:
+        return f"No encontré contactos para '{args['query']}'"
+    contact_list = "\n".join(f"{c['name']} ({c['phone']})" for c in output)
+    return f"Contactos encontrados:\n{contact_list}"
+
+def render_send_message(args: Dict, output: Dict) -> str:
+    if output.get("multiple_contacts"):
+        contact_list = "\n".join([f"{c['name']} ({c['phone']})" for c in output["options"]])
+        return f"Varios contactos encontrados:\n{contact_list}\n¿A cuál deseas enviar el mensaje?"
+    if output.get("success") and output.get("status", "sent") != "sent":
+        return f"Mensaje en cola para {output.get('contact') or output['recipient']} (id {output['message_id']})"
+    if output.get("success"):
+        return f"Mensaje enviado a {output.get('contact') or output['recipient']}"
+    return f"No se pudo enviar el mensaje: {output.get('error', 'error desconocido')}"
+
+def render_control_whatsapp_server(args: Dict, output: Dict) -> str:
+    return output.get("message") or output["error"]
+
+# Respuesta final de cada herramienta armada aquí, sin segunda llamada al modelo.
+# None marca las herramientas cuya respuesta conviene que redacte el modelo.
+tool_renderers = {
+    "sumar": render_sumar,
+    "search_contacts": render_search_contacts,
+    "send_message": render_send_message,
+    "control_whatsapp_server": render_control_whatsapp_server,
+    "buscar_repos": None,  # descripciones libres: el modelo las resume mejor
+}
+
+def is_direct_send(records: List[Dict]) -> bool:
+    return bool(records) and all(r["name"] == "send_message" and r["output"].get("direct_send") for r in records)
 
 # --------------------------
 # Endpoints
@@ -419,163 +780,393 @@ functions = [
 @app.route("/health")
 def health_check():
     """Endpoint de verificación de estado"""
-    return jsonify({
+    return jsonify(health_status())
+
+def health_status() -> Dict:
+    """Solo lee estado en memoria: nunca espera a una comprobación"""
+    return {
         "flask": "running",
-        "uv_process": "running" if is_whatsapp_server_running() else "not running",
-        "mcp_server": "running" if is_whatsapp_server_running() else "unreachable"
-    })
+        "uv_process": "running" if server_supervisor.running else probe_label("mcp_server", "running", "not running"),
+        "supervisor": server_supervisor.stats(),
+        "mcp_server": probe_label("bridge", "running", "unreachable"),
+        "probes": health_monitor.snapshot(),
+        "contacts": contact_directory.stats(),
+        "http_clients": http_clients.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_providers": llm_providers.stats(),
+        "repo_search": repo_search.stats(),
+        "intents": {**intent_router.stats(), "fallbacks": dict(intent_fallbacks)},
+        "inbound": inbound_pipeline.stats(),
+        "outbound": outbound_queue.stats(),
+        "ingest": message_ingestor.stats()
+    }
+
+def probe_label(name: str, up: str, down: str) -> str:
+    state = health_monitor.up(name)
+    return "unknown" if state is None else up if state else down
+
+@app.route("/whatsapp-server/logs")
+def whatsapp_server_logs():
+    """Últimas líneas de salida del servidor MCP (?limit=100&stream=stderr)"""
+    body, status = handle_server_logs(request.args)
+    return jsonify(body), status
+
+def handle_server_logs(args):
+    stream = args.get("stream")
+    if stream not in (None, "stdout", "stderr"):
+        return {"error": "stream debe ser stdout o stderr"}, 400
+    try:
+        limit = int(args.get("limit", 100))
+    except ValueError:
+        return {"error": "limit debe ser un número"}, 400
+    return {"supervisor": server_supervisor.stats(), "lines": server_supervisor.logs(limit, stream)}, 200
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route("/debug/profiles")
+def debug_profiles():
+    """Perfiles guardados (pedidos con la cabecera X-Debug-Profile)"""
+    return jsonify(request_tracer.profiles())
+
+@app.route("/debug/profiles/<profile_id>")
+def debug_profile(profile_id: str):
+    """Pilas muestreadas en formato folded (flamegraph.pl, speedscope)"""
+    body, status, headers = handle_debug_profile(profile_id)
+    return Response(body, status=status, headers=headers, content_type="text/plain; charset=utf-8")
+
+def handle_debug_profile(profile_id: str):
+    profile = request_tracer.profile(profile_id)
+    if profile is None:
+        return f"Perfil '{profile_id}' desconocido\n", 404, {}
+    return profile["folded"] + "\n", 200, {"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'}
+
+@app.route("/history-stats")
+def history_stats():
+    """Sesiones y memoria ocupada por el historial de conversaciones"""
+    return jsonify({**conversation_history.stats(), "context": context_builder.stats()})
 
 @app.route("/search-contacts", methods=["POST"])
 @validate_json("query")
 def search_contacts_endpoint():
-    data = request.get_json()
+    body, status = runtime.run(handle_search_contacts(request.get_json()))
+    return jsonify(body), status
+
+async def handle_search_contacts(data: Dict):
+    await ensure_contacts_loaded()
     contacts = search_contacts(data["query"], data.get("limit", 5))
-    return jsonify({"success": True, "count": len(contacts), "contacts": contacts})
+    return {"success": True, "count": len(contacts), "contacts": contacts}, 200
 
 @app.route("/send-message", methods=["POST"])
 @validate_json("recipient", "message")
 def send_message_endpoint():
+    body, status = runtime.run(handle_send_message(request.get_json()))
+    return jsonify(body), status
+
+async def handle_send_message(data: Dict):
+    wait = data.get("wait", True)
+    response = await send_message(data["recipient"], data["message"], wait=wait)
+    if not wait and response.get("success"):
+        return {**response, **queued_fields(response)}, 202
+    status_code = 200 if response.get("success") else 503 if response.get("status") == "rejected" else 400
+    return response, status_code
+
+@app.route("/send-bulk", methods=["POST"])
+@validate_json("recipients")
+def send_bulk():
+    """Envío masivo; devuelve un resultado por destinatario (NDJSON) a medida que se envían"""
     data = request.get_json()
-    response = send_message(data["recipient"], data["message"])
-    status_code = 200 if response.get("success") else 400
-    return jsonify(response), status_code
+    error = validate_bulk(data)
+    if error:
+        return jsonify({"error": error}), 400
+    return Response(runtime.iterate(stream_send_bulk(data)), mimetype="application/x-ndjson")
+
+def validate_bulk(data: Dict) -> Optional[str]:
+    recipients = data["recipients"]
+    if not isinstance(recipients, list) or not recipients:
+        return "'recipients' debe ser una lista no vacía"
+    if len(recipients) > BULK_MAX_RECIPIENTS:
+        return f"Máximo {BULK_MAX_RECIPIENTS} destinatarios por llamada"
+    for item in recipients:
+        if not isinstance(item, (str, dict)) or (isinstance(item, dict) and not item.get("to")):
+            return "Cada destinatario debe ser un texto o un objeto con 'to'"
+    return None
+
+def render_bulk_message(template: str, contact: Optional[Dict], variables: Dict) -> str:
+    """Plantilla con {name}, {first_name}, {phone} y las variables propias del destinatario"""
+    name = (contact or {}).get("name") or ""
+    values = {
+        "name": name,
+        "first_name": name.split()[0] if name else "",
+        "phone": (contact or {}).get("phone", ""),
+        **variables
+    }
+    return template.format_map(values)
+
+async def stream_send_bulk(data: Dict) -> AsyncIterator[str]:
+    """Resuelve todos los destinatarios de una vez y los envía por la cola, con concurrencia acotada.
+
+    Produce una línea JSON por destinatario en el orden en que terminan
+    (con su `index` en la lista original) y una línea final con el resumen.
+    Con "wait": false cada resultado sale en cuanto el mensaje queda en cola.
+    """
+    started = time.perf_counter()
+    template = data.get("message")
+    wait = data.get("wait", True)
+    items = [item if isinstance(item, dict) else {"to": item} for item in data["recipients"]]
+
+    # Una sola pasada sobre el índice de contactos para toda la lista
+    await ensure_contacts_loaded()
+    resolved = contact_directory.index().resolve_many([str(item["to"]) for item in items])
+
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    seen = set()
+
+    async def send_one(index: int, item: Dict, resolution) -> Dict:
+        state, contacts = resolution
+        result = {"index": index, "to": item["to"]}
+        if state == "ambiguous":
+            return {**result, "status": "ambiguous", "options": contacts}
+        contact = contacts[0] if contacts else None
+        if contact is not None:
+            recipient = contact["jid"]
+            result["contact"] = contact
+        elif "@" in str(item["to"]):
+            recipient = str(item["to"]).strip()
+        elif str(item["to"]).strip().lstrip("+")[:1].isdigit():
+            recipient = normalize_number(str(item["to"]))
+            if recipient is None:
+                return {**result, "status": "invalid", "error": "Formato de número inválido"}
+        else:
+            return {**result, "status": "not_found", "error": f"No se encontró el contacto '{item['to']}'"}
+
+        try:
+            text = render_bulk_message(item.get("message") or template or "", contact, item.get("vars") or {})
+        except (KeyError, IndexError, ValueError) as e:
+            return {**result, "status": "invalid", "error": f"Plantilla inválida: {e}"}
+        if not text:
+            return {**result, "status": "invalid", "error": "Mensaje vacío"}
+        if (recipient, text) in seen:
+            return {**result, "recipient": recipient, "status": "duplicate"}
+        seen.add((recipient, text))
+
+        result["recipient"] = recipient
+        if not wait:
+            message_id = outbound_queue.submit(recipient, text)
+            if message_id is None:
+                return {**result, "status": "rejected", "error": "Cola de envíos llena"}
+            return {**result, "status": "queued", "message_id": message_id}
+        async with semaphore:
+            delivery = await outbound_queue.send(recipient, text, timeout=OUTBOUND_WAIT_TIMEOUT)
+        if delivery is None:
+            return {**result, "status": "rejected", "error": "Cola de envíos llena"}
+        return {**result, "status": delivery["status"], "message_id": delivery["id"], "error": delivery["error"]}
+
+    outbound_queue.start()
+    tasks = [asyncio.ensure_future(send_one(i, item, resolution))
+             for i, (item, resolution) in enumerate(zip(items, resolved))]
+    counts: Dict[str, int] = {}
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            result = await next_result
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+    finally:
+        # Si el cliente corta la conexión, los que no llegaron a la cola ya no se envían
+        for task in tasks:
+            task.cancel()
+
+    yield json.dumps({"summary": {
+        "total": len(items),
+        **counts,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }}, ensure_ascii=False) + "\n"
+
+@app.route("/outbound/<message_id>")
+def outbound_status(message_id: str):
+    """Estado de un envío encolado"""
+    body, status = handle_outbound_status(message_id)
+    return jsonify(body), status
+
+def handle_outbound_status(message_id: str):
+    delivery = outbound_queue.status(message_id)
+    if delivery is None:
+        return {"error": f"Envío '{message_id}' desconocido"}, 404
+    return delivery, 200
 
 @app.route("/mcp-to-openai", methods=["POST"])
 @validate_json("input")
 def mcp_to_openai():
-    data = request.get_json()
+    body, status = runtime.run(handle_mcp_to_openai(request.get_json()))
+    return jsonify(body), status
+
+async def handle_mcp_to_openai(data: Dict):
+    try:
+        async for kind, event in answer(data, partial(single_response, openai_chat), stage):
+            if kind == "done":
+                return event, 200
+    except httpx.HTTPStatusError as err:
+        app.logger.error(f"Error en OpenAI: {err.response.text}")
+        return {"error": f"Error en la API: {err.response.status_code}"}, 500
+    except CircuitOpenError as e:
+        return {"error": str(e)}, 503
+    except Exception as e:
+        app.logger.error(f"Error inesperado: {str(e)}")
+        return {"error": f"Error inesperado: {str(e)}"}, 500
+
+@app.route("/mcp-to-openai/stream", methods=["POST"])
+@validate_json("input")
+def mcp_to_openai_stream():
+    """Igual que /mcp-to-openai, pero responde con Server-Sent Events a medida que llegan los tokens"""
+    events = runtime.iterate(stream_mcp_to_openai(request.get_json()))
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+async def stream_mcp_to_openai(data: Dict) -> AsyncIterator[str]:
+    """Eventos SSE: token (texto del modelo), tool_call, tool_result, done (respuesta completa) y error"""
+    try:
+        async for kind, event in answer(data, openai_chat_stream):
+            yield sse(kind, event)
+    except httpx.HTTPStatusError as err:
+        app.logger.error(f"Error en OpenAI: {err.response.text}")
+        yield sse("error", {"error": f"Error en la API: {err.response.status_code}"})
+    except Exception as e:
+        app.logger.error(f"Error inesperado: {str(e)}")
+        yield sse("error", {"error": f"Error inesperado: {str(e)}"})
+
+async def answer(data: Dict, chat, stage=lambda name: nullcontext()) -> AsyncIterator[Tuple[str, Dict]]:
+    """Eventos de una petición de chat (ver common/tools.chat_rounds); "done" trae la respuesta completa.
+
+    La ruta normal pide cada vuelta sin streaming (con cobertura entre
+    backends) y solo usa "done"; la de streaming reenvía todos los eventos.
+    """
     user_input = data["input"]
     session_id = data.get("session_id", "default")
-    
-    # Preparar mensajes
-    messages = conversation_history[session_id][-10:]  # Mantener solo los últimos 10 mensajes
-    messages.insert(0, {"role": "system", "content": "Eres un asistente útil. Responde de forma concisa."})
-    messages.append({"role": "user", "content": user_input})
-    
-    # Configurar payload para OpenAI
-    payload = {
-        "model": OPENAI_MODEL,
-        "messages": messages,
-        "functions": functions,
-        "function_call": "auto"
-    }
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
+    # Comandos sin ambigüedad se ejecutan directo; el resto va al modelo
+    if INTENT_ROUTER:
+        with stage("intent_match"):
+            intent = intent_router.match(user_input)
+        if intent is not None:
+            with stage("intent_run"):
+                routed = await run_intent(intent, session_id, user_input)
+            if routed is not None:
+                body, _ = routed
+                yield "tool_result", {"name": body["tool_name"], "output": body["output"]}
+                yield "token", {"text": body["response"]}
+                yield "done", body
+                return
+            intent_fallbacks[intent.name] = intent_fallbacks.get(intent.name, 0) + 1
 
-    try:
-        # Primera llamada a OpenAI
-        response = requests.post(OPENAI_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        message = result["choices"][0]["message"]
-        
-        # Si no se usó función
-        if "function_call" not in message:
-            response_message = message.get("content", "No puedo responder a eso.")
-            tool_used = False
-            tool_name = None
-            output = None
-        else:
-            # Procesar función
-            func_call = message["function_call"]
-            func_name = func_call["name"]
-            func_args = json.loads(func_call["arguments"])
-            
-            # Ejecutar función
-            if func_name == "control_whatsapp_server":
-                output = control_whatsapp_server(**func_args)
-            elif func_name == "sumar":
-                output = sumar(**func_args)
-            elif func_name == "buscar_repos":
-                output = asyncio.run(buscar_repos(**func_args))
-            # En la función mcp_to_openai(), modifica el manejo de send_message:
-            elif func_name == "send_message":
-                # Primero busca los contactos
-                contacts = search_contacts(func_args["recipient"])
-                
-                # Si hay exactamente un contacto, envía directamente
-                if len(contacts) == 1:
-                    output = send_message(contacts[0]["jid"], func_args["message"])
-                    return jsonify({
-                        "response": f"Mensaje enviado a {contacts[0]['name']}",
-                        "tool_used": True,
-                        "tool_name": "send_message",
-                        "output": output,
-                        "direct_send": True  # Indica que fue un envío directo
-                    })
-                
-                # Si hay múltiples contactos
-                elif len(contacts) > 1:
-                    output = {
-                        "multiple_contacts": True,
-                        "options": contacts,
-                        "original_message": func_args["message"]
-                    }
-                    contact_list = "\n".join([f"{c['name']} ({c['phone']})" for c in contacts])
-                    response_message = f"Varios contactos encontrados:\n{contact_list}\n¿A cuál deseas enviar el mensaje?"
-                
-                # Si no hay contactos
-                else:
-                    output = {"success": False, "error": "No se encontró el contacto"}
-                    response_message = "No encontré ese contacto en la lista"
-                
-                tool_used = True
-                tool_name = func_name
-            elif func_name == "search_contacts":
-                output = search_contacts(**func_args)
-            else:
-                return jsonify({"error": f"Función '{func_name}' no permitida"}), 400
-
-            tool_used = True
-            tool_name = func_name
-
-            # Segunda llamada para responder con el resultado
-            messages.append({
-                "role": "assistant",
-                "content": None,
-                "function_call": func_call
-            })
-            messages.append({
-                "role": "function",
-                "name": func_name,
-                "content": json.dumps(output)
-            })
+    # Preparar mensajes dentro del presupuesto de tokens
+    with stage("context"):
+        messages, prompt_tokens = context_builder.build(
+            session_id,
+            "Eres un asistente útil. Responde de forma concisa.",
+            await conversation_history.get(session_id),
+            {"role": "user", "content": user_input},
+            reserved=TOOLS_TOKENS
+        )
 
-            second_response = requests.post(
-                OPENAI_API_URL,
-                headers=headers,
-                json={"model": OPENAI_MODEL, "messages": messages}
-            )
-            second_response.raise_for_status()
-            response_message = second_response.json()["choices"][0]["message"]["content"]
+    def payload(rounds: int) -> Dict:
+        # En la última vuelta permitida el modelo debe responder sin herramientas
+        return {
+            "model": OPENAI_MODEL,
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": "auto" if rounds < TOOL_MAX_ITERATIONS else "none"
+        }
+
+    async for kind, event in chat_rounds(messages, payload, chat, execute_tool,
+                                         tool_renderers if TOOL_RENDERERS else None,
+                                         TOOL_CALL_TIMEOUT, "No puedo responder a eso.", stage,
+                                         max_rounds=TOOL_MAX_ITERATIONS):
+        if kind != "done":
+            yield kind, event
+            continue
 
         # Actualizar historial
-        conversation_history[session_id].extend([
-            {"role": "user", "content": user_input},
-            {"role": "assistant", "content": response_message}
-        ])
-
-        return jsonify({
-            "response": response_message,
-            "session_id": session_id,
-            "tool_used": tool_used,
-            "tool_name": tool_name,
-            "output": output
-        })
+        with stage("history"):
+            await conversation_history.append(
+                session_id,
+                {"role": "user", "content": user_input},
+                {"role": "assistant", "content": event["response"]}
+            )
+        body = chat_response(session_id, prompt_tokens, event)
+        if event["rendered"] and is_direct_send(event["last_round"]):
+            body["direct_send"] = True  # Indica que fue un envío directo
+        yield "done", body
 
-    except requests.exceptions.HTTPError as err:
-        app.logger.error(f"Error en OpenAI: {err.response.text}")
-        return jsonify({"error": f"Error en la API: {err.response.status_code}"}), 500
-    except Exception as e:
-        app.logger.error(f"Error inesperado: {str(e)}")
-        return jsonify({"error": f"Error inesperado: {str(e)}"}), 500
+# -------------------------
+# Ruta rápida sin LLM
+# -------------------------
+intent_router = IntentRouter()
+intent_fallbacks: Dict[str, int] = {}  # comandos reconocidos que igual terminaron en el modelo
+
+async def run_intent(intent, session_id: str, user_input: str):
+    """Ejecuta un comando reconocido por el router; None si conviene consultar al modelo"""
+    if intent.name == "sumar":
+        output = sumar(**intent.args)
+
+    elif intent.name == "search_contacts":
+        await ensure_contacts_loaded()
+        output = search_contacts(intent.args["query"], **intent.options)
+        if not isinstance(output, list) or not output:
+            return None  # puede que no se refiera a un contacto
+
+    elif intent.name == "send_message":
+        recipient = intent.args["recipient"]
+        message = intent.args["message"]
+        contacts = None
+        if not recipient[0].isdigit():
+            await ensure_contacts_loaded()
+            contacts = search_contacts(recipient, fuzzy=False)
+            if not isinstance(contacts, list) or not contacts:
+                return None  # puede que no sea un nombre; que lo interprete el modelo
+
+        if contacts and len(contacts) > 1:
+            output = {
+                "multiple_contacts": True,
+                "options": contacts,
+                "original_message": message
+            }
+        else:
+            output = await send_message(contacts[0]["jid"] if contacts else recipient, message)
+            if contacts:
+                output = {**output, "contact": contacts[0]["name"]}
+
+    else:
+        return None
+
+    response_message = tool_renderers[intent.name](intent.args, output)
+
+    await conversation_history.append(
+        session_id,
+        {"role": "user", "content": user_input},
+        {"role": "assistant", "content": response_message}
+    )
+    result = {
+        "response": response_message,
+        "session_id": session_id,
+        "tool_used": True,
+        "tool_name": intent.name,
+        "output": output,
+        "routed": True,  # resuelto sin llamar al modelo
+        "prompt_tokens": 0
+    }
+    if intent.name == "send_message" and output.get("success"):
+        result["direct_send"] = True
+    return result, 200
+
+def start_background_services():
+    """Arranca las tareas de fondo (respuestas, envíos, recepción de mensajes y directorio de contactos)"""
+    inbound_pipeline.start()
+    outbound_queue.start()
+    health_monitor.start()
+    runtime.submit(message_ingestor.run())
+    contact_directory.start()
 
-# Inicia el polling en un hilo separado al arrancar Flask
-polling_thread = Thread(target=check_new_messages, daemon=True)
-polling_thread.start()
 if __name__ == "__main__":
+    start_background_services()
     app.run(host="0.0.0.0", port=5000, debug=True)
-    
@@ -0,0 +1,177 @@
+"""Modo de servicio ASGI para la API de app.py.
+
+Expone las mismas rutas que el servidor de Flask, pero las atiende de forma
+nativa en el event loop del servidor: las llamadas al LLM, al bridge y a
+GitHub usan los clientes asíncronos compartidos, así que un solo proceso
+sostiene cientos de conversaciones en curso sin un hilo por petición.
+
+Uso:
+    hypercorn asgi:app --bind 0.0.0.0:5000
+    python asgi.py
+"""
+import asyncio
+from functools import wraps
+
+from quart import Quart, Response, g, request, jsonify
+from quart.wrappers.response import DataBody
+
+import app as core
+from app import runtime
+from common.metrics import CONTENT_TYPE
+from common.streaming import SSE_HEADERS
+
+app = Quart(__name__)
+app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+
+
+def validate_json(*required_fields):
+    def decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            if not request.is_json:
+                return jsonify({"error": "Se esperaba JSON"}), 400
+
+            data = await request.get_json()
+            missing_fields = [field for field in required_fields if field not in data]
+            if missing_fields:
+                return jsonify({"error": f"Campos requeridos faltantes: {', '.join(missing_fields)}"}), 400
+
+            return await f(data, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@app.before_serving
+async def startup():
+    # Todo el código asíncrono de app.py corre en el loop del servidor
+    runtime.attach(asyncio.get_running_loop())
+    core.start_background_services()
+
+
+@app.after_serving
+async def shutdown():
+    await core.close_http_clients()
+
+
+@app.before_request
+async def start_request_metrics():
+    g.request_started = core.route_metrics.started()
+    g.trace = core.request_tracer.start(request.headers, request.path)
+
+
+@app.after_request
+async def finish_response(response):
+    g.response_status = response.status_code
+    trace = g.pop("trace", None)
+    if trace is not None:
+        timeline = core.request_tracer.finish(trace, response.headers)
+        # Solo cuerpos ya armados: leer uno en streaming lo consumiría
+        if response.is_json and isinstance(response.response, DataBody):
+            body = await response.get_json()
+            if isinstance(body, dict):
+                response.set_data(app.json.dumps({**body, "trace": timeline}))
+    return response
+
+
+@app.teardown_request
+async def finish_request_metrics(error=None):
+    trace = g.pop("trace", None)
+    if trace is not None:
+        core.request_tracer.finish(trace, {})
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        core.route_metrics.finished(route, request.method, g.get("response_status", 500), started)
+
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    return Response(core.metrics.render(), content_type=CONTENT_TYPE)
+
+
+@app.route("/health")
+async def health_check():
+    status = core.health_status()
+    status["mode"] = "asgi"
+    return jsonify(status)
+
+
+@app.route("/history-stats")
+async def history_stats():
+    return jsonify({**core.conversation_history.stats(), "context": core.context_builder.stats()})
+
+
+@app.route("/webhook", methods=["POST"])
+async def webhook():
+    body, status = core.handle_webhook(await request.get_json())
+    return jsonify(body), status
+
+
+@app.route("/send-to-contact", methods=["POST"])
+@validate_json("contact_name", "message")
+async def send_to_contact(data):
+    body, status = await core.handle_send_to_contact(data)
+    return jsonify(body), status
+
+
+@app.route("/search-contacts", methods=["POST"])
+@validate_json("query")
+async def search_contacts_endpoint(data):
+    body, status = await core.handle_search_contacts(data)
+    return jsonify(body), status
+
+
+@app.route("/send-message", methods=["POST"])
+@validate_json("recipient", "message")
+async def send_message_endpoint(data):
+    body, status = await core.handle_send_message(data)
+    return jsonify(body), status
+
+
+@app.route("/send-bulk", methods=["POST"])
+@validate_json("recipients")
+async def send_bulk(data):
+    error = core.validate_bulk(data)
+    if error:
+        return jsonify({"error": error}), 400
+    return Response(core.stream_send_bulk(data), mimetype="application/x-ndjson")
+
+
+@app.route("/outbound/<message_id>")
+async def outbound_status(message_id):
+    body, status = core.handle_outbound_status(message_id)
+    return jsonify(body), status
+
+
+@app.route("/whatsapp-server/logs")
+async def whatsapp_server_logs():
+    body, status = core.handle_server_logs(request.args)
+    return jsonify(body), status
+
+
+@app.route("/debug/profiles")
+async def debug_profiles():
+    return jsonify(core.request_tracer.profiles())
+
+
+@app.route("/debug/profiles/<profile_id>")
+async def debug_profile(profile_id):
+    body, status, headers = core.handle_debug_profile(profile_id)
+    return Response(body, status=status, headers=headers, content_type="text/plain; charset=utf-8")
+
+
+@app.route("/mcp-to-openai", methods=["POST"])
+@validate_json("input")
+async def mcp_to_openai(data):
+    body, status = await core.handle_mcp_to_openai(data)
+    return jsonify(body), status
+
+
+@app.route("/mcp-to-openai/stream", methods=["POST"])
+@validate_json("input")
+async def mcp_to_openai_stream(data):
+    return Response(core.stream_mcp_to_openai(data), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
@@ -7,8 +7,10 @@ import re
 
 # Configuración
 API_URL = "http://localhost:5000/mcp-to-openai"
+STREAM_URL = f"{API_URL}/stream"
+STREAMING = True  # mostrar la respuesta a medida que llega (Server-Sent Events)
 SESSION_ID = str(uuid4())
-REQUEST_TIMEOUT = 30  # segundos
+REQUEST_TIMEOUT = 30  # segundos (en streaming: máximo entre un evento y el siguiente)
 
 # Colores para la terminal
 class Colors:
@@ -103,6 +105,63 @@ def send_chat_request(user_input):
     
     return None
 
+def iter_sse(response):
+    """Recorre los eventos (nombre, datos) de una respuesta Server-Sent Events."""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data))
+            event, data = None, []
+
+def stream_chat_request(user_input):
+    """Envía la solicitud en streaming e imprime los tokens a medida que llegan.
+
+    Devuelve el evento final (mismos campos que la respuesta sin streaming).
+    """
+    payload = {
+        "input": user_input,
+        "session_id": SESSION_ID
+    }
+
+    try:
+        with requests.post(STREAM_URL, json=payload, stream=True, timeout=(5, REQUEST_TIMEOUT)) as response:
+            if response.status_code != 200:
+                print_color(f"\n❌ Error {response.status_code}:", Colors.RED)
+                print_color(response.text, Colors.RED)
+                return None
+
+            writing = False
+            for event, data in iter_sse(response):
+                if event == "token":
+                    if not writing:
+                        print(f"\n{Colors.GREEN}🤖 Asistente: ", end="")
+                        writing = True
+                    print(data["text"], end="", flush=True)
+                elif event == "tool_call":
+                    print_color(f"\n🔧 {data['name']}({data['arguments']})", Colors.YELLOW)
+                elif event == "tool_result":
+                    status = "❌" if data.get("error") else "✅"
+                    print_color(f"  {status} {data['name']}", Colors.YELLOW)
+                elif event == "error":
+                    print_color(f"\n❌ {data['error']}", Colors.RED)
+                    return None
+                elif event == "done":
+                    if writing:
+                        print(Colors.END)
+                    data["streamed"] = True
+                    return data
+
+    except requests.exceptions.Timeout:
+        print_color("\n⌛ Tiempo de espera agotado. ¿El servidor está ocupado?", Colors.RED)
+    except requests.exceptions.ConnectionError:
+        print_color("\n🔌 Error de conexión: ¿El servidor está corriendo?", Colors.RED)
+
+    return None
+
 def chat():
     """Bucle principal del chat."""
     if not check_server_connection():
@@ -120,7 +179,7 @@ def chat():
                 print_color("\n👋 ¡Hasta luego!", Colors.BLUE)
                 break
             
-            response = send_chat_request(user_input)
+            response = stream_chat_request(user_input) if STREAMING else send_chat_request(user_input)
             
             if response:
                 # Si hay output de herramientas (como resultados de búsqueda)
@@ -188,8 +247,8 @@ def chat():
                     elif isinstance(response['output'], dict):
                         print_tool_response(response['tool_name'], response['output'])
                 
-                # Si no hay output pero hay respuesta del asistente (ej: saludos)
-                elif response.get('response'):
+                # Si no hay output pero hay respuesta del asistente (ej: saludos; en streaming ya se mostró)
+                elif response.get('response') and not response.get('streamed'):
                     print_color(f"\n🤖 Asistente: {response['response']}", Colors.GREEN)
 
         except KeyboardInterrupt:
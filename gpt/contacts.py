@@ -0,0 +1,374 @@
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin acentos y con espacios colapsados ("José " -> "jose")"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def trigrams(text: str) -> List[str]:
+    return [text[i:i + 3] for i in range(len(text) - 2)]
+
+
+def phone_of(jid: str) -> str:
+    return jid.split("@")[0] if "@" in jid else jid
+
+
+class ContactIndex:
+    """Índice en memoria para búsquedas de contactos ordenadas por relevancia.
+
+    Guarda los nombres normalizados, un índice de trigramas para coincidencias
+    parciales y aproximadas, listas ordenadas para búsquedas por prefijo y
+    tablas directas por teléfono y JID.
+    """
+
+    # Puntuación por tipo de coincidencia (mayor es mejor)
+    EXACT_ID = 100
+    EXACT_NAME = 90
+    NAME_PREFIX = 80
+    WORD_PREFIX = 70
+    SUBSTRING = 60
+    PHONE_SUBSTRING = 50
+    FUZZY = 40
+
+    FUZZY_THRESHOLD = 0.45
+    FUZZY_POSTING_BUDGET = 4000  # entradas de trigramas recorridas como máximo en la búsqueda aproximada
+    MAX_CANDIDATES = 200  # candidatos evaluados por nivel antes de ordenar
+
+    def __init__(self, contacts: List[Dict]):
+        self._entries: List[Dict] = []
+        self._names: List[str] = []
+        self._by_jid: Dict[str, int] = {}
+        self._by_phone: Dict[str, int] = {}
+        self._by_name: Dict[str, List[int]] = defaultdict(list)
+        name_grams: Dict[str, List[int]] = defaultdict(list)
+        phone_grams: Dict[str, List[int]] = defaultdict(list)
+        name_keys: List[Tuple[str, int]] = []
+        word_keys: List[Tuple[str, int]] = []
+
+        for c in contacts:
+            jid = c.get("jid") or ""
+            if not jid:
+                continue
+            idx = len(self._entries)
+            name = c.get("name") or ""
+            phone = phone_of(jid)
+            norm = normalize(name)
+            self._entries.append({"name": name, "jid": jid, "phone": phone})
+            self._names.append(norm)
+
+            self._by_jid[jid.lower()] = idx
+            self._by_phone.setdefault(phone, idx)
+            if norm:
+                self._by_name[norm].append(idx)
+                name_keys.append((norm, idx))
+                for word in set(norm.split()):
+                    word_keys.append((word, idx))
+            for g in set(trigrams(f"  {norm} ")) if norm else ():
+                name_grams[g].append(idx)
+            for g in set(trigrams(phone)):
+                phone_grams[g].append(idx)
+
+        # Conjuntos para que la intersección cueste lo que mide la lista más corta
+        self._name_grams = {g: frozenset(ids) for g, ids in name_grams.items()}
+        self._phone_grams = {g: frozenset(ids) for g, ids in phone_grams.items()}
+        name_keys.sort()
+        word_keys.sort()
+        self._name_keys = name_keys
+        self._word_keys = word_keys
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, identifier: str) -> Optional[Dict]:
+        """Búsqueda directa por JID o número de teléfono"""
+        identifier = identifier.strip().lower()
+        idx = self._by_jid.get(identifier)
+        if idx is None:
+            idx = self._by_phone.get("".join(c for c in identifier if c.isdigit()))
+        return dict(self._entries[idx]) if idx is not None else None
+
+    def resolve_many(self, identifiers: List[str], options: int = 5) -> List[Tuple[str, List[Dict]]]:
+        """Resuelve muchos destinatarios (nombres, números o JIDs) contra este índice.
+
+        Para cada uno devuelve ("found", [contacto]), ("ambiguous", opciones)
+        o ("not_found", []). Los JIDs y números van directo a sus tablas y
+        los nombres se buscan sin coincidencia aproximada: en un envío masivo
+        un error de dedo no debe elegir destinatario. Los repetidos se
+        resuelven una sola vez.
+        """
+        resolved: Dict[str, Tuple[str, List[Dict]]] = {}
+        results = []
+        for identifier in identifiers:
+            key = normalize(identifier)
+            if key not in resolved:
+                resolved[key] = self._resolve(identifier, options)
+            results.append(resolved[key])
+        return results
+
+    def _resolve(self, identifier: str, options: int) -> Tuple[str, List[Dict]]:
+        contact = self.lookup(identifier)
+        if contact is not None:
+            return "found", [contact]
+        stripped = identifier.strip().lstrip("+")
+        if "@" in stripped or stripped[:1].isdigit():
+            return "not_found", []
+        exact = self._by_name.get(normalize(identifier), [])
+        if exact:
+            return ("found" if len(exact) == 1 else "ambiguous"), [dict(self._entries[i]) for i in exact[:options]]
+        matches = self.search(identifier, limit=options, fuzzy=False)
+        if not matches:
+            return "not_found", []
+        return ("found" if len(matches) == 1 else "ambiguous"), matches
+
+    def search(self, query: str, limit: int = 5, fuzzy: bool = True) -> List[Dict]:
+        """Devuelve hasta `limit` contactos, los más relevantes primero.
+
+        Los niveles de coincidencia se evalúan de mejor a peor y la búsqueda
+        se detiene en cuanto hay suficientes resultados.
+        """
+        if limit <= 0:
+            return []
+        scores: Dict[int, float] = {}
+
+        def add(candidates, score):
+            for idx in candidates:
+                if scores.get(idx, -1) < score:
+                    scores[idx] = score
+
+        def enough():
+            return len(scores) >= limit
+
+        raw = query.strip().lower()
+        q = normalize(query)
+        digits = "".join(c for c in raw if c.isdigit())
+        numeric = bool(digits) and all(c.isdigit() or c in "+- ()" for c in raw.split("@")[0])
+        if numeric:
+            q = ""
+
+        # 1. JID o teléfono exactos
+        if raw in self._by_jid:
+            add([self._by_jid[raw]], self.EXACT_ID)
+        if digits and digits in self._by_phone:
+            add([self._by_phone[digits]], self.EXACT_ID)
+
+        if q:
+            # 2. Nombre exacto
+            add(self._by_name.get(q, ()), self.EXACT_NAME)
+            # 3. El nombre empieza con la consulta
+            if not enough():
+                add(self._prefix(self._name_keys, q), self.NAME_PREFIX)
+            # 4. Alguna palabra del nombre empieza con la consulta
+            if not enough():
+                add(self._prefix(self._word_keys, q), self.WORD_PREFIX)
+            # 5. Subcadena en cualquier posición
+            if not enough() and len(q) >= 3:
+                add(self._substring(q), self.SUBSTRING)
+
+        # 6. Subcadena del número
+        if not enough() and numeric and len(digits) >= 3:
+            add(self._phone_substring(digits), self.PHONE_SUBSTRING)
+
+        # 7. Coincidencia aproximada por trigramas
+        if fuzzy and not enough() and len(q) >= 3:
+            for idx, similarity in self._fuzzy(q):
+                add([idx], self.FUZZY * similarity)
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], len(self._names[i]), self._names[i]))
+        return [dict(self._entries[i]) for i in ranked[:limit]]
+
+    def _prefix(self, keys: List[Tuple[str, int]], q: str) -> List[int]:
+        found = []
+        pos = bisect_left(keys, (q, -1))
+        while pos < len(keys) and keys[pos][0].startswith(q) and len(found) < self.MAX_CANDIDATES:
+            found.append(keys[pos][1])
+            pos += 1
+        return found
+
+    def _candidates(self, postings: Dict[str, frozenset], q: str) -> frozenset:
+        sets = [postings.get(g) for g in set(trigrams(q))]
+        if not sets or any(not ids for ids in sets):
+            return frozenset()
+        sets.sort(key=len)
+        candidates = sets[0]
+        for ids in sets[1:]:
+            candidates = candidates & ids
+            if not candidates:
+                break
+        return candidates
+
+    def _substring(self, q: str) -> List[int]:
+        found = (i for i in self._candidates(self._name_grams, q) if q in self._names[i])
+        return list(islice(found, self.MAX_CANDIDATES))
+
+    def _phone_substring(self, digits: str) -> List[int]:
+        found = (i for i in self._candidates(self._phone_grams, digits) if digits in self._entries[i]["phone"])
+        return list(islice(found, self.MAX_CANDIDATES))
+
+    def _fuzzy(self, q: str) -> List[Tuple[int, float]]:
+        grams = set(trigrams(f"  {q} "))
+        # Se cuentan primero los trigramas más raros; los muy comunes se omiten
+        # cuando ya se agotó el presupuesto, y la similitud real se calcula
+        # solo para los mejores candidatos.
+        postings = sorted((self._name_grams.get(g, frozenset()) for g in grams), key=len)
+        shared = Counter()
+        visited = 0
+        for i, ids in enumerate(postings):
+            if i >= 3 and visited + len(ids) > self.FUZZY_POSTING_BUDGET:
+                break
+            shared.update(ids)
+            visited += len(ids)
+
+        results = []
+        for idx, _ in shared.most_common(self.MAX_CANDIDATES):
+            name_grams = set(trigrams(f"  {self._names[idx]} "))
+            similarity = 2 * len(grams & name_grams) / (len(grams) + len(name_grams))
+            if similarity >= self.FUZZY_THRESHOLD:
+                results.append((idx, similarity))
+        results.sort(key=lambda r: -r[1])
+        return results
+
+
+class ContactDirectory:
+    """Directorio de contactos compartido con refresco en segundo plano.
+
+    La lista se descarga una sola vez y se sirve desde memoria. Un hilo de
+    fondo la refresca cada `ttl` segundos; si varios llamadores encuentran el
+    directorio vacío al mismo tiempo, solo uno hace la petición al bridge y el
+    resto espera su resultado. Cada refresco reconstruye el `ContactIndex`
+    fuera del candado, así las búsquedas nunca esperan a la indexación.
+    """
+
+    def __init__(self, fetch: Callable[[], List[Dict]], ttl: float = 300.0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._contacts: Optional[List[Dict]] = None
+        self._index = ContactIndex([])
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_done = threading.Condition(self._lock)
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Contadores expuestos en /health
+        self._hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._refresh_errors = 0
+        self._last_refresh_ms = 0.0
+        self._total_refresh_ms = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return self._contacts is not None
+
+    def get(self) -> List[Dict]:
+        """Devuelve la lista de contactos, cargándola solo si aún no existe"""
+        return self._snapshot()[0]
+
+    def index(self) -> ContactIndex:
+        """Devuelve el índice de búsqueda de la lista actual"""
+        return self._snapshot()[1]
+
+    def search(self, query: str, limit: int = 5, fuzzy: bool = True) -> List[Dict]:
+        return self.index().search(query, limit=limit, fuzzy=fuzzy)
+
+    def _snapshot(self) -> Tuple[List[Dict], ContactIndex]:
+        with self._lock:
+            if self._contacts is not None:
+                self._hits += 1
+                snapshot = (self._contacts, self._index)
+                stale = time.time() - self._loaded_at > self.ttl
+            else:
+                self._misses += 1
+                snapshot = None
+                stale = False
+
+        if snapshot is not None:
+            if stale:
+                # Se sirve la copia vieja mientras se refresca en segundo plano
+                self._refresh_async()
+            return snapshot
+
+        self.refresh()
+        with self._lock:
+            return (self._contacts if self._contacts is not None else [], self._index)
+
+    def refresh(self) -> bool:
+        """Descarga de nuevo la lista. Solo corre un refresco a la vez."""
+        with self._lock:
+            if self._refreshing:
+                # Otro hilo ya está descargando: esperar su resultado
+                while self._refreshing:
+                    self._refresh_done.wait()
+                return self._contacts is not None
+            self._refreshing = True
+
+        started = time.perf_counter()
+        contacts = None
+        index = None
+        try:
+            contacts = self._fetch()
+            index = ContactIndex(contacts)
+        except Exception:
+            contacts = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self._refreshing = False
+            self._last_refresh_ms = elapsed_ms
+            if contacts is None:
+                self._refresh_errors += 1
+            else:
+                self._contacts = contacts
+                self._index = index
+                self._loaded_at = time.time()
+                self._refreshes += 1
+                self._total_refresh_ms += elapsed_ms
+            self._refresh_done.notify_all()
+        return contacts is not None
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing:
+                return
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def start(self):
+        """Inicia el hilo que mantiene el directorio actualizado"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.refresh()
+        while not self._stop.wait(self.ttl):
+            self.refresh()
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos, fallos y latencia de refresco"""
+        with self._lock:
+            return {
+                "size": len(self._contacts) if self._contacts is not None else 0,
+                "age_seconds": round(time.time() - self._loaded_at, 1) if self._loaded_at else None,
+                "ttl_seconds": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "refreshes": self._refreshes,
+                "refresh_errors": self._refresh_errors,
+                "last_refresh_ms": round(self._last_refresh_ms, 2),
+                "avg_refresh_ms": round(self._total_refresh_ms / self._refreshes, 2) if self._refreshes else 0.0,
+            }
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+
+from common.stats import percentile
+from lanes import LaneScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class InboundPipeline:
+    """Planificador de respuestas automáticas: en orden por remitente, en paralelo entre remitentes.
+
+    Los mensajes entrantes (polling, WebSocket o /webhook) se encolan desde
+    cualquier hilo con `submit()` en una fila por JID del remitente (ver
+    lanes.LaneScheduler). Un número fijo de workers (el límite global de
+    concurrencia) toma remitentes listos por turnos: cada remitente tiene como máximo un mensaje en proceso, así
+    sus respuestas salen en orden y no compiten por su historial, mientras
+    que un remitente lento no detiene a los demás.
+
+    Límites:
+      - `per_sender`: mensajes en espera por remitente; al llenarse se
+        rechaza el mensaje nuevo de ese chat para que uno ruidoso no acapare
+        la cola.
+      - `maxsize`: mensajes en espera en total. Con la política "reject" se
+        rechaza el mensaje nuevo (submit devuelve False); con "drop_oldest"
+        se descarta el más antiguo del remitente con más mensajes en espera.
+    """
+
+    OVERFLOW_POLICIES = ("reject", "drop_oldest")
+
+    def __init__(self, handler: Callable[[str, str], Awaitable], runtime,
+                 workers: int = 4, maxsize: int = 500, overflow: str = "reject",
+                 per_sender: int = 20):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Política de desbordamiento desconocida: {overflow}")
+        self._handler = handler
+        self._runtime = runtime
+        self.workers = workers
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.per_sender = per_sender
+
+        self._lanes = LaneScheduler()  # protegido por _lock
+        self._lock = threading.Lock()
+        self._tasks = []
+
+        self._accepted = 0
+        self._rejected = 0
+        self._sender_rejected = 0
+        self._dropped = 0
+        self._processed = 0
+        self._failed = 0
+        self._wait_ms = deque(maxlen=1000)
+        self._total_ms = deque(maxlen=1000)
+
+    def start(self):
+        """Arranca los workers en el event loop del runtime"""
+        if self._tasks:
+            return
+        if self._runtime.in_loop():
+            self._start_workers()
+        else:
+            self._runtime.run(self._astart())
+
+    async def _astart(self):
+        self._start_workers()
+
+    def _start_workers(self):
+        with self._lock:
+            self._lanes.start()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    def submit(self, sender: str, body: str) -> bool:
+        """Encola un mensaje entrante. Seguro desde cualquier hilo."""
+        with self._lock:
+            if self._lanes.lane_length(sender) >= self.per_sender:
+                self._sender_rejected += 1
+                return False
+            if self._lanes.depth >= self.maxsize:
+                if self.overflow == "reject":
+                    self._rejected += 1
+                    return False
+                self._lanes.drop_oldest()
+                self._dropped += 1
+
+            wake = self._lanes.push(sender, (body, time.perf_counter()))
+            self._accepted += 1
+
+        if wake:
+            self._lanes.wake()
+        return True
+
+    async def _worker(self, number: int):
+        while True:
+            await self._lanes.wait()
+            with self._lock:
+                sender = self._lanes.next()
+                if sender is None:
+                    continue
+                body, enqueued_at = self._lanes.take(sender)
+
+            started = time.perf_counter()
+            try:
+                await self._handler(sender, body)
+                failed = False
+            except Exception as e:
+                logger.error(f"Error en worker {number} procesando mensaje de {sender}: {e}")
+                failed = True
+            finished = time.perf_counter()
+
+            with self._lock:
+                if failed:
+                    self._failed += 1
+                else:
+                    self._processed += 1
+                self._wait_ms.append((started - enqueued_at) * 1000)
+                self._total_ms.append((finished - enqueued_at) * 1000)
+                # Siguiente mensaje del mismo remitente, al final de la fila de turnos
+                requeue = self._lanes.finish(sender)
+            if requeue:
+                self._lanes.wake()
+
+    def stats(self) -> Dict:
+        """Profundidad de la cola, contadores y latencias recientes"""
+        with self._lock:
+            wait_ms = list(self._wait_ms)
+            total_ms = list(self._total_ms)
+            return {
+                "workers": self.workers,
+                "queue_depth": self._lanes.depth,
+                "queue_size": self.maxsize,
+                "overflow_policy": self.overflow,
+                "senders_waiting": self._lanes.waiting(),
+                "max_sender_depth": self._lanes.longest(),
+                "per_sender_limit": self.per_sender,
+                "in_progress": len(self._lanes.busy),
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "sender_rejected": self._sender_rejected,
+                "dropped": self._dropped,
+                "processed": self._processed,
+                "failed": self._failed,
+                "queue_wait_ms_p50": round(percentile(wait_ms, 0.5), 2),
+                "latency_ms_p50": round(percentile(total_ms, 0.5), 2),
+                "latency_ms_p95": round(percentile(total_ms, 0.95), 2),
+            }
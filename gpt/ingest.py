@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+
+class IngestCursor:
+    """Último evento visto, para reanudar sin perder ni repetir mensajes"""
+
+    def __init__(self, since: Optional[float] = None, remember: int = 2000):
+        self.timestamp = since if since is not None else time.time()
+        self.event_id: Optional[str] = None
+        self._seen = set()
+        self._order = deque()
+        self._remember = remember
+
+    @staticmethod
+    def key(msg: Dict) -> str:
+        if msg.get("id"):
+            return str(msg["id"])
+        return f"{msg.get('from')}|{msg.get('timestamp')}|{msg.get('body')}"
+
+    def seen(self, msg: Dict) -> bool:
+        """True si el mensaje ya se había recibido por otra vía"""
+        return self.key(msg) in self._seen
+
+    def accept(self, msg: Dict) -> bool:
+        """Registra el mensaje y avanza el cursor; False si ya se había recibido"""
+        key = self.key(msg)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        self._order.append(key)
+        if len(self._order) > self._remember:
+            self._seen.discard(self._order.popleft())
+
+        timestamp = msg.get("timestamp") or 0
+        if timestamp > self.timestamp:
+            self.timestamp = timestamp
+        if msg.get("id"):
+            self.event_id = str(msg["id"])
+        return True
+
+    def resume_params(self) -> Dict:
+        params = {"since": int(self.timestamp)}
+        if self.event_id:
+            params["last_event_id"] = self.event_id
+        return params
+
+
+class MessageIngestor:
+    """Recepción de mensajes entrantes por WebSocket con polling de respaldo.
+
+    El WebSocket del bridge es la vía principal: usa ping de keepalive, se
+    reconecta con espera exponencial con jitter y, al reconectar, reanuda
+    desde el último evento y recupera con una consulta los mensajes que
+    llegaron mientras estaba caído. El polling solo corre mientras el socket
+    está desconectado y su intervalo se adapta al tráfico: se acorta cuando
+    llegan mensajes y se alarga mientras no hay actividad.
+
+    Si la cola de entrada rechaza un mensaje, el cursor se queda antes de
+    él: los siguientes del socket se ignoran (no deben adelantar el cursor)
+    y una consulta reintentada con espera los recupera todos, en orden,
+    cuando vuelve a haber lugar.
+    """
+
+    def __init__(self, ws_url: str, fetch_since: Callable[[float], Awaitable[List[Dict]]],
+                 on_message: Callable[[str, str], bool],
+                 ping_interval: float = 20.0, ping_timeout: float = 10.0,
+                 reconnect_min: float = 1.0, reconnect_max: float = 60.0,
+                 poll_min: float = 1.0, poll_max: float = 30.0):
+        self.ws_url = ws_url
+        self._fetch_since = fetch_since
+        self._on_message = on_message
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+
+        self.cursor = IngestCursor()
+        self.poll_interval = poll_min
+        self.connected = False
+        self.behind = False  # hubo un rechazo: hay mensajes posteriores al cursor sin entregar
+        self._socket_down: Optional[asyncio.Event] = None
+        self._recovery: Optional[asyncio.Task] = None
+        self._tasks = []
+
+        self._reconnects = 0
+        self._ws_messages = 0
+        self._polled_messages = 0
+        self._duplicates = 0
+        self._rejected = 0
+        self._polls = 0
+
+    async def run(self):
+        self._socket_down = asyncio.Event()
+        self._socket_down.set()
+        self._tasks = [
+            asyncio.create_task(self._websocket_loop()),
+            asyncio.create_task(self._polling_loop()),
+        ]
+        await asyncio.gather(*self._tasks)
+
+    def _deliver(self, msg: Dict, source: str) -> bool:
+        """Entrega un mensaje nuevo; False si la cola de entrada lo rechazó.
+
+        El cursor solo avanza con los mensajes aceptados: uno rechazado
+        (cola llena) no cuenta como recibido.
+        """
+        if not msg.get("from") or not msg.get("body"):
+            return True
+        if self.cursor.seen(msg):
+            self._duplicates += 1
+            return True
+        if not self._on_message(msg["from"], msg["body"]):
+            self._rejected += 1
+            self.behind = True
+            logger.warning(f"Cola de entrada llena: mensaje de {msg['from']} rechazado ({source})")
+            return False
+        self.cursor.accept(msg)
+        if source == "ws":
+            self._ws_messages += 1
+        else:
+            self._polled_messages += 1
+        return True
+
+    async def _catch_up(self) -> int:
+        """Consulta los mensajes posteriores al cursor; devuelve cuántos eran nuevos"""
+        before = self._polled_messages
+        messages = await self._fetch_since(self.cursor.timestamp)
+        for msg in sorted(messages, key=lambda m: m.get("timestamp") or 0):
+            if not self._deliver(msg, "poll"):
+                # El resto se vuelve a consultar en la siguiente vuelta, cuando haya lugar
+                break
+        else:
+            self.behind = False
+        return self._polled_messages - before
+
+    def _on_ws_message(self, data: Dict):
+        if self.behind:
+            # Entregarlo adelantaría el cursor más allá de los rechazados; lo trae la consulta
+            self._start_recovery()
+            return
+        if not self._deliver(data, "ws"):
+            self._start_recovery()
+
+    def _start_recovery(self):
+        if self._recovery is None or self._recovery.done():
+            self._recovery = asyncio.create_task(self._recover())
+
+    async def _recover(self):
+        """Reintenta la consulta con espera creciente hasta entregar todo lo que quedó atrás"""
+        delay = self.poll_min
+        while self.behind:
+            await asyncio.sleep(delay)
+            try:
+                await self._catch_up()
+            except Exception as e:
+                logger.warning(f"No se pudieron recuperar mensajes rechazados: {e}")
+            delay = min(self.poll_max, delay * 1.5)
+
+    async def _websocket_loop(self):
+        attempt = 0
+        while True:
+            url = f"{self.ws_url}?{urlencode(self.cursor.resume_params())}"
+            try:
+                async with websockets.connect(url, ping_interval=self.ping_interval,
+                                              ping_timeout=self.ping_timeout) as ws:
+                    logger.info("✅ Conectado al WebSocket de WhatsApp")
+                    self.connected = True
+                    self._socket_down.clear()
+                    attempt = 0
+                    # Lo que llegó mientras el socket estaba caído
+                    try:
+                        await self._catch_up()
+                    except Exception as e:
+                        logger.warning(f"No se pudieron recuperar mensajes pendientes: {e}")
+                    if self.behind:
+                        self._start_recovery()
+                    async for raw in ws:
+                        data = json.loads(raw)
+                        if data.get("type") == "message":
+                            self._on_ws_message(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"❌ Error en WebSocket: {e}")
+            finally:
+                if self.connected:
+                    self._reconnects += 1
+                self.connected = False
+                self._socket_down.set()
+
+            # Espera exponencial con jitter para no reconectar todos a la vez
+            delay = min(self.reconnect_max, self.reconnect_min * 2 ** attempt)
+            attempt += 1
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+
+    async def _polling_loop(self):
+        while True:
+            await self._socket_down.wait()
+            try:
+                self._polls += 1
+                received = await self._catch_up()
+            except Exception as e:
+                logger.warning(f"❌ Error en polling: {e}")
+                received = 0
+
+            if received:
+                self.poll_interval = self.poll_min
+            else:
+                self.poll_interval = min(self.poll_max, self.poll_interval * 1.5)
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": "websocket" if self.connected else "polling",
+            "reconnects": self._reconnects,
+            "ws_messages": self._ws_messages,
+            "polled_messages": self._polled_messages,
+            "duplicates": self._duplicates,
+            "rejected": self._rejected,
+            "behind": self.behind,
+            "polls": self._polls,
+            "poll_interval_seconds": round(self.poll_interval, 2),
+            "cursor_timestamp": self.cursor.timestamp,
+            "last_event_id": self.cursor.event_id,
+        }
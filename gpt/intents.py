@@ -0,0 +1,110 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Pattern, Tuple
+
+FLAGS = re.IGNORECASE | re.DOTALL
+
+# Verbos y conectores con y sin acento
+SEND_VERB = r"(?:env[ií]a(?:le)?|m[aá]nda(?:le)?|escr[ií]be(?:le)?)"
+TELL_VERB = r"(?:dile|d[ií]gale|decile)"
+MESSAGE_NOUN = r"(?:un\s+)?(?:mensaje|msj|whatsapp|wa)"
+RECIPIENT = r"(?P<recipient>[\w+][\w .+@-]{0,60}?)"
+QUOTED = r"[\"'“‘](?P<message>.+?)[\"'”’]"
+
+# Señales de que el texto pide más de un envío o algo distinto a enviar;
+# si aparecen en el mensaje o en el destinatario, decide el modelo
+CHAINING = re.compile(
+    r"\b(?:y\s+luego|y\s+despu[eé]s|y\s+tambi[eé]n|y\s+otr[oa]|otr[oa]\s+a|adem[aá]s)\b", FLAGS
+)
+OTHER_SEND = re.compile(
+    r"\b(?:env[ií]\w*|reenv[ií]\w*|m[aá]nd\w*|escr[ií]b\w*|dile|d[ií]gale|decile|mensaje|msj)\b", FLAGS
+)
+# Una búsqueda por "¿quién es ...?" solo si parece un nombre y no una pregunta general
+NOT_A_NAME = re.compile(r"\b(?:el|la|los|las|un|una|de|del|mi|tu|su|que|en)\b", FLAGS)
+
+
+@dataclass
+class Intent:
+    """Comando reconocido sin ambigüedad y los argumentos de su herramienta"""
+    name: str
+    args: Dict
+    options: Dict = field(default_factory=dict)
+
+
+class IntentRouter:
+    """Reconoce comandos claros antes de llamar al modelo.
+
+    Cada patrón está precompilado y anclado a todo el texto: si la entrada
+    no encaja completa en alguno se considera ambigua y `match` devuelve
+    None para que la resuelva el LLM. Es conservador a propósito: un envío
+    solo se reconoce con el mensaje explícito ("que diga", dos puntos o
+    entre comillas) y se descarta si el mensaje o el destinatario encadenan
+    otro envío ("y luego otro a Pedro..."). El router solo interpreta el texto;
+    ejecutar la herramienta (y decidir si el resultado alcanza) le toca a
+    quien lo usa.
+    """
+
+    MAX_RECIPIENT_WORDS = 4  # más que esto probablemente no es un nombre
+
+    PATTERNS: List[Tuple[str, str, Dict]] = [
+        # "envía un mensaje a Juan que diga hola", "mándale un msj a Ana: llego tarde"
+        ("send_message", rf"{SEND_VERB}\s+{MESSAGE_NOUN}\s+a\s+{RECIPIENT}\s*(?::|\s+que\s+diga\s*:?)\s*(?P<message>.+)", {}),
+        # "dile a Juan: llego tarde", "dile a Juan 'llego tarde'"
+        ("send_message", rf"{TELL_VERB}\s+a\s+{RECIPIENT}\s*(?::\s*(?P<said>.+)|\s{QUOTED})", {}),
+        # "envía 'hola' a Juan"
+        ("send_message", rf"{SEND_VERB}\s+(?:el\s+mensaje\s+)?{QUOTED}\s+a\s+{RECIPIENT}", {}),
+        # "busca el contacto Juan", "buscar contactos de López"
+        ("search_contacts", r"busca(?:r)?\s+(?:el\s+|al\s+|los\s+)?contactos?\s+(?:de\s+|llamad[oa]s?\s+)?(?P<query>.+?)\??", {}),
+        # "¿quién es Juan?" (sin coincidencia aproximada: podría no ser un contacto)
+        ("search_contacts", r"¿?\s*qui[eé]n\s+es\s+(?P<query>.+?)\s*\??", {"fuzzy": False}),
+        # "suma 2 y 3", "¿cuánto es 2 + 3?", "2+3"
+        ("sumar", r"¿?\s*(?:suma(?:r)?|cu[aá]nto\s+es|calcula)?\s*(?P<a>-?\d+)\s*(?:\+|y|m[aá]s)\s*(?P<b>-?\d+)\s*=?\s*\??", {}),
+    ]
+
+    def __init__(self):
+        self._compiled: List[Tuple[str, Pattern, Dict]] = [
+            (name, re.compile(rf"\s*{pattern}\s*[.!]?\s*", FLAGS), options)
+            for name, pattern, options in self.PATTERNS
+        ]
+        self._lock = threading.Lock()
+        self._matched: Dict[str, int] = {}
+        self._unmatched = 0
+
+    def match(self, text: str) -> Optional[Intent]:
+        for name, regex, options in self._compiled:
+            found = regex.fullmatch(text)
+            if found is None:
+                continue
+            intent = self._build(name, found.groupdict(), options)
+            if intent is not None:
+                with self._lock:
+                    self._matched[name] = self._matched.get(name, 0) + 1
+                return intent
+        with self._lock:
+            self._unmatched += 1
+        return None
+
+    def _build(self, name: str, groups: Dict, options: Dict) -> Optional[Intent]:
+        if name == "send_message":
+            recipient = groups["recipient"].strip()
+            message = (groups.get("said") or groups["message"] or "").strip()
+            if not recipient or not message or len(recipient.split()) > self.MAX_RECIPIENT_WORDS:
+                return None
+            if re.search(r"\by\b|,", recipient) or CHAINING.search(message) or OTHER_SEND.search(message):
+                return None  # varios destinatarios o varios envíos
+            return Intent(name, {"recipient": recipient, "message": message}, dict(options))
+        if name == "search_contacts":
+            query = groups["query"].strip(" ?¿")
+            if not query or len(query.split()) > self.MAX_RECIPIENT_WORDS or CHAINING.search(query):
+                return None
+            if options.get("fuzzy") is False and NOT_A_NAME.search(query):
+                return None  # "¿quién es el presidente...?" no es una búsqueda de contactos
+            return Intent(name, {"query": query}, dict(options))
+        if name == "sumar":
+            return Intent(name, {"a": int(groups["a"]), "b": int(groups["b"])}, dict(options))
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"matched": dict(self._matched), "unmatched": self._unmatched}
@@ -0,0 +1,108 @@
+import asyncio
+from collections import deque
+from typing import Any, Dict, Hashable, Optional
+
+
+class LaneScheduler:
+    """Filas por clave atendidas por turnos, compartido por InboundPipeline y OutboundQueue.
+
+    Cada clave (remitente o destinatario) tiene su fila y está como mucho
+    una vez en `ready`, la fila de turnos de las claves con mensajes
+    pendientes que nadie está atendiendo. Un worker toma una clave con
+    `next()`, la marca ocupada con `take()` (o `hold()` si todavía no puede
+    atenderla) y al terminar la devuelve con `finish()`: si le quedan
+    mensajes vuelve al final de la fila de turnos. Así los mensajes de una
+    clave salen en orden y una clave con muchos pendientes no frena a las
+    demás.
+
+    No es seguro entre hilos por sí mismo: quien lo usa lo protege con su
+    candado. `wake()` sí puede llamarse desde cualquier hilo.
+    """
+
+    def __init__(self):
+        self.lanes: Dict[Hashable, deque] = {}
+        self.ready = deque()   # claves con mensajes pendientes, ni ocupadas ni frenadas
+        self.busy = set()      # claves con un mensaje en proceso (o esperando turno propio)
+        self.depth = 0
+        self._available: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self):
+        """Crea el semáforo de turnos en el loop actual (con las claves encoladas antes de arrancar)"""
+        self._loop = asyncio.get_running_loop()
+        self._available = asyncio.Semaphore(len(self.ready))
+
+    async def wait(self):
+        """Espera a que haya un turno disponible"""
+        await self._available.acquire()
+
+    def wake(self):
+        """Avisa a un worker que hay un turno nuevo. Seguro desde cualquier hilo."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._available.release)
+
+    def lane_length(self, key: Hashable) -> int:
+        lane = self.lanes.get(key)
+        return len(lane) if lane else 0
+
+    def push(self, key: Hashable, item: Any) -> bool:
+        """Agrega `item` a la fila de `key`; True si la clave entró a la fila de turnos (hay que llamar a `wake`)"""
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = deque()
+        lane.append(item)
+        self.depth += 1
+        if key not in self.busy and len(lane) == 1:
+            self.ready.append(key)
+            return True
+        return False
+
+    def next(self) -> Optional[Hashable]:
+        """Siguiente clave de la fila de turnos, o None si no hay"""
+        while self.ready:
+            key = self.ready.popleft()
+            if self.lanes.get(key):
+                return key
+            self.lanes.pop(key, None)
+        return None
+
+    def hold(self, key: Hashable):
+        """Marca la clave como ocupada sin sacar un mensaje (p. ej. frenada por su límite de ritmo)"""
+        self.busy.add(key)
+
+    def take(self, key: Hashable) -> Any:
+        """Saca el primer mensaje de la clave y la marca ocupada"""
+        item = self.lanes[key].popleft()
+        self.depth -= 1
+        self.busy.add(key)
+        return item
+
+    def finish(self, key: Hashable) -> bool:
+        """Libera la clave; True si volvió a la fila de turnos (hay que despertar a un worker)"""
+        self.busy.discard(key)
+        if self.lanes.get(key):
+            self.ready.append(key)
+            return True
+        self.lanes.pop(key, None)
+        return False
+
+    def drop_oldest(self) -> Any:
+        """Descarta el mensaje más antiguo de la clave con más pendientes y lo devuelve"""
+        key = max(self.lanes, key=lambda k: len(self.lanes[k]))
+        lane = self.lanes[key]
+        item = lane.popleft()
+        self.depth -= 1
+        if not lane:
+            # Sin mensajes no puede seguir en la fila de turnos: si le llega
+            # otro se encola de nuevo una sola vez
+            del self.lanes[key]
+            if key not in self.busy:
+                self.ready.remove(key)
+        return item
+
+    def waiting(self) -> int:
+        """Claves con mensajes pendientes"""
+        return sum(1 for lane in self.lanes.values() if lane)
+
+    def longest(self) -> int:
+        return max((len(lane) for lane in self.lanes.values()), default=0)
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Optional
+
+from common.stats import percentile
+from lanes import LaneScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """`rate` envíos por segundo en promedio, con ráfagas de hasta `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Segundos hasta que haya una ficha (0 si ya hay)"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    @property
+    def idle(self) -> bool:
+        return self.wait_time() == 0 and self.tokens >= self.burst
+
+
+class OutboundQueue:
+    """Cola de envíos hacia el bridge con límites de ritmo y seguimiento por mensaje.
+
+    Todos los envíos (endpoints, herramientas del modelo y respuestas
+    automáticas) pasan por aquí en vez de ir directo a /api/send, así una
+    ráfaga no llega de golpe a WhatsApp. Igual que InboundPipeline (y con
+    el mismo lanes.LaneScheduler), los mensajes esperan en una fila por destinatario y un número fijo de
+    workers los toma por turnos: los mensajes a un mismo destinatario
+    salen en orden y uno con muchos pendientes no frena a los demás.
+
+    Límites (token bucket):
+      - global: `rate` envíos por segundo con ráfagas de `burst`; los
+        workers esperan su turno.
+      - por destinatario: `recipient_rate` y `recipient_burst`. Un
+        destinatario sin fichas vuelve a la fila cuando le toque, sin
+        ocupar un worker mientras tanto.
+
+    Cada mensaje recibe un id; `status(id)` devuelve su estado (queued,
+    sending, sent o failed) mientras siga entre los últimos `history`.
+    """
+
+    def __init__(self, sender: Callable[[str, str], Awaitable], runtime, workers: int = 2,
+                 rate: float = 1.0, burst: int = 5, recipient_rate: float = 0.2, recipient_burst: int = 3,
+                 maxsize: int = 1000, history: int = 10000):
+        self._sender = sender
+        self._runtime = runtime
+        self.workers = workers
+        self.maxsize = maxsize
+        self.history = history
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+
+        self._global = TokenBucket(rate, burst)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lanes = LaneScheduler()  # protegido por _lock; ocupados: enviando o esperando fichas
+        self._deliveries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._waiters: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._tasks = []
+
+        self._accepted = 0
+        self._rejected = 0
+        self._throttled = 0
+        self._sent = 0
+        self._failed = 0
+        self._wait_ms = deque(maxlen=1000)
+
+    def start(self):
+        """Arranca los workers en el event loop del runtime"""
+        if self._tasks:
+            return
+        if self._runtime.in_loop():
+            self._start_workers()
+        else:
+            self._runtime.run(self._astart())
+
+    async def _astart(self):
+        self._start_workers()
+
+    def _start_workers(self):
+        if self._tasks:
+            return
+        with self._lock:
+            self._lanes.start()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    def submit(self, recipient: str, message: str) -> Optional[str]:
+        """Encola un envío y devuelve su id (None si la cola está llena). Seguro desde cualquier hilo."""
+        with self._lock:
+            if self._lanes.depth >= self.maxsize:
+                self._rejected += 1
+                return None
+            message_id = uuid.uuid4().hex
+            self._deliveries[message_id] = {
+                "id": message_id,
+                "recipient": recipient,
+                "status": "queued",
+                "queued_at": time.time(),
+                "sent_at": None,
+                "error": None,
+            }
+            while len(self._deliveries) > self.history:
+                self._deliveries.popitem(last=False)
+
+            wake = self._lanes.push(recipient, (message_id, message, time.perf_counter()))
+            self._accepted += 1
+
+        if wake:
+            self._lanes.wake()
+        return message_id
+
+    async def send(self, recipient: str, message: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Encola y espera el resultado del envío (como mucho `timeout` segundos).
+
+        Devuelve el estado del mensaje (que sigue "queued" si se agotó la
+        espera) o None si la cola está llena. Si el mensaje ya salió del
+        historial de estados se devuelve con status "unknown": None queda
+        reservado para el rechazo. Debe llamarse desde el loop.
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        message_id = self.submit(recipient, message)
+        if message_id is None:
+            return None
+        self._waiters[message_id] = future
+        try:
+            delivery = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            delivery = self.status(message_id)
+        finally:
+            self._waiters.pop(message_id, None)
+        if delivery is None:
+            delivery = {"id": message_id, "recipient": recipient, "status": "unknown",
+                        "queued_at": None, "sent_at": None, "error": None}
+        return delivery
+
+    def status(self, message_id: str) -> Optional[Dict]:
+        with self._lock:
+            delivery = self._deliveries.get(message_id)
+            return dict(delivery) if delivery else None
+
+    def _bucket(self, recipient: str) -> TokenBucket:
+        bucket = self._buckets.get(recipient)
+        if bucket is None:
+            if len(self._buckets) > self.maxsize:
+                # Los destinatarios con el bucket lleno no necesitan recordarse
+                for key in [k for k, b in self._buckets.items() if b.idle and k not in self._lanes.lanes]:
+                    del self._buckets[key]
+            bucket = self._buckets[recipient] = TokenBucket(self.recipient_rate, self.recipient_burst)
+        return bucket
+
+    def _release(self, recipient: str):
+        """El destinatario vuelve a la fila de turnos si le quedan mensajes"""
+        with self._lock:
+            requeue = self._lanes.finish(recipient)
+        if requeue:
+            self._lanes.wake()
+
+    def _update(self, message_id: str, **fields) -> Optional[Dict]:
+        with self._lock:
+            delivery = self._deliveries.get(message_id)
+            if delivery is None:
+                return None
+            delivery.update(fields)
+            return dict(delivery)
+
+    async def _worker(self, number: int):
+        while True:
+            await self._lanes.wait()
+            with self._lock:
+                recipient = self._lanes.next()
+                if recipient is None:
+                    continue
+                wait = self._bucket(recipient).wait_time()
+                if wait > 0:
+                    # Todavía no le toca: vuelve a la fila cuando tenga ficha
+                    self._lanes.hold(recipient)
+                    self._throttled += 1
+                    self._runtime.loop.call_later(wait, self._release, recipient)
+                    continue
+                self._bucket(recipient).take()
+                message_id, message, enqueued_at = self._lanes.take(recipient)
+
+            # Límite global: todos los workers comparten las mismas fichas
+            while (wait := self._global.wait_time()) > 0:
+                await asyncio.sleep(wait)
+            self._global.take()
+
+            self._update(message_id, status="sending")
+            self._wait_ms.append((time.perf_counter() - enqueued_at) * 1000)
+            try:
+                await self._sender(recipient, message)
+                delivery = self._update(message_id, status="sent", sent_at=time.time())
+                self._sent += 1
+            except Exception as e:
+                logger.error(f"Error en worker {number} enviando a {recipient}: {e}")
+                delivery = self._update(message_id, status="failed", error=str(e))
+                self._failed += 1
+
+            waiter = self._waiters.get(message_id)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(delivery)
+            self._release(recipient)
+
+    def stats(self) -> Dict:
+        """Profundidad de la cola, contadores y espera reciente"""
+        with self._lock:
+            wait_ms = list(self._wait_ms)
+            return {
+                "workers": self.workers,
+                "queue_depth": self._lanes.depth,
+                "queue_size": self.maxsize,
+                "rate_per_second": self._global.rate,
+                "recipient_rate_per_second": self.recipient_rate,
+                "recipients_waiting": self._lanes.waiting(),
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "throttled": self._throttled,
+                "sent": self._sent,
+                "failed": self._failed,
+                "queue_wait_ms_p50": round(percentile(wait_ms, 0.5), 2),
+                "queue_wait_ms_p95": round(percentile(wait_ms, 0.95), 2),
+            }
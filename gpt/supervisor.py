@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessSupervisor:
+    """Arranca, vigila y detiene un proceso hijo (el servidor MCP de WhatsApp).
+
+    - La salida (stdout y stderr) se lee continuamente en el event loop y
+      se guarda en un buffer circular de `log_lines` líneas, así el proceso
+      nunca se bloquea por un pipe lleno y los logs se pueden consultar.
+    - `start()` vuelve en cuanto `ready()` da True, comprobando con
+      backoff (hasta `start_timeout` segundos) en vez de dormir un tiempo fijo.
+    - Si el proceso termina sin que se pidiera, se vuelve a arrancar con
+      backoff exponencial (1 s, 2 s, 4 s... hasta `max_restart_delay`). Solo
+      se reinicia un proceso que llegó a estar listo: uno que falla al
+      arrancar es un error de configuración, no una caída.
+    - `stop()` termina el grupo de procesos del PID que arrancó (SIGTERM y,
+      pasado `stop_timeout`, SIGKILL), sin buscar procesos por nombre.
+    Debe usarse desde el event loop del runtime.
+    """
+
+    STABLE_AFTER = 60.0  # segundos funcionando tras los que el backoff vuelve a empezar
+    MAX_LINE = 64 * 1024  # bytes que se guardan de una línea de salida; el resto se descarta
+
+    def __init__(self, command: List[str], ready: Callable[[], Awaitable[bool]], cwd: Optional[str] = None,
+                 log_lines: int = 1000, start_timeout: float = 15.0, stop_timeout: float = 10.0,
+                 restart: bool = True, max_restart_delay: float = 60.0):
+        self.command = command
+        self.cwd = cwd
+        self._ready = ready
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.restart = restart
+        self.max_restart_delay = max_restart_delay
+
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._logs = deque(maxlen=log_lines)
+        self._watcher: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+        self._started_at = 0.0
+        self._restarts = 0
+        self._last_exit: Optional[int] = None
+        self._last_ready_ms: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def start(self) -> Dict:
+        """Arranca el proceso (si no corre ya) y espera a que esté listo"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.running:
+                return {"status": "success", "message": "Servidor ya está en ejecución", "pid": self._process.pid}
+            self._stopping = False
+            if not await self._spawn():
+                return {"status": "error", "message": "No se pudo iniciar el servidor", "logs": self.logs(20)}
+            self._watcher = asyncio.create_task(self._watch())
+            return {
+                "status": "success",
+                "message": "Servidor iniciado",
+                "pid": self._process.pid,
+                "ready_ms": self._last_ready_ms
+            }
+
+    async def _spawn(self) -> bool:
+        self._process = await asyncio.create_subprocess_exec(
+            *self.command,
+            cwd=self.cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True  # grupo propio: stop() alcanza también a los hijos de uv
+        )
+        self._started_at = time.monotonic()
+        process = self._process
+        for name, stream in (("stdout", process.stdout), ("stderr", process.stderr)):
+            asyncio.create_task(self._drain(name, stream))
+        logger.info(f"Proceso iniciado (pid {process.pid}): {' '.join(self.command)}")
+
+        ready = await self._wait_ready(process)
+        if ready:
+            self._last_ready_ms = round((time.monotonic() - self._started_at) * 1000, 1)
+            return True
+        if process.returncode is None:
+            await self._terminate(process)
+        return False
+
+    async def _wait_ready(self, process: asyncio.subprocess.Process) -> bool:
+        deadline = time.monotonic() + self.start_timeout
+        delay = 0.05
+        while process.returncode is None:
+            try:
+                if await self._ready():
+                    return True
+            except Exception:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 2.0)
+        return False
+
+    async def _drain(self, name: str, stream: asyncio.StreamReader):
+        long_line = b""  # comienzo de una línea que no cabe en el buffer del stream
+        while True:
+            try:
+                line = await stream.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                # Fin de la salida: queda como mucho una última línea sin salto
+                if long_line or e.partial:
+                    self._append_log(name, long_line + e.partial)
+                return
+            except asyncio.LimitOverrunError as e:
+                # Línea más larga que el límite del stream (64 KiB): readline()
+                # lanzaría y mataría esta tarea. Se lee por trozos lo que ya
+                # está en el buffer y se guarda solo el comienzo.
+                chunk = await stream.read(e.consumed)
+                long_line = (long_line + chunk)[:self.MAX_LINE]
+                continue
+            self._append_log(name, long_line + line)
+            long_line = b""
+
+    def _append_log(self, name: str, line: bytes):
+        text = line[:self.MAX_LINE].decode(errors="replace").rstrip()
+        self._logs.append({"time": time.time(), "stream": name, "line": text})
+
+    async def _watch(self):
+        """Espera a que el proceso termine y, si no se pidió, lo reinicia con backoff"""
+        delay = 1.0
+        while True:
+            process = self._process
+            self._last_exit = await process.wait()
+            if self._stopping or not self.restart:
+                return
+            if time.monotonic() - self._started_at > self.STABLE_AFTER:
+                delay = 1.0
+            logger.warning(f"Proceso {process.pid} terminó con código {self._last_exit}; reinicio en {delay:g} s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_restart_delay)
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            # Con el mismo candado que start()/stop(): un reinicio no puede cruzarse con una parada
+            async with self._lock:
+                if self._stopping or self.running:
+                    return  # se detuvo, o start() ya lo arrancó con su propio vigilante
+                self._restarts += 1
+                try:
+                    await self._spawn()
+                except Exception as e:
+                    # Sin el ejecutable (OSError) o similar: se reintenta con la misma espera creciente
+                    logger.error(f"No se pudo reiniciar el proceso: {e}")
+
+    async def stop(self) -> Dict:
+        """Detiene el proceso arrancado por este supervisor (por su PID)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._stopping = True
+            if not self.running:
+                return {"status": "error", "message": "El servidor no fue iniciado desde aquí o ya está detenido"}
+            pid = self._process.pid
+            await self._terminate(self._process)
+            return {"status": "success", "message": "Servidor detenido", "pid": pid,
+                    "exit_code": self._process.returncode}
+
+    async def _terminate(self, process: asyncio.subprocess.Process):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            await asyncio.wait_for(process.wait(), self.stop_timeout)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            logger.warning(f"Proceso {process.pid} no terminó con SIGTERM; se envía SIGKILL")
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    def logs(self, limit: int = 100, stream: Optional[str] = None) -> List[Dict]:
+        """Últimas `limit` líneas de salida (de un solo stream si se indica)"""
+        lines = [entry for entry in list(self._logs) if stream is None or entry["stream"] == stream]
+        return lines[-limit:] if limit > 0 else []
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "pid": self._process.pid if self.running else None,
+            "uptime_s": round(time.monotonic() - self._started_at, 1) if self.running else 0,
+            "restarts": self._restarts,
+            "last_exit_code": self._last_exit,
+            "ready_ms": self._last_ready_ms,
+            "log_lines": len(self._logs),
+        }
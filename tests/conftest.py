@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Los módulos de gpt/ se importan por nombre (como hace app.py) y common/ desde la raíz
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "gpt"))
+
+from common.runtime import AsyncRuntime
+
+
+@pytest.fixture
+def runtime():
+    """Un runtime propio por prueba, con su loop en un hilo aparte (como con Flask)"""
+    rt = AsyncRuntime()
+    yield rt
+
+    async def cancel_tasks():
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    rt.run(cancel_tasks(), timeout=5)
+    rt.loop.call_soon_threadsafe(rt.loop.stop)
+
+
+def eventually(predicate, timeout: float = 2.0) -> bool:
+    """Espera (sondeando) a que `predicate()` sea verdadero"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
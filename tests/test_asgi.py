@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+asgi = pytest.importorskip("asgi")
+
+
+def request(method, path, **kwargs):
+    async def go():
+        client = asgi.app.test_client()
+        response = await client.open(path, method=method, **kwargs)
+        return response.status_code, await response.get_data(as_text=True), response.headers
+    return asyncio.run(go())
+
+
+def test_missing_fields_are_rejected_like_flask():
+    status, body, _ = request("POST", "/search-contacts", json={})
+    assert status == 400
+    assert "query" in body
+
+
+def test_non_json_body_is_rejected():
+    status, _, _ = request("POST", "/mcp-to-openai", data="hola")
+    assert status == 400
+
+
+def test_health_reports_asgi_mode():
+    status, body, _ = request("GET", "/health")
+    assert status == 200
+    assert '"mode": "asgi"' in body or '"mode":"asgi"' in body
+
+
+def test_metrics_are_served():
+    status, body, headers = request("GET", "/metrics")
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/plain")
+    assert "http_requests_total" in body
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+import httpx
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip("quart")
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import load
+import run as bench_run
+from stubs import FIRST_NAMES, LAST_NAMES, synthetic_contacts
+
+
+def test_synthetic_contacts_are_deterministic_with_unique_numbers():
+    contacts = synthetic_contacts(500)
+    assert contacts == synthetic_contacts(500)
+    assert synthetic_contacts(500, seed=8) != contacts
+    assert len({c["jid"] for c in contacts}) == 500
+    assert all(c["jid"].endswith("@s.whatsapp.net") for c in contacts)
+
+
+def test_synthetic_names_stay_distinguishable_past_the_combinations():
+    combinations = len(FIRST_NAMES) * len(LAST_NAMES)
+    contacts = synthetic_contacts(combinations + 3)
+    assert contacts[combinations]["name"].endswith(f" {combinations}")
+    assert len(contacts[combinations - 1]["name"].split()) == 2
+
+
+@pytest.mark.parametrize("value, levels", [("1,8,32", [1, 8, 32]), ("4", [4]), ("1, 2,", [1, 2])])
+def test_parse_levels(value, levels):
+    assert load.parse_levels(value) == levels
+
+
+def test_parse_levels_rejects_garbage():
+    with pytest.raises(ValueError):
+        load.parse_levels("1,x")
+    with pytest.raises(SystemExit):
+        load.parse_args(["--concurrency", "uno"])
+
+
+def test_typo_swaps_two_inner_letters():
+    name = "Carmen Ruiz"
+    swapped = load.typo(name, random.Random(3))
+    assert swapped != name and sorted(swapped) == sorted(name)
+    assert swapped[0] == name[0] and swapped[-1] == name[-1]
+    assert load.typo("Ana", random.Random(3)) == "Ana"
+
+
+def test_run_level_reports_statuses_and_latencies():
+    def handler(request):
+        return httpx.Response(200 if request.url.path == "/ok" else 503)
+
+    def build(rng, i):
+        return ("/ok" if i % 4 else "/falla"), {"i": i}
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://bench") as client:
+            return await load.run_level(client, build, concurrency=4, requests=20)
+
+    result = asyncio.run(scenario())
+    assert result["statuses"] == {"200": 15, "503": 5}
+    assert result["ok"] == 15 and result["errors"] == 5
+    assert 0 <= result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"] <= result["max_ms"]
+    assert load.format_row({"scenario": "search", "contacts": 10, **result}).startswith("search")
+
+
+@pytest.mark.parametrize("app", ["gpt", "deepseek"])
+def test_apps_start_their_background_services(app):
+    args = argparse.Namespace(app=app, server="flask", port=5999)
+    command = bench_run.app_command(args)
+    assert "app.start_background_services()" in command[-1]
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from contacts import ContactIndex
+
+app_module = pytest.importorskip("app")
+
+CONTACTS = [
+    {"name": "Ana López", "jid": "5215550000001@s.whatsapp.net"},
+    {"name": "Juan Pérez", "jid": "5215550000002@s.whatsapp.net"},
+    {"name": "Juan Pérez", "jid": "5215550000003@s.whatsapp.net"},
+]
+
+
+@pytest.mark.parametrize("data, error", [
+    ({"recipients": []}, "no vacía"),
+    ({"recipients": "Ana"}, "no vacía"),
+    ({"recipients": [{"message": "sin destinatario"}]}, "'to'"),
+    ({"recipients": [3]}, "'to'"),
+    ({"recipients": ["Ana"] * (app_module.BULK_MAX_RECIPIENTS + 1)}, "Máximo"),
+])
+def test_validate_bulk_rejects_bad_lists(data, error):
+    assert error in app_module.validate_bulk(data)
+
+
+def test_validate_bulk_accepts_names_and_objects():
+    assert app_module.validate_bulk({"recipients": ["Ana", {"to": "5215550000002", "vars": {}}]}) is None
+
+
+def test_render_bulk_message_fills_contact_fields_and_variables():
+    contact = {"name": "Ana López", "phone": "5215550000001"}
+    text = app_module.render_bulk_message("Hola {first_name}, tu pedido {pedido} va a {phone}", contact, {"pedido": 7})
+    assert text == "Hola Ana, tu pedido 7 va a 5215550000001"
+    assert app_module.render_bulk_message("Hola {name}", None, {}) == "Hola "
+    with pytest.raises(KeyError):
+        app_module.render_bulk_message("{falta}", contact, {})
+
+
+def test_resolve_many_separates_found_ambiguous_and_missing():
+    index = ContactIndex(CONTACTS)
+    states = [state for state, _ in index.resolve_many(["ana lópez", "Juan Pérez", "Pedro", "5215550000001"])]
+    assert states == ["found", "ambiguous", "not_found", "found"]
+
+
+@pytest.fixture
+def bulk_env(monkeypatch):
+    sent = []
+
+    async def loaded():
+        return None
+
+    async def sender(recipient, message):
+        sent.append((recipient, message))
+
+    class Directory:
+        def index(self):
+            return ContactIndex(CONTACTS)
+
+    queue = app_module.OutboundQueue(sender, app_module.runtime, workers=2, rate=1000, burst=1000,
+                                     recipient_rate=1000, recipient_burst=1000)
+    monkeypatch.setattr(app_module, "ensure_contacts_loaded", loaded)
+    monkeypatch.setattr(app_module, "contact_directory", Directory())
+    monkeypatch.setattr(app_module, "outbound_queue", queue)
+    yield sent
+    for task in queue._tasks:
+        app_module.runtime.loop.call_soon_threadsafe(task.cancel)
+
+
+def test_send_bulk_reports_every_recipient_and_a_summary(bulk_env):
+    response = app_module.app.test_client().post("/send-bulk", json={
+        "message": "Hola {first_name}",
+        "recipients": ["Ana López", "Juan Pérez", "Pedro", "55 5000 0009", "12", "Ana López",
+                       {"to": "5215550000002@s.whatsapp.net", "message": "{nope}"}],
+    })
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    by_index = {line["index"]: line for line in lines if "index" in line}
+    assert [by_index[i]["status"] for i in range(7)] == [
+        "sent", "ambiguous", "not_found", "sent", "invalid", "duplicate", "invalid"
+    ]
+    assert lines[-1]["summary"]["total"] == 7 and lines[-1]["summary"]["sent"] == 2
+    assert sorted(bulk_env) == [("5215550000001@s.whatsapp.net", "Hola Ana"), ("5215550000009", "Hola ")]
@@ -0,0 +1,105 @@
+import asyncio
+import json
+from functools import partial
+
+from common.tools import chat_response, chat_rounds, single_response, tool_failed
+
+
+def tool_call(name, args, call_id="c1"):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+
+
+class FakeModel:
+    """Responde con la lista de mensajes dada, uno por vuelta, y guarda cada petición"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.payloads = []
+
+    async def chat(self, payload):
+        self.payloads.append({**payload, "messages": list(payload["messages"])})
+        return {"choices": [{"message": self.replies.pop(0)}]}
+
+    async def stream(self, payload):
+        result = await self.chat(payload)
+        message = result["choices"][0]["message"]
+        for word in (message.get("content") or "").split():
+            yield {"type": "token", "text": word}
+        yield {"type": "message", "message": message}
+
+
+async def sumar(name, args):
+    return {"resultado": args["a"] + args["b"]}
+
+
+def collect(messages, chat, renderers=None, max_rounds=3):
+    def payload(rounds):
+        return {"messages": messages, "tool_choice": "auto" if rounds < max_rounds else "none"}
+
+    async def go():
+        return [event async for event in chat_rounds(messages, payload, chat, sumar, renderers, 1.0, "sin respuesta",
+                                                        max_rounds=max_rounds)]
+    return asyncio.run(go())
+
+
+def test_plain_answer_streams_tokens_then_done():
+    model = FakeModel({"role": "assistant", "content": "hola que tal"})
+    events = collect([], model.stream)
+    assert [kind for kind, _ in events] == ["token", "token", "token", "done"]
+    done = events[-1][1]
+    assert done["response"] == "hola que tal" and done["records"] == [] and not done["rendered"]
+
+
+def test_tool_rounds_stop_even_if_the_model_ignores_tool_choice():
+    """Un backend que sigue pidiendo herramientas con tool_choice "none" no hace vueltas sin fin"""
+    call = {"role": "assistant", "content": None, "tool_calls": [tool_call("sumar", {"a": 1, "b": 1})]}
+    model = FakeModel(*[call] * 10)
+    events = collect([], partial(single_response, model.chat), max_rounds=2)
+    done = events[-1][1]
+    assert done["response"] == "sin respuesta" and len(done["records"]) == 2
+    assert len(model.payloads) == 3 and model.payloads[-1]["tool_choice"] == "none"
+
+
+def test_tool_results_go_back_to_the_model():
+    model = FakeModel(
+        {"role": "assistant", "content": None, "tool_calls": [tool_call("sumar", {"a": 2, "b": 3})]},
+        {"role": "assistant", "content": "Son 5"},
+    )
+    messages = [{"role": "user", "content": "suma 2 y 3"}]
+    events = collect(messages, partial(single_response, model.chat))
+    assert [kind for kind, _ in events] == ["tool_call", "tool_result", "done"]
+    assert events[-1][1]["response"] == "Son 5"
+    # La segunda petición lleva la llamada y su resultado
+    assert [m["role"] for m in model.payloads[1]["messages"]] == ["user", "assistant", "tool"]
+
+
+def test_renderer_answers_without_a_second_call():
+    model = FakeModel({"role": "assistant", "content": None, "tool_calls": [tool_call("sumar", {"a": 2, "b": 3})]})
+    renderers = {"sumar": lambda args, output: f"{args['a']} + {args['b']} = {output['resultado']}"}
+    events = collect([], partial(single_response, model.chat), renderers)
+    done = events[-1][1]
+    assert done["response"] == "2 + 3 = 5" and done["rendered"] and len(model.payloads) == 1
+    assert done["last_round"] == done["records"]
+    assert events[-2] == ("token", {"text": "2 + 3 = 5"})
+
+
+def test_last_round_forbids_more_tools():
+    call = {"role": "assistant", "content": None, "tool_calls": [tool_call("sumar", {"a": 1, "b": 1})]}
+    model = FakeModel(call, call, {"role": "assistant", "content": None})
+    events = collect([], partial(single_response, model.chat), max_rounds=2)
+    assert [p["tool_choice"] for p in model.payloads] == ["auto", "auto", "none"]
+    assert events[-1][1]["response"] == "sin respuesta" and len(events[-1][1]["records"]) == 2
+
+
+def test_chat_response_keeps_the_compatible_fields():
+    done = {"response": "ok", "records": [{"name": "sumar", "output": {"resultado": 2}}],
+            "last_round": [], "rendered": True, "cache_hits": [True, False]}
+    body = chat_response("s", 42, done)
+    assert body["tool_used"] and body["tool_name"] == "sumar" and body["output"] == {"resultado": 2}
+    assert body["cache"] == {"hits": 1, "calls": 2} and body["prompt_tokens"] == 42
+
+
+def test_tool_failed_matches_both_apps():
+    assert tool_failed({"success": False})
+    assert tool_failed({"error": "x"})
+    assert not tool_failed({"success": True}) and not tool_failed([{"error": "no es dict"}])
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+app_module = pytest.importorskip("app")
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    reply = {"role": "assistant", "content": "hola, soy una prueba"}
+
+    async def chat(payload):
+        return {"choices": [{"message": reply}]}
+
+    async def chat_stream(payload):
+        yield {"type": "token", "text": reply["content"]}
+        yield {"type": "message", "message": reply}
+
+    monkeypatch.setattr(app_module, "openai_chat", chat)
+    monkeypatch.setattr(app_module, "openai_chat_stream", chat_stream)
+
+
+def test_blocking_and_streaming_routes_return_the_same_body(fake_model):
+    client = app_module.app.test_client()
+    blocking = client.post("/mcp-to-openai", json={"input": "hola", "session_id": "rutas-1"}).get_json()
+
+    response = client.post("/mcp-to-openai/stream", json={"input": "hola", "session_id": "rutas-2"})
+    events = [block.split("\n") for block in response.get_data(as_text=True).strip().split("\n\n")]
+    done = json.loads(next(lines[1][len("data: "):] for lines in events if lines[0] == "event: done"))
+
+    assert blocking["response"] == done["response"] == "hola, soy una prueba"
+    assert {**blocking, "session_id": None} == {**done, "session_id": None}
+    assert ["event: token", "event: done"] == [lines[0] for lines in events]
+
+
+def test_gpt_renderers_cover_every_send_outcome():
+    renderers = app_module.tool_renderers
+    options = [{"name": "Juan Pérez", "phone": "5215550001"}, {"name": "Juan López", "phone": "5215550002"}]
+    send = renderers["send_message"]
+    assert send({}, {"success": True, "contact": "Ana"}) == "Mensaje enviado a Ana"
+    assert send({}, {"success": True, "recipient": "5215550003"}) == "Mensaje enviado a 5215550003"
+    assert send({}, {"success": False, "error": "sin conexión"}) == "No se pudo enviar el mensaje: sin conexión"
+    assert "¿A cuál" in send({}, {"multiple_contacts": True, "options": options})
+    assert renderers["search_contacts"]({"query": "zz"}, []) == "No encontré contactos para 'zz'"
+    assert renderers["search_contacts"]({"query": "Juan"}, options).count("\n") == 2
+    assert renderers["control_whatsapp_server"]({}, {"error": "no soportada"}) == "no soportada"
+    assert renderers["buscar_repos"] is None
+
+
+def test_model_send_wait_ends_before_the_tool_timeout():
+    assert app_module.TOOL_SEND_WAIT < app_module.TOOL_CALL_TIMEOUT
+    queued = {"success": True, "contact": "Ana", "status": "queued", "message_id": "abc"}
+    assert app_module.tool_renderers["send_message"]({}, queued) == "Mensaje en cola para Ana (id abc)"
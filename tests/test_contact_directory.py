@@ -0,0 +1,73 @@
+import threading
+import time
+
+from contacts import ContactDirectory
+
+CONTACTS = [{"name": "Juan Pérez", "jid": "5215550000001@s.whatsapp.net"}]
+
+
+def test_concurrent_first_load_fetches_once():
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(2)
+        return CONTACTS
+
+    directory = ContactDirectory(fetch, ttl=300)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(directory.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert results == [CONTACTS] * 8
+    assert directory.stats()["refreshes"] == 1
+
+
+def test_stale_list_is_served_while_refreshing():
+    versions = [CONTACTS, CONTACTS + [{"name": "Ana", "jid": "5215550000002@s.whatsapp.net"}]]
+    refreshed = threading.Event()
+
+    def fetch():
+        result = versions[min(len(fetch.calls), 1)]
+        fetch.calls.append(1)
+        if len(fetch.calls) > 1:
+            refreshed.set()
+        return result
+    fetch.calls = []
+
+    directory = ContactDirectory(fetch, ttl=0)
+    assert directory.get() == CONTACTS
+    # Vencido: devuelve la copia vieja de inmediato y refresca en segundo plano
+    assert directory.get() == CONTACTS
+    assert refreshed.wait(2)
+    deadline = time.monotonic() + 2
+    while len(directory.get()) != 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(directory.get()) == 2
+
+
+def test_failed_fetch_keeps_previous_list():
+    responses = [CONTACTS]
+
+    def fetch():
+        if not responses:
+            raise RuntimeError("bridge caído")
+        return responses.pop()
+
+    directory = ContactDirectory(fetch, ttl=300)
+    assert directory.get() == CONTACTS
+    assert directory.refresh() is False  # falla, pero sigue habiendo lista
+    assert directory.get() == CONTACTS
+    assert directory.stats()["refresh_errors"] == 1
+
+
+def test_search_uses_the_index():
+    directory = ContactDirectory(lambda: CONTACTS)
+    assert directory.search("juan")[0]["jid"] == CONTACTS[0]["jid"]
@@ -0,0 +1,54 @@
+from contacts import ContactIndex, normalize
+
+CONTACTS = [
+    {"name": "José Pérez", "jid": "5215550000001@s.whatsapp.net"},
+    {"name": "Josefina López", "jid": "5215550000002@s.whatsapp.net"},
+    {"name": "Ana María Pérez", "jid": "5215550000003@s.whatsapp.net"},
+    {"name": "Juan Pérez", "jid": "5215550000004@s.whatsapp.net"},
+    {"name": "Juan Pérez", "jid": "5215550000005@s.whatsapp.net"},
+    {"name": "", "jid": "5215550000006@s.whatsapp.net"},
+    {"name": "Sin JID"},
+]
+
+
+def names(results):
+    return [c["name"] for c in results]
+
+
+def test_normalize_strips_accents_case_and_spaces():
+    assert normalize("  JOSÉ   Pérez ") == "jose perez"
+
+
+def test_entries_without_jid_are_skipped():
+    assert len(ContactIndex(CONTACTS)) == 6
+
+
+def test_exact_name_ranks_before_prefix():
+    index = ContactIndex(CONTACTS)
+    assert names(index.search("jose", limit=2)) == ["José Pérez", "Josefina López"]
+
+
+def test_word_prefix_and_substring():
+    index = ContactIndex(CONTACTS)
+    assert "Ana María Pérez" in names(index.search("maria"))
+    assert names(index.search("efin")) == ["Josefina López"]
+
+
+def test_fuzzy_match_only_when_enabled():
+    index = ContactIndex(CONTACTS)
+    assert names(index.search("Josefian", fuzzy=True))[:1] == ["Josefina López"]
+    assert index.search("Josefian", fuzzy=False) == []
+
+
+def test_phone_and_jid_lookup():
+    index = ContactIndex(CONTACTS)
+    assert index.search("5215550000003")[0]["name"] == "Ana María Pérez"
+    assert index.lookup("5215550000002@S.WhatsApp.net")["name"] == "Josefina López"
+    assert names(index.search("0000004")) == ["Juan Pérez"]
+
+
+def test_resolve_many_reports_ambiguous_and_missing():
+    index = ContactIndex(CONTACTS)
+    resolved = index.resolve_many(["José Pérez", "juan perez", "Pedro", "5215550000002", "5219999999999"])
+    assert [state for state, _ in resolved] == ["found", "ambiguous", "not_found", "found", "not_found"]
+    assert len(resolved[1][1]) == 2
@@ -0,0 +1,75 @@
+import asyncio
+
+from common.context import ContextBuilder, covered_prefix, estimate_tokens, extractive_summary, fingerprint
+
+
+def turn(role, text):
+    return {"role": role, "content": text}
+
+
+def test_extractive_summary_is_synchronous_and_keeps_the_tail():
+    summary = extractive_summary("previo", [turn("user", "hola   mundo"), turn("tool", "x")], max_chars=1200)
+    assert summary == "previo\nuser: hola mundo"
+    assert len(extractive_summary("", [turn("user", "a" * 150)] * 20, max_chars=100)) == 100
+
+
+def test_covered_prefix_counts_repeated_turns_by_position():
+    ok, hi = fingerprint(turn("user", "ok")), fingerprint(turn("user", "hola"))
+    assert covered_prefix([hi, ok], [hi, ok, ok]) == 2
+    assert covered_prefix([ok], [ok, ok]) == 1
+    assert covered_prefix([hi, ok, ok], [ok, ok, hi]) == 2  # el historial ya perdió su primer turno
+    assert covered_prefix([], [ok]) == 0
+    assert covered_prefix([hi, ok, hi], [hi, ok]) == 2  # el corte retrocedió
+
+
+class Recorder:
+    def __init__(self):
+        self.calls = []
+
+    async def summarize(self, previous, messages):
+        self.calls.append([m["content"] for m in messages])
+        return previous + "|" + ",".join(m["content"] for m in messages)
+
+
+def test_repeated_identical_turns_are_all_summarized():
+    recorder = Recorder()
+    builder = ContextBuilder(budget=44, summary_budget=2, summarize=recorder.summarize,
+                             schedule=lambda coro: asyncio.run(coro))
+    history = [turn("user", "ok"), turn("assistant", "x" * 120)]
+    builder.build("s", "sistema", history)
+    history += [turn("user", "ok"), turn("assistant", "y" * 120)]
+    builder.build("s", "sistema", history)
+    assert recorder.calls == [["ok"], ["x" * 120, "ok"]]
+
+
+def test_build_respects_the_budget_and_uses_the_summary():
+    recorder = Recorder()
+    builder = ContextBuilder(budget=120, summary_budget=30, summarize=recorder.summarize,
+                             schedule=lambda coro: asyncio.run(coro))
+    history = [turn("user", str(i) * 40) for i in range(10)]
+    messages, used = builder.build("s", "sistema", history)
+    assert used <= 120
+    assert messages[-1] == history[-1]
+    # El resumen se genera en segundo plano; la siguiente petición ya lo usa
+    messages, _ = builder.build("s", "sistema", history)
+    assert messages[1]["content"].startswith(ContextBuilder.SUMMARY_PREFIX)
+    assert builder.stats()["requests_with_dropped_turns"] == 2
+
+
+def test_tool_result_is_not_kept_without_its_call():
+    builder = ContextBuilder(budget=60, summary_budget=0)
+    call = {"role": "assistant", "content": None, "function_call": {"name": "f", "arguments": "x" * 200}}
+    history = [call, {"role": "function", "name": "f", "content": "r"}, turn("user", "hola")]
+    messages, used = builder.build("s", "sistema", history)
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert used == estimate_tokens(messages[0]) + estimate_tokens(messages[1])
+
+
+def test_cut_that_moves_back_does_not_summarize_again():
+    recorder = Recorder()
+    builder = ContextBuilder(budget=200, summary_budget=40, summarize=recorder.summarize,
+                             schedule=lambda coro: asyncio.run(coro))
+    history = [turn("user" if i % 2 == 0 else "assistant", f"m{i:02d}" + "x" * 40) for i in range(12)]
+    for size in (400, 200, 400):  # entrada larga, corta y larga otra vez
+        builder.build("s", "sistema", history, turn("user", "y" * size))
+    assert [[m[:3] for m in call] for call in recorder.calls] == [[f"m{i:02d}" for i in range(9)]]
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from common import github
+from common.github import RepoSearchCache, normalize_query
+
+
+class FakeGitHub:
+    """Cliente con la interfaz de ClientRegistry; responde con ETag y 304 como la API real"""
+
+    def __init__(self):
+        self.requests = []
+        self.status = None      # fuerza un código (p. ej. 403)
+        self.fail = False       # error de red
+        self.remaining = "29"
+        self.delay = 0.0
+
+    def async_client(self, name):
+        return self
+
+    async def get(self, path, params=None, headers=None):
+        self.requests.append(dict(headers or {}))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise httpx.ConnectError("sin red")
+        extra = {"ETag": '"v1"', "X-RateLimit-Remaining": self.remaining,
+                 "X-RateLimit-Reset": str(time.time() + 60)}
+        request = httpx.Request("GET", "http://github" + path)
+        if self.status:
+            return httpx.Response(self.status, headers=extra, request=request)
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers=extra, request=request)
+        items = [{"full_name": f"{params['q']}/{i}", "description": "", "stargazers_count": i,
+                  "html_url": "", "language": "Python", "extra": True} for i in range(3)]
+        return httpx.Response(200, json={"items": items}, headers=extra, request=request)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(github.time, "monotonic", lambda: now[0])
+    return now
+
+
+def search(cache, query, **kwargs):
+    return asyncio.run(cache.search(query, **kwargs))
+
+
+def test_queries_are_normalized():
+    assert normalize_query("  FastAPI   Auth ") == "fastapi auth"
+
+
+def test_fresh_entries_are_served_from_memory(clock):
+    api = FakeGitHub()
+    cache = RepoSearchCache(api, ttl=60)
+    first = search(cache, "Flask", limit=2)
+    assert len(first) == 2 and "extra" not in first[0]
+    search(cache, "  flask ")
+    assert len(api.requests) == 1 and cache.stats()["hits"] == 1
+
+
+def test_expired_entries_are_revalidated_with_the_etag(clock):
+    api = FakeGitHub()
+    cache = RepoSearchCache(api, ttl=60)
+    search(cache, "flask")
+    clock[0] += 61
+    assert len(search(cache, "flask")) == 3
+    assert api.requests[-1]["If-None-Match"] == '"v1"'
+    assert cache.stats()["revalidated"] == 1
+    search(cache, "flask")  # la revalidación renovó la entrada
+    assert len(api.requests) == 2
+
+
+def test_stale_entry_is_served_when_github_fails_or_limits(clock):
+    api = FakeGitHub()
+    cache = RepoSearchCache(api, ttl=60)
+    search(cache, "flask")
+    clock[0] += 61
+    api.fail = True
+    assert len(search(cache, "flask")) == 3
+    api.fail, api.status = False, 403
+    assert len(search(cache, "flask")) == 3
+    assert cache.stats()["stale_served"] == 2
+
+
+def test_errors_without_an_entry_are_raised(clock):
+    api = FakeGitHub()
+    api.status = 500
+    with pytest.raises(httpx.HTTPStatusError):
+        search(RepoSearchCache(api), "flask")
+
+
+def test_exhausted_rate_limit_skips_the_network(clock):
+    api = FakeGitHub()
+    api.remaining = "0"
+    cache = RepoSearchCache(api, ttl=60)
+    search(cache, "flask")
+    with pytest.raises(RuntimeError):
+        search(cache, "django")
+    assert len(api.requests) == 1 and cache.stats()["rate_limited"] == 1
+
+
+def test_identical_concurrent_searches_share_one_request():
+    api = FakeGitHub()
+    api.delay = 0.05
+    cache = RepoSearchCache(api)
+
+    async def both():
+        return await asyncio.gather(cache.search("flask"), cache.search("FLASK"))
+
+    first, second = asyncio.run(both())
+    assert first == second and len(api.requests) == 1
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_entries_are_bounded(clock):
+    cache = RepoSearchCache(FakeGitHub(), max_entries=2)
+    for query in ("a", "b", "c"):
+        search(cache, query)
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,60 @@
+import asyncio
+
+from common.health import HealthMonitor
+from conftest import eventually
+
+
+class Service:
+    def __init__(self):
+        self.up = True
+        self.hang = False
+        self.calls = 0
+
+    async def check(self):
+        self.calls += 1
+        if self.hang:
+            await asyncio.sleep(10)
+        if not self.up:
+            raise ConnectionError("rechazada")
+
+
+def test_state_is_unknown_until_the_first_check(runtime):
+    monitor = HealthMonitor(runtime)
+    monitor.add("svc", Service().check)
+    assert monitor.up("svc") is None and monitor.up("otro") is None
+    assert monitor.snapshot() == {"svc": {"up": None}}
+
+
+def test_probe_now_publishes_failures_and_recovery(runtime):
+    service = Service()
+    monitor = HealthMonitor(runtime)
+    monitor.add("svc", service.check)
+    service.up = False
+    for _ in range(2):
+        result = runtime.run(monitor.probe_now("svc"))
+    assert result["up"] is False and result["error"] == "rechazada"
+    assert result["consecutive_failures"] == 2
+    service.up = True
+    result = runtime.run(monitor.probe_now("svc"))
+    assert monitor.up("svc") is True
+    assert result["consecutive_failures"] == 0 and result["availability"] == round(1 / 3, 3)
+
+
+def test_slow_check_counts_as_down(runtime):
+    service = Service()
+    service.hang = True
+    monitor = HealthMonitor(runtime)
+    monitor.add("svc", service.check, timeout=0.05)
+    result = runtime.run(monitor.probe_now("svc"))
+    assert result["up"] is False and "sin respuesta" in result["error"]
+
+
+def test_start_runs_probes_in_the_background_once(runtime):
+    service = Service()
+    monitor = HealthMonitor(runtime)
+    monitor.add("svc", service.check, interval=0.02)
+    monitor.start()
+    monitor.start()
+    assert eventually(lambda: service.calls >= 3)
+    assert monitor.up("svc") is True
+    assert len(monitor._tasks) == 1
@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from common.history import HistoryBackend, HistoryStore, SQLiteBackend, message_size
+
+run = asyncio.run
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def test_backend_requires_the_abstract_methods():
+    class Partial(HistoryBackend):
+        def write(self, session_id, messages):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_ring_buffer_keeps_last_turns_and_byte_count():
+    store = HistoryStore(max_turns=3)
+    run(store.append("s", *(user(str(i)) for i in range(5))))
+    assert [m["content"] for m in run(store.get("s"))] == ["2", "3", "4"]
+    assert store.stats()["bytes"] == sum(message_size(user(str(i))) for i in (2, 3, 4))
+    assert [m["content"] for m in run(store.get("s", last=2))] == ["3", "4"]
+    assert run(store.get("s", last=0)) == []
+
+
+def test_get_returns_copies():
+    store = HistoryStore()
+    run(store.append("s", user("hola")))
+    run(store.get("s"))[0]["content"] = "cambiado"
+    assert run(store.get("s"))[0]["content"] == "hola"
+
+
+def test_least_recently_used_session_is_evicted():
+    store = HistoryStore(max_sessions=2)
+    run(store.append("a", user("1")))
+    run(store.append("b", user("1")))
+    run(store.get("a"))  # "b" pasa a ser la menos usada
+    run(store.append("c", user("1")))
+    assert "a" in store and "c" in store and "b" not in store
+    assert store.stats()["evicted"]["lru"] == 1
+
+
+def test_memory_limit_evicts_whole_sessions():
+    size = message_size(user("x" * 100))
+    store = HistoryStore(max_bytes=size * 2)
+    for session in "abc":
+        run(store.append(session, user("x" * 100)))
+    assert "a" not in store
+    assert store.stats()["bytes"] <= size * 2
+    assert store.stats()["evicted"]["memory"] == 1
+
+
+def test_idle_sessions_are_evicted(monkeypatch):
+    import common.history as history
+    now = [1000.0]
+    monkeypatch.setattr(history.time, "time", lambda: now[0])
+    store = HistoryStore(idle_ttl=60)
+    run(store.append("old", user("1")))
+    now[0] += 120
+    run(store.append("new", user("1")))
+    assert "old" not in store
+    assert store.stats()["evicted"]["idle"] == 1
+
+
+def test_clear_releases_memory():
+    store = HistoryStore()
+    run(store.append("s", user("hola")))
+    store.clear("s")
+    assert run(store.get("s")) == [] and store.stats()["bytes"] == 0
+
+
+# -------------------------
+# SQLite
+# -------------------------
+
+
+def test_sqlite_history_survives_a_restart(tmp_path):
+    path = str(tmp_path / "history.db")
+    store = HistoryStore(max_turns=3, backend=SQLiteBackend(path, keep_turns=3))
+    run(store.append("s", *(user(str(i)) for i in range(5))))
+    store.backend.close()
+
+    reloaded = HistoryStore(max_turns=3, backend=SQLiteBackend(path, keep_turns=3))
+    assert [m["content"] for m in run(reloaded.get("s"))] == ["2", "3", "4"]
+
+
+def test_sqlite_trims_old_rows(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "history.db")
+    backend = SQLiteBackend(path, keep_turns=4)
+    for i in range(10):
+        backend.write("s", [user(str(i))])
+    backend.flush(5)
+    rows = sqlite3.connect(path).execute("SELECT COUNT(*) FROM messages WHERE session_id = 's'").fetchone()[0]
+    assert rows == 4
+    assert [m["content"] for m in backend.load("s", 10)] == ["6", "7", "8", "9"]
+    assert backend.stats()["written_messages"] == 10
+
+
+def test_evicted_session_reloads_pending_writes(tmp_path):
+    store = HistoryStore(max_sessions=1, backend=SQLiteBackend(str(tmp_path / "h.db"), flush_interval=0.2))
+    run(store.append("a", user("hola")))
+    run(store.append("b", user("1")))  # "a" sale de memoria antes de confirmarse en disco
+    assert [m["content"] for m in run(store.get("a"))] == ["hola"]
+
+
+def test_load_does_not_block_the_event_loop(tmp_path):
+    """La carga (con su espera de escrituras pendientes) corre fuera del loop"""
+    class SlowBackend(SQLiteBackend):
+        def load(self, session_id, limit):
+            import time
+            time.sleep(0.3)
+            return super().load(session_id, limit)
+
+    store = HistoryStore(backend=SlowBackend(str(tmp_path / "h.db")))
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await store.get("s")
+        task.cancel()
+        return ticks
+
+    assert run(scenario()) >= 10
+
+
+def test_failed_commit_is_not_counted_as_written(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "h.db"))
+    backend.write("s", [user("ok")])
+    backend.flush(5)
+
+    import sqlite3
+    with sqlite3.connect(backend.path) as conn:
+        conn.execute("DROP TABLE messages")  # el siguiente lote falla y se revierte
+    backend.write("s", [user("perdido")])
+    backend.flush(5)
+    stats = backend.stats()
+    assert stats["errors"] == 1
+    assert stats["written_messages"] == 1
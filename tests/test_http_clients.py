@@ -0,0 +1,54 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from common.http_clients import ClientRegistry, UpstreamConfig
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_from_env_reads_prefixed_variables(monkeypatch):
+    monkeypatch.setenv("BRIDGE_POOL_SIZE", "7")
+    monkeypatch.setenv("BRIDGE_TIMEOUT", "2.5")
+    monkeypatch.setenv("BRIDGE_RETRIES", "0")
+    config = UpstreamConfig.from_env("bridge", base_url="http://x")
+    assert (config.pool_size, config.timeout, config.retries, config.base_url) == (7, 2.5, 0, "http://x")
+
+
+def test_client_is_shared_and_connections_reused(server):
+    registry = ClientRegistry()
+    registry.register(UpstreamConfig("bridge", base_url=server))
+    client = registry.sync_client("bridge")
+    assert registry.sync_client("bridge") is client
+
+    for _ in range(5):
+        assert client.get("/status").status_code == 200
+
+    stats = registry.stats()["bridge"]
+    assert stats["requests"] == 5
+    assert stats["new_connections"] == 1
+    assert stats["reused_connections"] == 4
+    registry.close()
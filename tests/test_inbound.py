@@ -0,0 +1,115 @@
+import asyncio
+import threading
+
+from conftest import eventually
+from inbound import InboundPipeline
+from common.stats import percentile
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(range(100), 0.95) == 95
+    assert percentile([7], 0.99) == 7
+
+
+def test_workers_bound_concurrency(runtime):
+    running = []
+    peak = [0]
+    release = asyncio.Event()
+
+    async def handler(sender, body):
+        running.append(sender)
+        peak[0] = max(peak[0], len(running))
+        await release.wait()
+        running.remove(sender)
+
+    pipeline = InboundPipeline(handler, runtime, workers=2, maxsize=10)
+    pipeline.start()
+    for i in range(5):
+        assert pipeline.submit(f"s{i}", "hola")
+
+    assert eventually(lambda: pipeline.stats()["in_progress"] == 2)
+    assert pipeline.stats()["queue_depth"] == 3
+    runtime.loop.call_soon_threadsafe(release.set)
+    assert eventually(lambda: pipeline.stats()["processed"] == 5)
+    assert peak[0] == 2
+
+
+def test_reject_policy_when_full(runtime):
+    pipeline = InboundPipeline(lambda s, b: asyncio.sleep(0), runtime, maxsize=2)
+    # Sin arrancar los workers, los mensajes quedan en espera
+    assert pipeline.submit("a", "1")
+    assert pipeline.submit("b", "1")
+    assert not pipeline.submit("c", "1")
+    stats = pipeline.stats()
+    assert (stats["accepted"], stats["rejected"], stats["queue_depth"]) == (2, 1, 2)
+
+
+def test_handler_errors_are_counted(runtime):
+    async def handler(sender, body):
+        raise RuntimeError("falla")
+
+    pipeline = InboundPipeline(handler, runtime)
+    pipeline.start()
+    pipeline.submit("a", "1")
+    assert eventually(lambda: pipeline.stats()["failed"] == 1)
+
+
+def test_submit_is_safe_from_many_threads(runtime):
+    done = []
+
+    async def handler(sender, body):
+        done.append(body)
+
+    pipeline = InboundPipeline(handler, runtime, workers=4, maxsize=1000, per_sender=1000)
+    pipeline.start()
+    threads = [threading.Thread(target=lambda t=t: [pipeline.submit(f"s{i % 7}", f"{t}-{i}") for i in range(50)])
+               for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert eventually(lambda: len(done) == 200)
+
+
+def test_drop_oldest_then_new_message_keeps_sender_serial(runtime):
+    """Un remitente vaciado por drop_oldest no debe quedar dos veces en la fila de turnos"""
+    active = set()
+    overlaps = []
+    handled = []
+    gates = {}
+
+    async def handler(sender, body):
+        if sender in active:
+            overlaps.append(body)
+        active.add(sender)
+        gate = gates.get(body)
+        if gate is not None:
+            await gate.wait()
+        await asyncio.sleep(0.01)
+        handled.append(body)
+        active.discard(sender)
+
+    async def make_gates():
+        gates.update({"a2": asyncio.Event(), "c1": asyncio.Event()})
+    runtime.run(make_gates())
+
+    pipeline = InboundPipeline(handler, runtime, workers=3, maxsize=3, overflow="drop_oldest")
+    for sender, body in [("a", "a1"), ("b", "b1"), ("c", "c1")]:
+        pipeline.submit(sender, body)
+    pipeline.submit("d", "d1")  # cola llena: se descarta a1 y la fila de "a" queda vacía
+    pipeline.submit("a", "a2")  # se descarta b1; "a" vuelve a tener un mensaje
+    assert pipeline.stats()["dropped"] == 2
+
+    pipeline.start()
+    assert eventually(lambda: "a" in active and "c" in active)
+    for body in ("a3", "a4", "a5"):
+        assert pipeline.submit("a", body)
+    runtime.loop.call_soon_threadsafe(gates["a2"].set)
+    runtime.loop.call_soon_threadsafe(gates["c1"].set)
+
+    assert eventually(lambda: len(handled) == 6)
+    assert overlaps == []
+    assert [b for b in handled if b.startswith("a")] == ["a2", "a3", "a4", "a5"]
+    assert pipeline.stats()["queue_depth"] == 0
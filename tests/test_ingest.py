@@ -0,0 +1,128 @@
+import asyncio
+
+from ingest import IngestCursor, MessageIngestor
+
+
+def message(i, ts=None):
+    return {"id": f"m{i}", "from": "521555@s.whatsapp.net", "body": f"hola {i}", "timestamp": ts or 1000 + i}
+
+
+def ingestor(messages, accept):
+    async def fetch_since(since):
+        return [m for m in messages if m["timestamp"] >= int(since)]
+    return MessageIngestor("ws://127.0.0.1:1/events", fetch_since, accept)
+
+
+def test_cursor_deduplicates_and_tracks_last_event():
+    cursor = IngestCursor(since=0)
+    assert cursor.accept(message(1))
+    assert not cursor.accept(message(1))
+    assert cursor.seen(message(1))
+    assert cursor.resume_params() == {"since": 1001, "last_event_id": "m1"}
+
+
+def test_rejected_message_does_not_advance_the_cursor():
+    received = []
+    full = [True]
+
+    def accept(sender, body):
+        if full[0]:
+            return False
+        received.append(body)
+        return True
+
+    ing = ingestor([], accept)
+    ing.cursor = IngestCursor(since=0)
+    ing._deliver(message(1), "ws")
+    assert ing.cursor.timestamp == 0
+    assert not ing.cursor.seen(message(1))
+    assert ing.stats()["rejected"] == 1
+    assert ing.stats()["ws_messages"] == 0
+
+    # Cuando vuelve a haber lugar, el mismo mensaje se entrega
+    full[0] = False
+    ing._deliver(message(1), "poll")
+    assert received == ["hola 1"]
+    assert ing.stats()["polled_messages"] == 1
+
+
+def test_catch_up_stops_at_first_rejection_and_resumes_later():
+    messages = [message(i) for i in range(1, 6)]
+    received = []
+    capacity = [2]
+
+    def accept(sender, body):
+        if capacity[0] == 0:
+            return False
+        capacity[0] -= 1
+        received.append(body)
+        return True
+
+    ing = ingestor(messages, accept)
+    ing.cursor = IngestCursor(since=0)
+    assert asyncio.run(ing._catch_up()) == 2
+    assert ing.cursor.timestamp == 1002
+
+    capacity[0] = 10
+    assert asyncio.run(ing._catch_up()) == 3
+    assert received == [f"hola {i}" for i in range(1, 6)]
+    assert ing.stats()["duplicates"] == 1  # el último aceptado vuelve por `since` inclusivo
+
+
+def test_messages_without_body_are_ignored():
+    received = []
+    ing = ingestor([], lambda s, b: received.append(b) or True)
+    assert ing._deliver({"id": "x", "from": "a", "body": ""}, "ws")
+    assert received == []
+
+
+def test_rejected_websocket_message_is_recovered_in_order():
+    messages = [message(i) for i in range(1, 4)]
+    received = []
+    full = [True]
+
+    def accept(sender, body):
+        if full[0]:
+            return False
+        received.append(body)
+        return True
+
+    async def fetch_since(since):
+        return [m for m in messages if m["timestamp"] >= int(since)]
+
+    ing = MessageIngestor("ws://127.0.0.1:1/events", fetch_since, accept, poll_min=0.01)
+    ing.cursor = IngestCursor(since=0)
+
+    async def scenario():
+        ing._on_ws_message(messages[0])  # cola llena: rechazado
+        full[0] = False
+        ing._on_ws_message(messages[1])  # ya hay lugar, pero no puede adelantarse al rechazado
+        assert received == [] and ing.cursor.timestamp == 0
+        ing._on_ws_message(messages[2])
+        await asyncio.wait_for(ing._recovery, 1)
+
+    asyncio.run(scenario())
+    assert received == ["hola 1", "hola 2", "hola 3"]
+    assert not ing.behind and ing.cursor.timestamp == 1003
+
+
+def test_recovery_keeps_retrying_while_the_queue_is_full():
+    messages = [message(1)]
+    attempts = []
+
+    def accept(sender, body):
+        attempts.append(body)
+        return len(attempts) > 3
+
+    async def fetch_since(since):
+        return [m for m in messages if m["timestamp"] >= int(since)]
+
+    ing = MessageIngestor("ws://127.0.0.1:1/events", fetch_since, accept, poll_min=0.01)
+    ing.cursor = IngestCursor(since=0)
+
+    async def scenario():
+        ing._on_ws_message(messages[0])
+        await asyncio.wait_for(ing._recovery, 1)
+
+    asyncio.run(scenario())
+    assert len(attempts) == 4 and ing.stats()["polled_messages"] == 1 and not ing.stats()["behind"]
@@ -0,0 +1,88 @@
+import pytest
+
+from intents import IntentRouter
+
+
+@pytest.fixture
+def router():
+    return IntentRouter()
+
+
+@pytest.mark.parametrize("text, recipient, message", [
+    ("envía un mensaje a Juan que diga hola", "Juan", "hola"),
+    ("Mándale un msj a Ana: llego tarde", "Ana", "llego tarde"),
+    ("escribe un whatsapp a Juan Pérez que diga: ya salí.", "Juan Pérez", "ya salí."),
+    ("dile a Juan: ya voy", "Juan", "ya voy"),
+    ("dile a Juan 'ya voy'", "Juan", "ya voy"),
+    ("envía 'hola' a Juan", "Juan", "hola"),
+    ("manda el mensaje “nos vemos” a 5215550000000", "5215550000000", "nos vemos"),
+])
+def test_explicit_sends_are_recognized(router, text, recipient, message):
+    intent = router.match(text)
+    assert intent.name == "send_message"
+    assert intent.args == {"recipient": recipient, "message": message}
+
+
+@pytest.mark.parametrize("text", [
+    # Varios envíos en una sola frase
+    "escribe un mensaje a Juan que diga hola y luego otro a Pedro que diga adios",
+    "envía un mensaje a Ana que diga hola y también a Luis",
+    "envía 'hola' a Juan y Pedro",
+    # El mensaje pide otro envío
+    "dile a Juan que si me puede enviar un mensaje a Pedro que diga hola",
+    "dile a Juan: mándale un mensaje a Pedro",
+    # Sin mensaje explícito
+    "dile a Juan que ya voy",
+    "envía un mensaje a Juan hola",
+    "envía un mensaje a Juan diciendo hola",
+    # Destinatario demasiado largo para ser un nombre
+    "envía un mensaje a la persona que conocí ayer en la fiesta: hola",
+])
+def test_ambiguous_sends_fall_through(router, text):
+    assert router.match(text) is None
+
+
+@pytest.mark.parametrize("text, query, options", [
+    ("busca el contacto Juan", "Juan", {}),
+    ("buscar contactos de López", "López", {}),
+    ("busca contactos llamados Ana?", "Ana", {}),
+    ("¿quién es Ana?", "Ana", {"fuzzy": False}),
+    ("quien es Juan Pérez", "Juan Pérez", {"fuzzy": False}),
+])
+def test_contact_searches_are_recognized(router, text, query, options):
+    intent = router.match(text)
+    assert intent.name == "search_contacts"
+    assert intent.args == {"query": query} and intent.options == options
+
+
+@pytest.mark.parametrize("text", [
+    "quién es el presidente de México?",
+    "¿quién es tu creador?",
+    "quien es una persona famosa de aquí",
+    "busca el contacto Juan y luego envíale hola",
+    "busca repositorios de flask",
+])
+def test_general_questions_are_not_contact_searches(router, text):
+    assert router.match(text) is None
+
+
+@pytest.mark.parametrize("text, a, b", [
+    ("suma 2 y 3", 2, 3),
+    ("¿cuánto es 2 + 3?", 2, 3),
+    ("calcula -4 más 10", -4, 10),
+    ("2+3", 2, 3),
+])
+def test_sums_are_recognized(router, text, a, b):
+    intent = router.match(text)
+    assert intent.name == "sumar" and intent.args == {"a": a, "b": b}
+
+
+@pytest.mark.parametrize("text", ["suma 2 y 3 y 4", "suma dos y tres", "¿cuánto es 2 por 3?"])
+def test_other_arithmetic_falls_through(router, text):
+    assert router.match(text) is None
+
+
+def test_stats_count_matches_and_misses(router):
+    router.match("suma 2 y 3")
+    router.match("hola, ¿qué tal?")
+    assert router.stats() == {"matched": {"sumar": 1}, "unmatched": 1}
@@ -0,0 +1,52 @@
+from lanes import LaneScheduler
+
+
+def test_each_key_is_ready_once_and_served_in_turns():
+    lanes = LaneScheduler()
+    assert lanes.push("a", 1) is True
+    assert lanes.push("a", 2) is False  # ya está en la fila de turnos
+    assert lanes.push("b", 1) is True
+    assert list(lanes.ready) == ["a", "b"] and lanes.depth == 3
+
+    key = lanes.next()
+    assert (key, lanes.take(key)) == ("a", 1)
+    assert lanes.push("a", 3) is False  # ocupada: no vuelve a la fila hasta terminar
+    assert lanes.finish("a") is True
+    assert list(lanes.ready) == ["b", "a"]
+
+
+def test_finished_key_without_messages_is_forgotten():
+    lanes = LaneScheduler()
+    lanes.push("a", 1)
+    lanes.take(lanes.next())
+    assert lanes.finish("a") is False
+    assert "a" not in lanes.lanes and lanes.depth == 0
+
+
+def test_held_key_keeps_its_messages():
+    lanes = LaneScheduler()
+    lanes.push("a", 1)
+    lanes.hold(lanes.next())
+    assert lanes.push("a", 2) is False
+    assert lanes.finish("a") is True and lanes.lane_length("a") == 2
+
+
+def test_drop_oldest_keeps_ready_unique():
+    lanes = LaneScheduler()
+    lanes.push("a", 1)
+    lanes.push("a", 2)
+    lanes.push("b", 1)
+    assert lanes.drop_oldest() == 1 and lanes.lane_length("a") == 1
+    assert lanes.drop_oldest() in (1, 2)
+    lanes.drop_oldest()
+    assert lanes.depth == 0 and not lanes.ready
+    lanes.push("a", 3)
+    assert list(lanes.ready) == ["a"]
+
+
+def test_stats_helpers():
+    lanes = LaneScheduler()
+    for item in range(3):
+        lanes.push("a", item)
+    lanes.push("b", 0)
+    assert (lanes.waiting(), lanes.longest()) == (2, 3)
@@ -0,0 +1,83 @@
+import pytest
+
+from common import llm_cache as llm_cache_module
+from common.llm_cache import LLMCache
+
+
+def payload(text, tools=None):
+    body = {"model": "m", "messages": [{"role": "user", "content": text}]}
+    if tools is not None:
+        body["tools"] = tools
+    return body
+
+
+def text_answer(text, provider=None):
+    result = {"choices": [{"message": {"role": "assistant", "content": text}}]}
+    if provider is not None:
+        result["provider"] = provider
+    return result
+
+
+def tool_answer(name):
+    call = {"id": "1", "type": "function", "function": {"name": name, "arguments": "{}"}}
+    return {"choices": [{"message": {"role": "assistant", "content": None, "tool_calls": [call]}}]}
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        LLMCache(mode="siempre")
+
+
+def test_hit_ignores_extra_whitespace_and_marks_the_copy():
+    cache = LLMCache(mode="all")
+    cache.put(payload("hola  mundo"), text_answer("hey"))
+    hit = cache.get(payload(" hola mundo "))
+    assert hit["cached"] is True and hit["choices"][0]["message"]["content"] == "hey"
+    hit["choices"][0]["message"]["content"] = "otro"
+    assert cache.get(payload("hola mundo"))["choices"][0]["message"]["content"] == "hey"
+    assert cache.stats()["hits"] == 2
+
+
+def test_deterministic_mode_keeps_only_pure_tool_calls():
+    cache = LLMCache(mode="deterministic", pure_tools={"sumar"})
+    cache.put(payload("a"), tool_answer("sumar"))
+    cache.put(payload("b"), tool_answer("send_message"))
+    cache.put(payload("c"), text_answer("texto"))
+    assert cache.get(payload("a")) is not None
+    assert cache.get(payload("b")) is None and cache.get(payload("c")) is None
+    assert cache.stats()["not_cacheable"] == 2
+
+
+def test_entries_expire_and_are_bounded(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(llm_cache_module.time, "monotonic", lambda: now[0])
+    cache = LLMCache(mode="all", max_entries=2, ttl=10)
+    for text in "abc":
+        cache.put(payload(text), text_answer(text))
+    assert cache.get(payload("a")) is None and cache.stats()["entries"] == 2
+    now[0] += 11
+    assert cache.get(payload("b")) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_schema_changes_the_key():
+    cache = LLMCache(mode="all")
+    tools = [{"type": "function", "function": {"name": "sumar"}}]
+    cache.put(payload("a", tools), text_answer("x"))
+    assert cache.get(payload("a", list(tools))) is not None  # mismo contenido, otro objeto
+    assert cache.get(payload("a", [{"type": "function", "function": {"name": "restar"}}])) is None
+
+
+def test_schema_hash_table_is_bounded():
+    cache = LLMCache(mode="all")
+    for i in range(llm_cache_module.SCHEMA_HASHES * 3):
+        cache.key(payload("a", [{"name": str(i)}]))
+    assert len(cache._schema_hashes) == llm_cache_module.SCHEMA_HASHES
+
+
+def test_answers_from_a_fallback_provider_are_not_stored():
+    cache = LLMCache(mode="all", provider="openai")
+    cache.put(payload("a"), text_answer("respaldo", provider="deepseek"))
+    assert cache.get(payload("a")) is None
+    cache.put(payload("a"), text_answer("principal", provider="openai"))
+    assert cache.get(payload("a"))["choices"][0]["message"]["content"] == "principal"
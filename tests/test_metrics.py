@@ -0,0 +1,81 @@
+import pytest
+
+from common.metrics import MetricsRegistry, RouteMetrics
+
+
+def test_counter_renders_labels_in_declared_order_and_escapes_them():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Llamadas", ("tool", "outcome"))
+    calls.inc("send", "ok")
+    calls.inc("send", "ok", amount=2)
+    calls.inc('di "hola"\n', "error")
+    assert registry.render().splitlines() == [
+        "# HELP calls_total Llamadas",
+        "# TYPE calls_total counter",
+        'calls_total{tool="send",outcome="ok"} 3',
+        'calls_total{tool="di \\"hola\\"\\n",outcome="error"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    duration = registry.histogram("op_seconds", "Duración", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        duration.observe(value, "x")
+    lines = registry.render().splitlines()[2:]
+    assert lines == [
+        'op_seconds_bucket{op="x",le="0.1"} 2',
+        'op_seconds_bucket{op="x",le="1.0"} 3',
+        'op_seconds_bucket{op="x",le="+Inf"} 4',
+        'op_seconds_sum{op="x"} 3.65',
+        'op_seconds_count{op="x"} 4',
+    ]
+
+
+def test_timer_observes_the_block():
+    registry = MetricsRegistry()
+    duration = registry.histogram("block_seconds", "Bloque")
+    with duration.time():
+        pass
+    assert "block_seconds_count 1" in registry.render()
+
+
+def test_gauges_with_a_function_are_read_on_render():
+    registry = MetricsRegistry()
+    depth = [3]
+    registry.gauge("queue_depth", "Profundidad", fn=lambda: depth[0])
+    registry.gauge("broken", "Falla", fn=lambda: 1 / 0)
+    depth[0] = 5
+    text = registry.render()
+    assert "queue_depth 5" in text
+    assert "broken" not in text  # una lectura que falla no rompe /metrics
+
+
+def test_registering_twice_returns_the_same_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("c_total", "C")
+    assert registry.counter("c_total", "C") is first
+    assert registry.render().count("# TYPE c_total") == 1
+
+
+def test_route_metrics_track_requests_in_flight():
+    registry = MetricsRegistry()
+    routes = RouteMetrics(registry)
+    started = routes.started()
+    assert "http_requests_in_flight 1" in registry.render()
+    routes.finished("/outbound/<message_id>", "GET", 404, started)
+    text = registry.render()
+    assert "http_requests_in_flight 0" in text
+    assert 'http_requests_total{route="/outbound/<message_id>",method="GET",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{route="/outbound/<message_id>"} 1' in text
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    app_module = pytest.importorskip("app")
+    client = app_module.app.test_client()
+    client.get("/history-stats")
+    response = client.get("/metrics")
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    body = response.get_data(as_text=True)
+    assert "# TYPE http_requests_total counter" in body
+    assert 'route="/history-stats"' in body
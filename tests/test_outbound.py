@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+import outbound
+from conftest import eventually
+from outbound import OutboundQueue, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(0.5)
+    clock[0] += 0.5
+    assert bucket.wait_time() == 0
+
+
+def test_token_bucket_refill_is_capped_at_the_burst(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    bucket.take()
+    clock[0] += 60
+    assert bucket.wait_time() == 0 and bucket.tokens == 2 and bucket.idle
+
+
+def unlimited(sender, runtime, **options):
+    settings = dict(workers=2, rate=1000, burst=1000, recipient_rate=1000, recipient_burst=1000)
+    settings.update(options)
+    return OutboundQueue(sender, runtime, **settings)
+
+
+def test_messages_to_one_recipient_keep_their_order(runtime):
+    sent = []
+
+    async def sender(recipient, message):
+        await asyncio.sleep(0.001)
+        sent.append((recipient, message))
+
+    queue = unlimited(sender, runtime, workers=4)
+    for i in range(10):
+        queue.submit("a", str(i))
+        queue.submit("b", str(i))
+    queue.start()
+    assert eventually(lambda: len(sent) == 20)
+    assert [m for r, m in sent if r == "a"] == [str(i) for i in range(10)]
+    assert queue.stats()["sent"] == 20 and queue.stats()["queue_depth"] == 0
+
+
+def test_send_waits_for_the_result_and_reports_failures(runtime):
+    async def sender(recipient, message):
+        if message == "mal":
+            raise RuntimeError("bridge caído")
+
+    queue = unlimited(sender, runtime)
+    ok = runtime.run(queue.send("a", "hola", timeout=2))
+    failed = runtime.run(queue.send("a", "mal", timeout=2))
+    assert ok["status"] == "sent" and queue.status(ok["id"])["status"] == "sent"
+    assert failed["status"] == "failed" and failed["error"] == "bridge caído"
+
+
+def test_send_timeout_returns_the_queued_state(runtime):
+    release = asyncio.Event()
+
+    async def sender(recipient, message):
+        await release.wait()
+
+    queue = unlimited(sender, runtime, workers=1)
+    delivery = runtime.run(queue.send("a", "hola", timeout=0.05))
+    assert delivery["status"] == "sending"
+    runtime.loop.call_soon_threadsafe(release.set)
+    assert eventually(lambda: queue.status(delivery["id"])["status"] == "sent")
+
+
+def test_send_after_status_eviction_is_not_a_rejection(runtime):
+    async def sender(recipient, message):
+        await asyncio.sleep(0.2)
+
+    queue = unlimited(sender, runtime, workers=1, history=1)
+
+    async def scenario():
+        waiting = asyncio.ensure_future(queue.send("a", "primero", timeout=0.05))
+        await asyncio.sleep(0.01)
+        queue.submit("b", "desplaza el estado del primero")
+        return await waiting
+
+    delivery = runtime.run(scenario())
+    assert delivery is not None and delivery["status"] == "unknown"
+
+
+def test_full_queue_rejects(runtime):
+    queue = unlimited(lambda r, m: asyncio.sleep(0), runtime, maxsize=1)
+    assert queue.submit("a", "1") is not None
+    assert queue.submit("b", "2") is None
+    assert runtime.run(queue.send("c", "3", timeout=0.1)) is None
+    assert queue.stats()["rejected"] == 2
+
+
+def test_throttled_recipient_does_not_block_others(runtime):
+    sent = []
+
+    async def sender(recipient, message):
+        sent.append(recipient)
+
+    queue = unlimited(sender, runtime, workers=1, recipient_rate=5, recipient_burst=1)
+    for _ in range(2):
+        queue.submit("lento", "x")
+    queue.submit("otro", "y")
+    queue.start()
+    assert eventually(lambda: len(sent) == 3)
+    assert sent.index("otro") < 2  # el segundo mensaje a "lento" esperó su ficha
+    assert queue.stats()["throttled"] >= 1
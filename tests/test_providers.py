@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from common.providers import Provider, ProviderPool, to_legacy_payload
+
+
+class FakeClients:
+    """ClientRegistry mínimo: un handler por backend que recibe (método, url, json)"""
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.calls = []
+
+    def __contains__(self, name):
+        return True
+
+    def async_client(self, name):
+        clients = self
+
+        class Client:
+            async def post(self, url, headers=None, json=None):
+                clients.calls.append((name, json))
+                return await clients.handlers[name](json)
+        return Client()
+
+
+def reply(content, status=200, delay=0.0):
+    async def handler(payload):
+        await asyncio.sleep(delay)
+        request = httpx.Request("POST", "http://llm/v1/chat/completions")
+        return httpx.Response(status, json={"choices": [{"message": {"role": "assistant", "content": content}}]},
+                              request=request)
+    return handler
+
+
+def pool(handlers, **options):
+    providers = [Provider(name, f"http://{name}/v1/chat/completions", "k", f"{name}-model") for name in handlers]
+    options.setdefault("hedge", False)
+    return ProviderPool(providers, FakeClients(handlers), **options)
+
+
+def chat(p, payload=None):
+    return asyncio.run(p.chat(payload or {"model": "x", "messages": [{"role": "user", "content": "hola"}]}))
+
+
+def test_primary_answers_with_its_own_model():
+    p = pool({"a": reply("A"), "b": reply("B")})
+    result = chat(p)
+    assert result["provider"] == "a" and result["choices"][0]["message"]["content"] == "A"
+    assert p._clients.calls[0][1]["model"] == "a-model"
+
+
+def test_server_errors_fail_over_to_the_next_backend():
+    p = pool({"a": reply("A", status=503), "b": reply("B")})
+    assert chat(p)["provider"] == "b"
+    assert p.stats()["failovers"] == 1 and p.stats()["backends"]["a"]["failures"] == 1
+
+
+def test_client_errors_are_not_retried_elsewhere():
+    p = pool({"a": reply("A", status=400), "b": reply("B")})
+    with pytest.raises(httpx.HTTPStatusError):
+        chat(p)
+    assert [name for name, _ in p._clients.calls] == ["a"]
+
+
+def test_backend_is_skipped_after_consecutive_failures():
+    p = pool({"a": reply("A", status=500), "b": reply("B")}, failure_threshold=2, cooldown=60)
+    chat(p)
+    chat(p)
+    calls_before = len(p._clients.calls)
+    assert chat(p)["provider"] == "b"
+    assert [name for name, _ in p._clients.calls[calls_before:]] == ["b"]
+    assert p.stats()["backends"]["a"]["healthy"] is False
+
+
+def test_slow_primary_is_hedged_and_the_fastest_answer_wins():
+    p = pool({"a": reply("A", delay=1.0), "b": reply("B")}, hedge=True, hedge_after=0.05)
+    result = chat(p)
+    assert result["provider"] == "b"
+    assert p.stats()["hedges"] == 1 and p.stats()["hedge_wins"] == 1
+
+
+def test_primary_that_loses_the_hedge_still_counts_its_latency():
+    """Si no, el p95 solo vería respuestas por debajo del umbral y la cobertura se dispararía cada vez antes"""
+    p = pool({"a": reply("A", delay=1.0), "b": reply("B")}, hedge=True, hedge_after=0.05, min_samples=3)
+    for _ in range(3):
+        chat(p)
+    latencies = p._stats["a"].latencies
+    assert len(latencies) == 3 and min(latencies) >= 0.05
+    assert p._hedge_delay(p.providers[0]) >= 0.05
+
+
+def test_all_backends_failing_raises_the_last_error():
+    p = pool({"a": reply("A", status=500), "b": reply("B", status=502)})
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        chat(p)
+    assert error.value.response.status_code == 502
+
+
+def test_legacy_backend_gets_functions_and_answers_with_tool_calls():
+    async def legacy(payload):
+        assert "functions" in payload and "tools" not in payload
+        message = {"role": "assistant", "content": None, "function_call": {"name": "sumar", "arguments": "{}"}}
+        return httpx.Response(200, json={"choices": [{"message": message}]},
+                              request=httpx.Request("POST", "http://legacy"))
+
+    provider = Provider("legacy", "http://legacy/v1/chat/completions", "k", "m", schema="functions")
+    p = ProviderPool([provider], FakeClients({"legacy": legacy}), hedge=False)
+    tools = [{"type": "function", "function": {"name": "sumar", "parameters": {}}}]
+    result = chat(p, {"messages": [{"role": "user", "content": "suma"}], "tools": tools, "tool_choice": "auto"})
+    assert result["choices"][0]["message"]["tool_calls"][0]["function"]["name"] == "sumar"
+
+
+def test_legacy_payload_pairs_tool_results_with_their_calls():
+    call = {"id": "c1", "type": "function", "function": {"name": "sumar", "arguments": json.dumps({"a": 1})}}
+    body = to_legacy_payload({"messages": [
+        {"role": "assistant", "content": None, "tool_calls": [call]},
+        {"role": "tool", "tool_call_id": "c1", "content": "2"},
+    ]})
+    assert body["messages"] == [
+        {"role": "assistant", "content": None, "function_call": call["function"]},
+        {"role": "function", "name": "sumar", "content": "2"},
+    ]
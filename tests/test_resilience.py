@@ -0,0 +1,125 @@
+import httpx
+import pytest
+
+from common import resilience
+from common.resilience import CircuitBreaker, CircuitOpenError, ResilientTransport, RetryPolicy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=2, cooldown=10)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    assert breaker.snapshot()["rejected"] == 1 and breaker.snapshot()["times_opened"] == 1
+
+
+def test_half_open_lets_a_single_probe_through(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, cooldown=10)
+    breaker.record(False)
+    clock[0] += 10
+    breaker.before_request()  # la petición de prueba
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()  # las demás esperan su resultado
+    breaker.record(True)
+    assert breaker.closed
+    breaker.before_request()
+
+
+def test_failed_probe_reopens_for_another_cooldown(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, cooldown=10)
+    breaker.record(False)
+    clock[0] += 10
+    breaker.before_request()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 5
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_neutral_outcome_releases_the_probe(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, cooldown=10)
+    breaker.record(False)
+    clock[0] += 10
+    breaker.before_request()
+    breaker.record(None)  # p. ej. 429: no dice nada del servicio
+    breaker.before_request()  # se puede volver a probar
+
+
+def request(method="GET"):
+    return httpx.Request(method, "http://svc/x")
+
+
+def response(status, **headers):
+    return httpx.Response(status, headers=headers)
+
+
+def test_retry_policy_by_status_and_method():
+    policy = RetryPolicy(max_retries=2, backoff=0.1)
+    assert policy.wait_for_response(request(), response(503), 0) is not None
+    assert policy.wait_for_response(request("POST"), response(503), 0) is None
+    assert RetryPolicy(retry_post=True).wait_for_response(request("POST"), response(503), 0) is not None
+    assert policy.wait_for_response(request(), response(500), 0) is None
+    assert policy.wait_for_response(request(), response(503), 2) is None  # sin más intentos
+
+
+def test_retry_after_is_honored_up_to_the_limit():
+    policy = RetryPolicy(max_retry_after=5)
+    assert policy.wait_for_response(request("POST"), response(429, **{"Retry-After": "3"}), 0) == 3.0
+    assert policy.wait_for_response(request("POST"), response(429, **{"Retry-After": "60"}), 0) is None
+
+
+def test_connection_errors_are_retried_even_for_post():
+    policy = RetryPolicy()
+    assert policy.wait_for_error(request("POST"), httpx.ConnectError("x"), 0) is not None
+    assert policy.wait_for_error(request("POST"), httpx.ReadError("x"), 0) is None
+    assert policy.wait_for_error(request(), httpx.ReadError("x"), 0) is not None
+    assert policy.wait_for_error(request(), httpx.ReadTimeout("x"), 0) is None
+
+
+class Scripted(httpx.BaseTransport):
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def handle_request(self, request):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, request=request)
+
+
+def transport(inner, failure_threshold=5, **policy):
+    retries = []
+    wrapped = ResilientTransport(inner, RetryPolicy(backoff=0, **policy),
+                                 CircuitBreaker("svc", failure_threshold=failure_threshold),
+                                 on_retry=lambda: retries.append(1))
+    return wrapped, retries
+
+
+def test_transport_retries_until_success():
+    inner = Scripted(httpx.ConnectError("x"), 503, 200)
+    wrapped, retries = transport(inner)
+    assert httpx.Client(transport=wrapped).get("http://svc/").status_code == 200
+    assert inner.calls == 3 and len(retries) == 2
+
+
+def test_transport_stops_retrying_when_the_circuit_opens():
+    inner = Scripted(503, 503, 200)
+    wrapped, _ = transport(inner, failure_threshold=1)
+    assert httpx.Client(transport=wrapped).get("http://svc/").status_code == 503
+    assert inner.calls == 1
+    with pytest.raises(CircuitOpenError):
+        httpx.Client(transport=wrapped).get("http://svc/")
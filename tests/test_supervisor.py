@@ -0,0 +1,79 @@
+import asyncio
+import sys
+
+from conftest import eventually
+from supervisor import ProcessSupervisor
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+async def always_ready():
+    return True
+
+
+async def never_ready():
+    return False
+
+
+def test_long_output_lines_do_not_stop_the_drain(runtime):
+    code = ("import sys, time; sys.stdout.write('x' * 200000 + '\\n'); print('fin', flush=True); "
+            "sys.stderr.write('y' * 100000); sys.stderr.flush(); time.sleep(30)")
+    supervisor = ProcessSupervisor(python(code), always_ready, restart=False)
+    assert runtime.run(supervisor.start())["status"] == "success"
+    assert eventually(lambda: len(supervisor.logs(stream="stdout")) == 2)
+    first, last = supervisor.logs(stream="stdout")
+    assert first["line"] == "x" * ProcessSupervisor.MAX_LINE
+    assert last["line"] == "fin"
+    runtime.run(supervisor.stop())
+    # La línea sin salto de stderr se guarda (recortada) al cerrarse el pipe
+    assert eventually(lambda: supervisor.logs(stream="stderr"))
+    assert supervisor.logs(stream="stderr")[0]["line"] == "y" * ProcessSupervisor.MAX_LINE
+
+
+def test_process_that_never_gets_ready_is_stopped(runtime):
+    supervisor = ProcessSupervisor(python("import time; time.sleep(30)"), never_ready, start_timeout=0.2)
+    result = runtime.run(supervisor.start())
+    assert result["status"] == "error" and not supervisor.running
+
+
+def test_crashed_process_is_restarted(runtime):
+    supervisor = ProcessSupervisor(python("print('hola', flush=True)"), always_ready)
+    runtime.run(supervisor.start())
+    assert eventually(lambda: len(supervisor.logs()) >= 2, timeout=5)
+    runtime.run(supervisor.stop())
+    assert supervisor.stats()["restarts"] >= 1
+    assert {entry["line"] for entry in supervisor.logs()} == {"hola"}
+
+
+def test_stop_waits_for_a_start_in_progress(runtime):
+    supervisor = ProcessSupervisor(python("import time; time.sleep(30)"), always_ready, restart=False)
+
+    async def start_and_stop():
+        return await asyncio.gather(supervisor.start(), supervisor.stop())
+
+    started, stopped = runtime.run(start_and_stop())
+    assert started["status"] == "success" and stopped["status"] == "success"
+    assert stopped["pid"] == started["pid"] and not supervisor.running
+    assert runtime.run(supervisor.stop())["status"] == "error"
+
+
+def test_restart_keeps_trying_after_a_spawn_error(runtime):
+    supervisor = ProcessSupervisor(python("print('hola', flush=True)"), always_ready)
+    runtime.run(supervisor.start())
+    command = supervisor.command
+    supervisor.command = ["/no/existe/servidor-mcp"]  # el primer reinicio lanza FileNotFoundError
+    assert eventually(lambda: supervisor.stats()["restarts"] == 1, timeout=3)
+    supervisor.command = command
+    assert eventually(lambda: len(supervisor.logs()) >= 2, timeout=5)
+    runtime.run(supervisor.stop())
+
+
+def test_stop_during_the_restart_delay_cancels_the_restart(runtime):
+    supervisor = ProcessSupervisor(python("pass"), always_ready)
+    runtime.run(supervisor.start())
+    assert eventually(lambda: supervisor.stats()["last_exit_code"] == 0)
+    runtime.run(supervisor.stop())
+    assert eventually(supervisor._watcher.done, timeout=3)
+    assert supervisor.stats()["restarts"] == 0 and not supervisor.running
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from common.tools import render_results, run_tool_calls, tool_messages
+
+
+def call(name, args, call_id=None):
+    return {"id": call_id or name, "type": "function",
+            "function": {"name": name, "arguments": args if isinstance(args, str) else json.dumps(args)}}
+
+
+def test_calls_run_concurrently_and_keep_their_order():
+    async def execute(name, args):
+        await asyncio.sleep(args["delay"])
+        return {"name": name}
+
+    started = time.perf_counter()
+    records = asyncio.run(run_tool_calls(
+        [call("lenta", {"delay": 0.2}), call("rapida", {"delay": 0.05}), call("media", {"delay": 0.1})],
+        execute
+    ))
+    assert time.perf_counter() - started < 0.3
+    assert [r["name"] for r in records] == ["lenta", "rapida", "media"]
+    assert all(r["error"] is None for r in records)
+
+
+def test_timeout_and_errors_do_not_cancel_the_others():
+    async def execute(name, args):
+        if name == "colgada":
+            await asyncio.sleep(5)
+        if name == "rota":
+            raise RuntimeError("falló")
+        return {"ok": True}
+
+    records = asyncio.run(run_tool_calls(
+        [call("colgada", {}), call("rota", {}), call("buena", {}), call("mal", "{no es json")],
+        execute, timeout=0.1
+    ))
+    by_name = {r["name"]: r for r in records}
+    assert by_name["colgada"]["error"] == "timeout" and "0.1" in by_name["colgada"]["output"]["error"]
+    assert by_name["rota"]["error"] == "falló" and by_name["rota"]["output"] == {"error": "falló"}
+    assert by_name["buena"]["output"] == {"ok": True} and by_name["buena"]["error"] is None
+    assert by_name["mal"]["error"] == "invalid_arguments" and by_name["mal"]["arguments"] == {}
+
+
+def test_empty_arguments_are_an_empty_dict():
+    async def execute(name, args):
+        return args
+
+    records = asyncio.run(run_tool_calls([call("f", "")], execute))
+    assert records[0]["arguments"] == {} and records[0]["output"] == {}
+
+
+def test_tool_messages_pair_each_result_with_its_call():
+    calls = [call("a", {}, "c1"), call("b", {}, "c2")]
+    records = [{"id": "c1", "output": {"x": "ñ"}}, {"id": "c2", "output": [1]}]
+    messages = tool_messages({"content": None, "tool_calls": calls}, records)
+    assert messages[0] == {"role": "assistant", "content": None, "tool_calls": calls}
+    assert [(m["tool_call_id"], m["content"]) for m in messages[1:]] == [("c1", '{"x": "ñ"}'), ("c2", "[1]")]
+
+
+# -------------------------
+# render_results
+# -------------------------
+RENDERERS = {
+    "sumar": lambda args, output: f"{args['a']} + {args['b']} = {output['resultado']}",
+    "buscar_repos": None,
+}
+
+
+def record(name, arguments, output, error=None):
+    return {"name": name, "arguments": arguments, "output": output, "error": error}
+
+
+def test_render_joins_every_result_of_the_turn():
+    records = [record("sumar", {"a": 1, "b": 2}, {"resultado": 3}), record("sumar", {"a": 2, "b": 2}, {"resultado": 4})]
+    assert render_results(records, RENDERERS) == "1 + 2 = 3\n2 + 2 = 4"
+
+
+@pytest.mark.parametrize("records", [
+    [record("buscar_repos", {"query": "x"}, [])],                        # marcada para el modelo
+    [record("desconocida", {}, {})],                                      # sin renderer
+    [record("sumar", {"a": 1, "b": 2}, {"error": "x"}, error="timeout")],  # falló
+    [record("sumar", {"a": 1, "b": 2}, {"otro": 3})],                      # forma inesperada
+    [record("sumar", {"a": 1, "b": 2}, {"resultado": 3}), record("buscar_repos", {"query": "x"}, [])],
+])
+def test_render_falls_back_to_the_model(records):
+    assert render_results(records, RENDERERS) is None
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from common.metrics import MetricsRegistry
+from common.tracing import PROFILE_HEADER, TRACE_HEADER, RequestTracer, record, span
+
+
+def traced(tracer=None, headers=None):
+    tracer = tracer or RequestTracer(enabled=True)
+    return tracer, tracer.start(headers if headers is not None else {TRACE_HEADER: "1"}, "/prueba")
+
+
+def test_tracing_is_off_unless_enabled_and_requested():
+    assert RequestTracer(enabled=False).start({TRACE_HEADER: "1"}) is None
+    assert RequestTracer(enabled=True).start({}) is None
+
+
+def test_spans_without_a_trace_only_feed_the_histogram():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "Etapas", ("stage",))
+    with span("llm"):
+        pass
+    with span("llm", histogram):
+        pass
+    assert 'stage_seconds_count{stage="llm"} 1' in registry.render()
+
+
+def test_nested_spans_record_their_parent_and_errors():
+    tracer, trace = traced()
+    with span("llm"):
+        with span("upstream.openai", host="api"):
+            time.sleep(0.01)
+        record("contacts.load", 0.002)
+    with pytest.raises(ValueError):
+        with span("tools"):
+            raise ValueError
+    headers = {}
+    timeline = tracer.finish(trace, headers)
+
+    spans = {s["name"]: s for s in timeline["spans"]}
+    assert spans["llm"]["parent"] is None
+    assert spans["upstream.openai"]["parent"] == spans["contacts.load"]["parent"] == spans["llm"]["id"]
+    assert spans["upstream.openai"]["attrs"] == {"host": "api"}
+    assert spans["upstream.openai"]["duration_ms"] >= 10
+    assert spans["tools"]["error"] == "ValueError" and spans["tools"]["parent"] is None
+    assert headers["X-Trace-Id"] == trace.id
+    assert headers["Server-Timing"].startswith("llm;dur=") and "total;dur=" in headers["Server-Timing"]
+    # Tras finish() la petición ya no se traza
+    with span("history"):
+        pass
+    assert "history" not in {s["name"] for s in trace.spans}
+
+
+def test_profiles_are_kept_up_to_max_profiles():
+    tracer = RequestTracer(enabled=False, profiling=True, interval=0.001, max_profiles=2)
+    ids = []
+    for _ in range(3):
+        _, trace = traced(tracer, {PROFILE_HEADER: "1"})
+        time.sleep(0.01)
+        timeline = tracer.finish(trace, {})
+        ids.append(trace.id)
+        assert timeline["profile_url"] == f"/debug/profiles/{trace.id}"
+    assert tracer.profile(ids[0]) is None
+    assert tracer.profile(ids[2])["samples"] > 0
+    assert [p["id"] for p in tracer.profiles()] == [ids[2], ids[1]]
+    assert "folded" not in tracer.profiles()[0]
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_trace_header_only_answers_when_tracing_is_enabled(monkeypatch, enabled):
+    app_module = pytest.importorskip("app")
+    monkeypatch.setattr(app_module.request_tracer, "enabled", enabled)
+    response = app_module.app.test_client().get("/history-stats", headers={TRACE_HEADER: "1"})
+    assert ("Server-Timing" in response.headers) is enabled
+    assert ("trace" in response.get_json()) is enabled